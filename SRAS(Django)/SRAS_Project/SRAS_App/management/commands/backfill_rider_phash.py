@@ -0,0 +1,146 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+import os
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from SRAS_App.models import Violation
+
+
+# Per-process state, filled in by init_worker()
+_detector = None
+_helmet_model = None
+
+
+def init_worker(detector_path, helmet_path, backend):
+    """Load both YOLO models once per worker process."""
+    global _detector, _helmet_model
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SRAS_Project.settings')
+    django.setup()  # no-op when the worker was forked from an initialised parent
+    from streaming.backends import load_backend
+    from streaming.detection import RIDER_CROP_SIZE
+    _detector = load_backend(backend, detector_path, threads=1)
+    _helmet_model = load_backend(backend, helmet_path, imgsz=RIDER_CROP_SIZE, threads=1)
+
+
+def rider_crop_from_snapshot(image):
+    """
+    Stored violations only keep the full annotated frame, so re-run rider
+    detection to recover the crop the live pipeline hashed. When several riders
+    are present, prefer the one the helmet model flags as "no helmet".
+
+    The crop still has the live overlay (boxes, labels) drawn on it, so its
+    hash is several bits away from a live hash of the same rider: backfilled
+    hashes only catch near-identical repeats, not every duplicate.
+    """
+    from streaming.detection import detect_riders, run_second_stage, KIND_NO_HELMET
+
+    riders = detect_riders(_detector, image)
+    crops = [image[y1:y2, x1:x2] for x1, y1, x2, y2 in riders]
+    crops = [c for c in crops if c.size > 0]
+    if not crops:
+        return None
+    if len(crops) == 1:
+        return crops[0]
+    for crop, detections in zip(crops, run_second_stage(_helmet_model, crops)):
+        if any(d.kind == KIND_NO_HELMET for d in detections):
+            return crop
+    return max(crops, key=lambda c: c.shape[0] * c.shape[1])
+
+
+def hash_chunk(ids):
+    """Worker: compute perceptual hashes for one chunk of violation ids."""
+    from streaming.dedup import create_rider_phash, phash_to_hex
+
+    results = []
+    for pk, image in Violation.objects.filter(pk__in=ids).values_list('id', 'image'):
+        if not image:
+            continue
+        frame = cv2.imdecode(np.frombuffer(bytes(image), dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            continue
+        crop = rider_crop_from_snapshot(frame)
+        if crop is None:
+            continue
+        results.append((pk, phash_to_hex(create_rider_phash(crop))))
+    return len(ids), results
+
+
+class Command(BaseCommand):
+    help = ('Compute rider_phash (perceptual hash) for recent violations saved without one, in parallel chunks. '
+            'Only violations inside the duplicate window (--max-age, default TIME_WINDOW) are hashed: the '
+            'stream engine loads no older hashes. Stored snapshots are annotated, so these hashes are less '
+            'exact than live ones and catch only close repeats of the same rider.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                            help='Number of worker processes')
+        parser.add_argument('--chunk-size', type=int, default=200,
+                            help='Violations handed to a worker at a time')
+        parser.add_argument('--max-age', type=float, default=None,
+                            help='Only hash violations from the last this many seconds '
+                                 '(default: TIME_WINDOW in stream_mjpeg.py, the window the engine warms from)')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Only process this many violations (newest first)')
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute hashes that are already set')
+        parser.add_argument('--detector', default=os.path.join(settings.BASE_DIR, 'yolov8n.pt'),
+                            help='Person/motorcycle model used to locate the rider')
+        parser.add_argument('--helmet-model', default=os.path.join(settings.BASE_DIR, 'customyolov8n.pt'),
+                            help='Helmet/plate model used to pick the violating rider')
+        parser.add_argument('--backend', default='pytorch', choices=['pytorch', 'onnx', 'openvino'],
+                            help='Inference backend (exported models must exist next to the .pt files)')
+
+    def handle(self, *args, **options):
+        max_age = options['max_age']
+        if max_age is None:
+            import stream_mjpeg
+            max_age = stream_mjpeg.TIME_WINDOW
+        qs = Violation.objects.all() if options['all'] else Violation.objects.filter(rider_phash__isnull=True)
+        # older hashes are never loaded by dedup.warm_from_db(), so computing them buys nothing
+        qs = qs.filter(timestamp__gte=timezone.now() - timedelta(seconds=max_age))
+        ids = list(qs.order_by('-timestamp').values_list('id', flat=True)[:options['limit']])
+        if not ids:
+            self.stdout.write(self.style.SUCCESS('Nothing to backfill'))
+            return
+
+        chunk_size = max(1, options['chunk_size'])
+        chunks = [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+        self.stdout.write(f"Backfilling {len(ids)} violation(s) in {len(chunks)} chunk(s) "
+                          f"with {options['workers']} worker(s)...")
+
+        # forked workers must not share the parent's DB connection
+        connections.close_all()
+
+        processed = hashed = 0
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            initializer=init_worker,
+            initargs=(options['detector'], options['helmet_model'], options['backend']),
+        ) as pool:
+            futures = [pool.submit(hash_chunk, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                try:
+                    count, results = future.result()
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f"Chunk failed: {e}"))
+                    continue
+                if results:
+                    Violation.objects.bulk_update(
+                        [Violation(id=pk, rider_phash=value) for pk, value in results],
+                        ['rider_phash'],
+                    )
+                processed += count
+                hashed += len(results)
+                self.stdout.write(f"  {processed}/{len(ids)} processed, {hashed} hashed")
+
+        skipped = processed - hashed
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {hashed} violation(s)"))
+        if skipped:
+            self.stdout.write(self.style.WARNING(f"{skipped} violation(s) had no detectable rider and were left empty"))
@@ -0,0 +1,79 @@
+import os
+import time
+
+import cv2
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from streaming.backends import BACKENDS, PRECISIONS, FP32, load_backend, rect_imgsz
+from streaming.detection import DETECTION_RESIZE, RIDER_CROP_SIZE
+from streaming.evaluation import compare_outputs, latency_summary, sample_violation_frames, timed_runs
+
+
+def load_frames(video=None, limit=50):
+    """Frames from a video file, or else a sample of stored violation snapshots."""
+    if not video:
+        return [frame for _, _, frame in sample_violation_frames(limit)]
+    frames = []
+    cap = cv2.VideoCapture(video)
+    while len(frames) < limit:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+class Command(BaseCommand):
+    help = 'Compare inference backends (latency, FPS and agreement) on the same frames'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS),
+                            help='Backends to compare; the first one is the reference for agreement')
+        parser.add_argument('--video', default=None,
+                            help='Video file to take frames from (default: stored violation images)')
+        parser.add_argument('--frames', type=int, default=50, help='Number of frames to benchmark')
+        parser.add_argument('--threads', type=int, default=None, help='Inference threads per backend')
+        parser.add_argument('--precision', choices=PRECISIONS, default=FP32,
+                            help='Model precision (int8 needs `manage.py quantize_models` first)')
+        parser.add_argument('--detector', default=os.path.join(settings.BASE_DIR, 'yolov8n.pt'))
+        parser.add_argument('--helmet-model', default=os.path.join(settings.BASE_DIR, 'customyolov8n.pt'))
+
+    def handle(self, *args, **options):
+        frames = load_frames(options['video'], options['frames'])
+        if not frames:
+            raise CommandError('No frames to benchmark (pass --video or store some violations first)')
+        self.stdout.write(f"Benchmarking on {len(frames)} frame(s)")
+
+        reference = None
+        for kind in options['backends']:
+            try:
+                started = time.perf_counter()
+                detector = load_backend(kind, options['detector'], imgsz=rect_imgsz(*DETECTION_RESIZE),
+                                        threads=options['threads'], precision=options['precision'])
+                helmet_model = load_backend(kind, options['helmet_model'], imgsz=RIDER_CROP_SIZE,
+                                            threads=options['threads'], precision=options['precision'])
+                load_time = time.perf_counter() - started
+                warmup_time = detector.warmup() + helmet_model.warmup()
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"{kind}: could not load ({e})"))
+                continue
+
+            outputs, latencies = timed_runs(detector, helmet_model, frames)
+            stats = latency_summary(latencies)
+
+            self.stdout.write(self.style.SUCCESS(f"{kind}:"))
+            self.stdout.write(f"  load {load_time:.2f}s, warm-up {warmup_time:.2f}s")
+            self.stdout.write(
+                f"  latency mean {stats['mean_ms']:.1f}ms  p50 {stats['p50_ms']:.1f}ms  "
+                f"p95 {stats['p95_ms']:.1f}ms  ({stats['fps']} FPS)"
+            )
+            if reference is None:
+                reference = (kind, outputs)
+                continue
+            score = compare_outputs(reference[1], outputs)
+            self.stdout.write(
+                f"  vs {reference[0]}: {score['matched_riders']}/{score['reference_riders']} riders matched, "
+                f"verdict agreement {score['verdict_agreement']}, class agreement {score['class_agreement']}"
+            )
@@ -0,0 +1,263 @@
+import ast
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from streaming.backends import stub_loader
+from streaming.dedup import create_rider_hash
+from streaming.detection import greedy_assignment, iou, iou_matrix, pair_riders
+from streaming.engine import CameraStream, StreamEngine
+from streaming.sources import OpenCVSource, StubSource, read_when_due
+from streaming.writer import MemoryWriter
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def parse_overrides(items):
+    """['MOTION_GATE=False', 'SKIP_INFERENCE=2'] -> {'MOTION_GATE': False, 'SKIP_INFERENCE': 2}"""
+    overrides = {}
+    for item in items:
+        name, sep, value = item.partition('=')
+        if not sep:
+            raise CommandError(f"--set expects NAME=VALUE, got '{item}'")
+        try:
+            overrides[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            overrides[name] = value
+    return overrides
+
+
+class Replay:
+    """
+    One camera's pipeline driven synchronously, frame by frame, in video time:
+    capture -> display overlay -> detection/pairing -> tracking -> second
+    stage -> dedup -> evidence encode, then the stream JPEG encode. Every run
+    over the same input sees the same frames and timestamps.
+    """
+
+    def __init__(self, config, open_source, model_loader, fps):
+        self.open_source = open_source
+        self.fps = fps
+        camera = SimpleNamespace(id=1, name='Benchmark', stream_url='', roi_polygon=None)
+        self.writer = MemoryWriter()
+        self.engine = StreamEngine(config, cameras=[camera], model_loader=model_loader, writer=self.writer,
+                                   warm_hashes=False, clock=None)
+        self.stream = CameraStream(camera, config, self.engine.timer)
+        self.engine.request_models(self.stream.precision)
+        if not self.engine.wait_ready() or self.engine.models_for(self.stream) is None:
+            raise CommandError('Could not load the models (use --stub to benchmark without YOLO weights)')
+        self.source = open_source()
+        self.index = 0
+
+    def step(self):
+        timer = self.engine.timer
+        with timer.stage('frame'):
+            ok, frame = read_when_due(self.source, 0.0, 0.0, timer)
+            if not ok:
+                # end of the clip: start it again
+                self.source.release()
+                self.source = self.open_source()
+                ok, frame = read_when_due(self.source, 0.0, 0.0, timer)
+                if not ok:
+                    raise CommandError('The source returned no frames')
+            captured_at = self.index / self.fps
+            self.index += 1
+            self.engine.queue_frame(self.stream, frame, captured_at)
+            frame, captured_at = self.stream.frame_queue.get_nowait()
+            with timer.stage('process_frame'):
+                self.engine.process_frame(self.stream, frame, captured_at)
+            self.stream.broadcaster.latest()
+
+    def close(self):
+        self.source.release()
+        self.engine.shutdown()
+
+
+def micro_benchmarks(repeat=5):
+    """Best-of-`repeat` time per call (microseconds) of the small hot-path helpers, on fixed inputs."""
+    rng = np.random.default_rng(0)
+
+    def boxes(n):
+        xy = rng.uniform(0, 1200, (n, 2))
+        wh = rng.uniform(40, 300, (n, 2))
+        return np.hstack([xy, xy + wh]).astype(np.float32)
+
+    a, b = boxes(1)[0].tolist(), boxes(1)[0].tolist()
+    persons, motorcycles = boxes(8), boxes(8)
+    xyxy = np.vstack([persons, motorcycles])
+    cls = np.array([0] * 8 + [3] * 8)
+    scores = iou_matrix(persons, motorcycles)
+    crop = rng.integers(0, 255, (240, 120, 3), dtype=np.uint8)
+
+    cases = {
+        'iou': lambda: iou(a, b),
+        'iou_matrix_8x8': lambda: iou_matrix(persons, motorcycles),
+        'greedy_assignment_8x8': lambda: greedy_assignment(scores, 0.1),
+        'pair_riders_8+8': lambda: pair_riders(xyxy, cls, [0], [3]),
+        'create_rider_hash': lambda: create_rider_hash(crop, 'AB1234'),
+    }
+    out = {}
+    for name, fn in cases.items():
+        timer = timeit.Timer(fn)
+        number, _ = timer.autorange()
+        best = min(timer.repeat(repeat=repeat, number=number)) / number
+        out[name] = {'us_per_call': round(best * 1e6, 3), 'calls': number}
+    return out
+
+
+def compare(current, baseline):
+    """Lines describing how `current` moved against a previous report."""
+    def pct(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else 'n/a'
+
+    lines = []
+    old, new = baseline.get('pipeline', {}), current.get('pipeline', {})
+    if old.get('fps') and new.get('fps'):
+        lines.append(f"fps {old['fps']} -> {new['fps']} ({pct(new['fps'], old['fps'])})")
+    for stage, stats in new.get('stages', {}).items():
+        before = old.get('stages', {}).get(stage)
+        if before:
+            lines.append(f"{stage} p50 {before['p50_ms']} -> {stats['p50_ms']} ms ({pct(stats['p50_ms'], before['p50_ms'])}), "
+                         f"p99 {before['p99_ms']} -> {stats['p99_ms']} ms")
+    for name, stats in current.get('micro', {}).items():
+        before = baseline.get('micro', {}).get(name)
+        if before:
+            lines.append(f"{name} {before['us_per_call']} -> {stats['us_per_call']} us "
+                         f"({pct(stats['us_per_call'], before['us_per_call'])})")
+    return lines
+
+
+class Command(BaseCommand):
+    help = ('Replay a clip or synthetic frames through the stream pipeline and report per-stage latency '
+            'percentiles, FPS, allocations and peak RSS as JSON, plus hot-path micro-benchmarks')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--video', default=None, help='Clip to replay (default: synthetic frames)')
+        parser.add_argument('--frames', type=int, default=600, help='Frames to time')
+        parser.add_argument('--warmup', type=int, default=30, help='Frames run before timing starts')
+        parser.add_argument('--alloc-frames', type=int, default=100,
+                            help='Frames run again under tracemalloc for the allocation report (0 = skip)')
+        parser.add_argument('--size', default='1280x720', help='Synthetic frame size, WxH')
+        parser.add_argument('--stub', action='store_true',
+                            help='Stub models: measures the pipeline overhead without inference')
+        parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                            help='Override a stream_mjpeg.py setting, e.g. --set MOTION_GATE=False')
+        parser.add_argument('--skip-micro', action='store_true', help='Skip the micro-benchmarks')
+        parser.add_argument('--output', default=None, help='Write the JSON report here (default: stdout)')
+        parser.add_argument('--compare', default=None, help='Previous JSON report to compare against')
+
+    def handle(self, *args, **options):
+        import stream_mjpeg
+
+        try:
+            config = stream_mjpeg.settings(INFERENCE_SERVER=False, **parse_overrides(options['set']))
+        except TypeError as e:
+            raise CommandError(str(e))
+        model_loader = stub_loader if options['stub'] else None
+
+        if options['video']:
+            cap = cv2.VideoCapture(options['video'])
+            if not cap.isOpened():
+                raise CommandError(f"Cannot open {options['video']}")
+            fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+            cap.release()
+            open_source = lambda: OpenCVSource(options['video'])  # noqa: E731
+        else:
+            w, _, h = options['size'].partition('x')
+            size = (int(w), int(h))
+            fps = float(config.TARGET_FPS)
+            open_source = lambda: StubSource(size=size, realtime=False)  # noqa: E731
+
+        replay = Replay(config, open_source, model_loader, fps)
+        try:
+            for _ in range(options['warmup']):
+                replay.step()
+            replay.engine.timer.reset()
+            started = time.perf_counter()
+            for _ in range(options['frames']):
+                replay.step()
+            elapsed = time.perf_counter() - started
+            stages = replay.engine.stage_report()
+
+            allocations = None
+            if options['alloc_frames']:
+                tracemalloc.start()
+                before = tracemalloc.take_snapshot()
+                base, _ = tracemalloc.get_traced_memory()
+                for _ in range(options['alloc_frames']):
+                    replay.step()
+                current, peak = tracemalloc.get_traced_memory()
+                diff = tracemalloc.take_snapshot().compare_to(before, 'lineno')
+                tracemalloc.stop()
+                allocations = {
+                    'frames': options['alloc_frames'],
+                    'peak_kb': round((peak - base) / 1024, 1),
+                    'retained_kb': round((current - base) / 1024, 1),
+                    'retained_blocks': sum(d.count_diff for d in diff),
+                    'top_retained': [
+                        {'where': str(d.traceback[0]), 'kb': round(d.size_diff / 1024, 1), 'blocks': d.count_diff}
+                        for d in diff[:5] if d.size_diff > 0
+                    ],
+                }
+            violations = len(replay.writer.records)
+        finally:
+            replay.close()
+
+        report = {
+            'meta': {
+                'revision': git_revision(),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'opencv': cv2.__version__,
+                'machine': platform.machine(),
+                'cpus': os.cpu_count(),
+                'source': options['video'] or f"synthetic {options['size']}",
+                'models': 'stub' if options['stub'] else config.INFERENCE_BACKEND,
+                'overrides': parse_overrides(options['set']),
+            },
+            'pipeline': {
+                'frames': options['frames'],
+                'seconds': round(elapsed, 3),
+                'fps': round(options['frames'] / elapsed, 1) if elapsed else None,
+                'violations': violations,
+                'stages': stages,
+                'allocations': allocations,
+                # ru_maxrss is KiB on Linux, bytes on macOS
+                'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                                     / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1),
+            },
+            'micro': {} if options['skip_micro'] else micro_benchmarks(),
+        }
+
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(text)
+            self.stderr.write(f"Report written to {options['output']} ({report['pipeline']['fps']} FPS)")
+        else:
+            self.stdout.write(text)
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            self.stderr.write(f"Against {options['compare']} (revision {baseline.get('meta', {}).get('revision')}):")
+            for line in compare(report, baseline):
+                self.stderr.write(f"  {line}")
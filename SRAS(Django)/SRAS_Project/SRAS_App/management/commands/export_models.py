@@ -0,0 +1,38 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from streaming.backends import ONNX, OPENVINO, export_model, rect_imgsz
+from streaming.detection import DETECTION_RESIZE, RIDER_CROP_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Export the detector and helmet/plate models to ONNX and/or OpenVINO for CPU inference'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=[ONNX, OPENVINO, 'all'], default='all',
+                            help='Which exported format(s) to build')
+        parser.add_argument('--detector', default=os.path.join(settings.BASE_DIR, 'yolov8n.pt'),
+                            help='Person/motorcycle model')
+        parser.add_argument('--helmet-model', default=os.path.join(settings.BASE_DIR, 'customyolov8n.pt'),
+                            help='Helmet/plate model')
+
+    def handle(self, *args, **options):
+        formats = [ONNX, OPENVINO] if options['format'] == 'all' else [options['format']]
+        # The detector always sees one DETECTION_RESIZE frame, so give it a fixed
+        # rectangular input. Rider crops are batched, so the helmet model gets a
+        # dynamic batch axis at the square crop size.
+        jobs = [
+            (options['detector'], rect_imgsz(*DETECTION_RESIZE), False),
+            (options['helmet_model'], RIDER_CROP_SIZE, True),
+        ]
+        for fmt in formats:
+            for weights, imgsz, dynamic in jobs:
+                self.stdout.write(f"Exporting {os.path.basename(weights)} to {fmt} (imgsz={imgsz}, dynamic={dynamic})...")
+                try:
+                    path = export_model(weights, fmt, imgsz, dynamic=dynamic)
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f"  Failed: {e}"))
+                    continue
+                self.stdout.write(self.style.SUCCESS(f"  Wrote {path}"))
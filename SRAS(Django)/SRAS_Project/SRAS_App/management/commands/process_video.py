@@ -0,0 +1,302 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import partial
+import os
+import threading
+import time
+
+import cv2
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from SRAS_App.models import Camera, Violation
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.ts', '.m4v', '.h264', '.265', '.hevc')
+
+# Frames [start, stop) of one file. Processing starts `warmup` frames earlier so
+# tracks and k-of-n votes are established, but only violations from [start, stop) count.
+# recorded_at is the wall-clock time of the file's first frame.
+VideoChunk = namedtuple('VideoChunk', ['path', 'start', 'stop', 'warmup', 'fps', 'recorded_at'])
+
+
+# Per-process state, filled in by init_worker()
+_config = None
+_models = {}
+_models_lock = threading.Lock()
+
+
+def init_worker(overrides):
+    """Set up Django and the stream settings once per worker process."""
+    global _config
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SRAS_Project.settings')
+    django.setup()  # no-op when the worker was forked from an initialised parent
+    import stream_mjpeg
+    _config = stream_mjpeg.settings(**overrides)
+
+
+def cached_model(role, precision):
+    """Model loader for the per-chunk engines: each worker loads every model once."""
+    from streaming.backends import load_configured
+    with _models_lock:
+        if (role, precision) not in _models:
+            _models[(role, precision)] = load_configured(_config, role, precision)
+        return _models[(role, precision)]
+
+
+def video_clock(recorded_at, captured_at):
+    """Engine clock for recorded video: frame timestamps are seconds since the recording started."""
+    return recorded_at + timedelta(seconds=captured_at)
+
+
+class ChunkWriter:
+    """
+    Writer for a chunk's engine: stamps records with their evidence frame (the
+    current frame if they carry no timestamp) and keeps those inside the chunk.
+    """
+
+    def __init__(self, chunk):
+        self.chunk = chunk
+        self.frame = None
+        self.records = []
+
+    def start(self):
+        pass
+
+    def stop(self, timeout=None):
+        pass
+
+    def submit(self, record):
+        # evidence is saved when its track ends, a few frames after the frame it shows
+        frame = round(record.captured_at * self.chunk.fps) if record.captured_at is not None else self.frame
+        if frame < self.chunk.start:
+            return True  # warm-up frame, the previous chunk owns it
+        self.records.append(record._replace(camera=None, source_file=self.chunk.path, source_frame=frame))
+        return True
+
+    def stats(self):
+        return {'queue_depth': 0, 'submitted': len(self.records), 'written': 0}
+
+
+def process_chunk(chunk, camera, sample_every):
+    """
+    Worker: run one chunk through the live pipeline (StreamEngine.process_frame)
+    as fast as it decodes. Frame timestamps are video time, so tracking, speed
+    and the motion gate behave as they would live.
+    """
+    from streaming.engine import CameraStream, StreamEngine
+
+    writer = ChunkWriter(chunk)
+    # frame timestamps are video time: violations are stamped recorded_at + that
+    engine = StreamEngine(_config, cameras=[camera], model_loader=cached_model, writer=writer, warm_hashes=False,
+                          clock=partial(video_clock, chunk.recorded_at))
+    stream = CameraStream(camera, _config, engine.timer)
+    engine.request_models(stream.precision)
+    engine.wait_ready()
+    if engine.models_for(stream) is None:
+        engine.shutdown()
+        raise RuntimeError('could not load the models')
+
+    cap = cv2.VideoCapture(chunk.path)
+    first = max(0, chunk.start - chunk.warmup)
+    if first:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+    decoded = 0
+    try:
+        for index in range(first, chunk.stop):
+            if (index - first) % sample_every:
+                if not cap.grab():
+                    break
+                continue  # not sampled: never converted to BGR
+            ok, frame = cap.read()
+            if not ok:
+                break
+            decoded += 1
+            writer.frame = index
+            engine.process_frame(stream, frame, index / chunk.fps)
+        # riders still in view at the chunk's end: save the best frame they had (the stream is not in
+        # engine.streams, so stop() would not drain it)
+        engine.record_violations(stream, stream.evidence.drain())
+    finally:
+        cap.release()
+        engine.shutdown()
+    return chunk, decoded, writer.records
+
+
+def plan_chunks(paths, chunk_seconds, warmup_seconds, recorded_at=None):
+    """
+    Cut every file into chunks. `recorded_at` is when a single file started;
+    by default each file started its duration before its modification time
+    (cameras write the file until the recording stops).
+    """
+    chunks = []
+    for path in paths:
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            cap.release()
+            raise CommandError(f"Cannot open {path}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        if frames <= 0:
+            raise CommandError(f"{path} does not report a frame count; remux it (e.g. ffmpeg -c copy) first")
+        size = max(1, int(chunk_seconds * fps))
+        warmup = int(warmup_seconds * fps)
+        started = recorded_at or datetime.fromtimestamp(os.path.getmtime(path) - frames / fps, tz=dt_timezone.utc)
+        chunks.extend(VideoChunk(path, start, min(start + size, frames), warmup, fps, started)
+                      for start in range(0, frames, size))
+    return chunks
+
+
+def find_videos(inputs):
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                paths.extend(os.path.join(root, f) for f in files if f.lower().endswith(VIDEO_EXTENSIONS))
+        elif os.path.isfile(item):
+            paths.append(item)
+        else:
+            raise CommandError(f"No such file or directory: {item}")
+    return sorted(os.path.abspath(p) for p in paths)
+
+
+def drop_duplicates(records, window, max_distance):
+    """
+    Chunks are deduplicated independently, so repeat the live duplicate check
+    across them: per file, in frame order, a record matching an earlier kept one
+    (same rider_hash, or rider_phash within max_distance bits) less than
+    `window` seconds of video earlier is dropped.
+    """
+    from streaming.dedup import hamming, phash_from_hex
+
+    kept = []
+    recent = []  # (path, video seconds, rider_hash, phash int)
+    for record, fps in sorted(records, key=lambda item: (item[0].source_file, item[0].source_frame)):
+        t = record.source_frame / fps
+        phash = phash_from_hex(record.rider_phash) if record.rider_phash else None
+        recent = [r for r in recent if r[0] == record.source_file and t - r[1] < window]
+        if any((record.rider_hash and record.rider_hash == h) or
+               (phash is not None and p is not None and hamming(phash, p) <= max_distance)
+               for _, _, h, p in recent):
+            continue
+        recent.append((record.source_file, t, record.rider_hash, phash))
+        kept.append(record)
+    return kept
+
+
+class Command(BaseCommand):
+    help = ('Run the helmet-violation pipeline over recorded video files (e.g. SD-card back-fill) '
+            'in parallel chunks, faster than real time')
+
+    def add_arguments(self, parser):
+        parser.add_argument('inputs', nargs='+', help='Video files or directories of recordings')
+        parser.add_argument('--camera', type=int, required=True,
+                            help='Camera id the violations belong to (its ROI and precision are used)')
+        parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                            help='Number of worker processes')
+        parser.add_argument('--chunk-seconds', type=float, default=60.0,
+                            help='Seconds of video handed to a worker at a time')
+        parser.add_argument('--warmup-seconds', type=float, default=2.0,
+                            help='Video decoded before each chunk so tracks carry across chunk boundaries')
+        parser.add_argument('--sample-fps', type=float, default=None,
+                            help='Run the pipeline on at most this many frames per second of video (default: all)')
+        parser.add_argument('--backend', default=None, choices=['pytorch', 'onnx', 'openvino'],
+                            help='Inference backend (default: INFERENCE_BACKEND in stream_mjpeg.py)')
+        parser.add_argument('--threads', type=int, default=1,
+                            help='Inference threads per worker')
+        parser.add_argument('--recorded-at', default=None,
+                            help='When the recording started, e.g. "2024-05-01 08:30:00" (server time zone unless '
+                                 'given); single file only. Default: the file\'s modification time minus its '
+                                 'duration')
+        parser.add_argument('--dry-run', action='store_true', help='Report violations without saving them')
+
+    def handle(self, *args, **options):
+        import stream_mjpeg
+        from streaming.writer import ViolationWriter
+
+        try:
+            camera = Camera.objects.get(pk=options['camera'])
+        except Camera.DoesNotExist:
+            raise CommandError(f"Camera {options['camera']} does not exist")
+
+        paths = find_videos(options['inputs'])
+        if not paths:
+            raise CommandError('No video files found')
+        recorded_at = None
+        if options['recorded_at']:
+            if len(paths) > 1:
+                raise CommandError('--recorded-at needs a single video file')
+            recorded_at = parse_datetime(options['recorded_at'])
+            if recorded_at is None:
+                raise CommandError(f"--recorded-at: cannot parse '{options['recorded_at']}'")
+            if timezone.is_naive(recorded_at):
+                recorded_at = timezone.make_aware(recorded_at)
+        chunks = plan_chunks(paths, options['chunk_seconds'], options['warmup_seconds'], recorded_at)
+        total_frames = sum(c.stop - c.start for c in chunks)
+        video_seconds = sum((c.stop - c.start) / c.fps for c in chunks)
+
+        overrides = {'INFERENCE_THREADS': options['threads'], 'INFERENCE_SERVER': False}
+        if options['backend']:
+            overrides['INFERENCE_BACKEND'] = options['backend']
+        config = stream_mjpeg.settings(**overrides)
+
+        self.stdout.write(f"Processing {len(paths)} file(s), {video_seconds / 60:.1f} min of video, "
+                          f"in {len(chunks)} chunk(s) with {options['workers']} worker(s)...")
+
+        # forked workers must not share the parent's DB connection
+        connections.close_all()
+
+        started = time.monotonic()
+        done_frames = 0
+        found = []
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker,
+                                 initargs=(overrides,)) as pool:
+            futures = []
+            for chunk in chunks:
+                every = max(1, round(chunk.fps / options['sample_fps'])) if options['sample_fps'] else 1
+                futures.append(pool.submit(process_chunk, chunk, camera, every))
+            for future in as_completed(futures):
+                try:
+                    chunk, decoded, records = future.result()
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f"Chunk failed: {e}"))
+                    continue
+                done_frames += chunk.stop - chunk.start
+                found.extend((r, chunk.fps) for r in records)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"  {os.path.basename(chunk.path)} [{chunk.start}-{chunk.stop}): {len(records)} violation(s); "
+                    f"{done_frames}/{total_frames} frames, {done_frames / elapsed:.0f} frames/s"
+                )
+
+        elapsed = time.monotonic() - started
+        violations = drop_duplicates(found, config.TIME_WINDOW, config.PHASH_MAX_DISTANCE)
+        self.stdout.write(f"{len(violations)} violation(s) ({len(found) - len(violations)} cross-chunk duplicate(s)) "
+                          f"in {elapsed:.1f}s, {video_seconds / elapsed:.1f}x real time")
+        if options['dry_run'] or not violations:
+            for r in violations:
+                self.stdout.write(f"  {os.path.basename(r.source_file)} frame {r.source_frame} "
+                                  f"({timezone.localtime(r.occurred_at):%Y-%m-%d %H:%M:%S}): "
+                                  f"plate {r.plate_number or 'UNKNOWN'}")
+            return
+
+        # re-running over the same recordings must not store its violations twice
+        existing = set(Violation.objects.filter(source_file__in=paths)
+                       .values_list('source_file', 'source_frame'))
+        new = [r._replace(camera=camera) for r in violations if (r.source_file, r.source_frame) not in existing]
+        if len(new) < len(violations):
+            self.stdout.write(f"{len(violations) - len(new)} violation(s) already stored by an earlier run")
+        violations = new
+        writer = ViolationWriter(duplicate_window=config.TIME_WINDOW, max_retries=config.WRITER_MAX_RETRIES)
+        size = config.WRITER_BATCH_SIZE
+        for i in range(0, len(violations), size):
+            writer.write_batch(violations[i:i + size])
+        stats = writer.stats()
+        self.stdout.write(self.style.SUCCESS(f"Saved {stats['written']} violation(s)"))
+        if stats['duplicates'] or stats['failed']:
+            self.stdout.write(self.style.WARNING(
+                f"{stats['duplicates']} already stored, {stats['failed']} could not be written"))
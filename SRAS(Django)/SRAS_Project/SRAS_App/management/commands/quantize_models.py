@@ -0,0 +1,156 @@
+import json
+import os
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from SRAS_App.models import Camera
+from streaming.backends import FP32, INT8, ONNX, OPENVINO, exported_path, load_backend, rect_imgsz
+from streaming.detection import DETECTION_RESIZE, RIDER_CROP_SIZE
+from streaming.evaluation import (compare_outputs, latency_summary, sample_video_frames, sample_violation_frames,
+                                  timed_runs)
+from streaming.quantization import detector_calibration, helmet_calibration, quantize
+
+from .process_video import find_videos
+
+VIOLATION_SNAPSHOT_NOTE = (
+    'Calibrated and evaluated on stored violation snapshots: they have the live overlay drawn on them and '
+    'are all "no helmet" scenes, so they do not match the live input. Prefer --video with recordings '
+    'from the cameras.'
+)
+
+
+class Command(BaseCommand):
+    help = ('Quantize the detector and helmet/plate models to INT8 and report accuracy/latency against FP32 '
+            'per camera. Calibration and evaluation frames come from recorded video (--video, recommended: '
+            'clean frames as the cameras see them) or, without it, from stored violation snapshots, which are '
+            'annotated and all "no helmet" and so only approximate the live input.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', choices=[ONNX, OPENVINO], default=OPENVINO,
+                            help='Exported format to quantize (run export_models first)')
+        parser.add_argument('--video', nargs='+', default=None,
+                            help='Recordings (files or directories) to sample calibration and evaluation frames from')
+        parser.add_argument('--camera', type=int, default=None,
+                            help='Camera id the --video recordings come from (for the per-camera report)')
+        parser.add_argument('--calibration-frames', type=int, default=300,
+                            help='Frames sampled for calibration')
+        parser.add_argument('--eval-frames', type=int, default=200,
+                            help='Other frames used for the FP32 vs INT8 report')
+        parser.add_argument('--seed', type=int, default=0, help='Sampling seed')
+        parser.add_argument('--threads', type=int, default=None, help='Inference threads while evaluating')
+        parser.add_argument('--report', default=os.path.join(settings.BASE_DIR, 'quantization_report.json'),
+                            help='Where to write the JSON accuracy report')
+        parser.add_argument('--skip-quantize', action='store_true',
+                            help='Only re-run the report on existing INT8 models')
+        parser.add_argument('--detector', default=os.path.join(settings.BASE_DIR, 'yolov8n.pt'))
+        parser.add_argument('--helmet-model', default=os.path.join(settings.BASE_DIR, 'customyolov8n.pt'))
+
+    def handle(self, *args, **options):
+        kind = options['backend']
+        detector_imgsz = rect_imgsz(*DETECTION_RESIZE)
+
+        def load(precision):
+            return (
+                load_backend(kind, options['detector'], imgsz=detector_imgsz,
+                             threads=options['threads'], warmup=2, precision=precision),
+                load_backend(kind, options['helmet_model'], imgsz=RIDER_CROP_SIZE,
+                             threads=options['threads'], warmup=2, precision=precision),
+            )
+
+        try:
+            fp32 = load(FP32)
+        except Exception as e:
+            raise CommandError(f"Could not load the FP32 {kind} models ({e}); run `manage.py export_models` first")
+
+        if options['video']:
+            paths = find_videos(options['video'])
+            source = 'video'
+
+            def sample(limit, seed, exclude=()):
+                return sample_video_frames(paths, limit, seed=seed, exclude=exclude, camera_id=options['camera'])
+        else:
+            source = 'violation snapshots'
+            sample = sample_violation_frames
+            self.stdout.write(self.style.WARNING(VIOLATION_SNAPSHOT_NOTE))
+
+        calibration = sample(options['calibration_frames'], seed=options['seed'])
+        if not options['skip_quantize']:
+            if not calibration:
+                raise CommandError(f'No {source} frames to calibrate with')
+            frames = [frame for _, _, frame in calibration]
+            self.stdout.write(f"Calibrating on {len(frames)} frame(s) from {source}...")
+            inputs = {
+                options['detector']: detector_calibration(fp32[0], frames),
+                options['helmet_model']: helmet_calibration(fp32[0], fp32[1], frames, RIDER_CROP_SIZE,
+                                                            limit=options['calibration_frames']),
+            }
+            for weights, blobs in inputs.items():
+                self.stdout.write(f"  {os.path.basename(weights)}: {len(blobs)} calibration input(s)")
+                try:
+                    path = quantize(kind, weights, blobs)
+                except Exception as e:
+                    raise CommandError(f"Quantizing {os.path.basename(weights)} failed: {e}")
+                self.stdout.write(self.style.SUCCESS(f"  Wrote {path}"))
+
+        try:
+            int8 = load(INT8)
+        except Exception as e:
+            raise CommandError(f"Could not load the INT8 {kind} models ({e})")
+
+        # held-out frames: never the ones the quantizer calibrated on
+        held_out = sample(options['eval_frames'], seed=options['seed'] + 1,
+                          exclude=[key for key, _, _ in calibration])
+        if not held_out:
+            raise CommandError(f'No held-out {source} frames to evaluate on')
+        self.stdout.write(f"Evaluating FP32 vs INT8 on {len(held_out)} held-out frame(s)...")
+
+        frames = [frame for _, _, frame in held_out]
+        fp32_out, fp32_ms = timed_runs(*fp32, frames)
+        int8_out, int8_ms = timed_runs(*int8, frames)
+
+        by_camera = defaultdict(list)
+        for i, (_, camera_id, _) in enumerate(held_out):
+            by_camera[camera_id].append(i)
+        names = dict(Camera.objects.filter(pk__in=by_camera).values_list('id', 'name'))
+
+        report = {
+            'generated_at': timezone.now().isoformat(),
+            'backend': kind,
+            'models': {
+                os.path.basename(w): {FP32: exported_path(w, kind), INT8: exported_path(w, kind, INT8)}
+                for w in (options['detector'], options['helmet_model'])
+            },
+            'frame_source': source,
+            'note': None if options['video'] else VIOLATION_SNAPSHOT_NOTE,
+            'calibration_frames': len(calibration),
+            'eval_frames': len(held_out),
+            'overall': self.section(fp32_out, int8_out, fp32_ms, int8_ms),
+            'cameras': [
+                {'camera_id': camera_id, 'name': names.get(camera_id, ''),
+                 **self.section([fp32_out[i] for i in idx], [int8_out[i] for i in idx],
+                                fp32_ms[idx], int8_ms[idx])}
+                for camera_id, idx in sorted(by_camera.items())
+            ],
+        }
+        with open(options['report'], 'w') as f:
+            json.dump(report, f, indent=2)
+
+        for row in [{'name': 'All cameras', **report['overall']}] + report['cameras']:
+            acc, lat = row['accuracy'], row['latency']
+            self.stdout.write(
+                f"  {row['name']}: rider recall {acc['rider_recall']}, verdict agreement {acc['verdict_agreement']}, "
+                f"{lat[FP32].get('fps')} -> {lat[INT8].get('fps')} FPS"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Report written to {options['report']}"))
+        self.stdout.write("Set Camera.inference_precision to 'int8' for cameras where the accuracy is acceptable.")
+
+    @staticmethod
+    def section(fp32_out, int8_out, fp32_ms, int8_ms):
+        return {
+            'frames': len(fp32_out),
+            'accuracy': compare_outputs(fp32_out, int8_out),
+            'latency': {FP32: latency_summary(fp32_ms), INT8: latency_summary(int8_ms)},
+        }
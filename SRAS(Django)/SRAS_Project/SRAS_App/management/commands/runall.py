@@ -5,6 +5,8 @@ import subprocess
 import sys
 import os
 import signal
+import threading
+import time
 
 
 class Command(BaseCommand):
@@ -21,6 +23,7 @@ class Command(BaseCommand):
 			raise SystemExit(f"stream_mjpeg.py not found at: {stream_script}")
 
 		stream_proc = None
+		shutting_down = threading.Event()
 
 		def start_stream():
 			nonlocal stream_proc
@@ -42,6 +45,17 @@ class Command(BaseCommand):
 				preexec_fn=preexec_fn,
 			)
 
+		def watch_stream():
+			# bring the stream server straight back if it crashes; it serves video
+			# again within seconds while its models finish loading in the background
+			while not shutting_down.wait(2.0):
+				if stream_proc is not None and stream_proc.poll() is not None:
+					self.stdout.write(self.style.WARNING(
+						f"MJPEG stream server exited (code {stream_proc.returncode}), restarting..."))
+					time.sleep(1.0)
+					if not shutting_down.is_set():
+						start_stream()
+
 		try:
 			self.stdout.write(self.style.SUCCESS("Starting Django server..."))
 			addrport = options.get('addrport')
@@ -55,6 +69,8 @@ class Command(BaseCommand):
 						start_stream()
 			else:
 				start_stream()
+			if stream_proc is not None:
+				threading.Thread(target=watch_stream, daemon=True).start()
 
 			if addrport:
 				call_command('runserver', addrport, use_reloader=use_reloader)
@@ -63,6 +79,7 @@ class Command(BaseCommand):
 		except KeyboardInterrupt:
 			self.stdout.write("\nShutting down...")
 		finally:
+			shutting_down.set()
 			# Terminate the stream process
 			if stream_proc and stream_proc.poll() is None:
 				try:
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SRAS_App', '0016_originalviolation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='violation',
+            name='rider_phash',
+            field=models.CharField(blank=True, max_length=16, null=True),
+        ),
+    ]
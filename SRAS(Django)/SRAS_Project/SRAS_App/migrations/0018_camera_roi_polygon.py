@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SRAS_App', '0017_violation_rider_phash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='roi_polygon',
+            field=models.JSONField(blank=True, help_text='Polygon [[x, y], ...] in 0..1 image coordinates; empty = whole frame', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SRAS_App', '0018_camera_roi_polygon'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='inference_precision',
+            field=models.CharField(choices=[('fp32', 'FP32'), ('int8', 'INT8 (quantized)')], default='fp32', max_length=8),
+        ),
+    ]
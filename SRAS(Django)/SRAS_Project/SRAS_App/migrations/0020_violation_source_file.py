@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SRAS_App', '0019_camera_inference_precision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='violation',
+            name='source_file',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='violation',
+            name='source_frame',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SRAS_App', '0020_violation_source_file'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='violation',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -7,6 +7,17 @@ class Camera(models.Model):
     name = models.CharField(max_length=100)
     stream_url = models.URLField()
 
+    # detection region: [[x, y], ...] polygon in normalised 0..1 image coordinates
+    roi_polygon = models.JSONField(null=True, blank=True,
+                                   help_text="Polygon [[x, y], ...] in 0..1 image coordinates; empty = whole frame")
+
+    PRECISION_CHOICES = [
+        ('fp32', 'FP32'),
+        ('int8', 'INT8 (quantized)'),
+    ]
+    # model precision for this camera's inference; INT8 needs `manage.py quantize_models`
+    inference_precision = models.CharField(max_length=8, choices=PRECISION_CHOICES, default='fp32')
+
     def __str__(self):
         return self.name
 
@@ -28,7 +39,7 @@ class Violation(models.Model):
     ]
     
     camera = models.ForeignKey(Camera, on_delete=models.CASCADE)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)  # when it happened (the evidence frame), not when saved
 
     # parsed from your detector label (e.g., "plate_AB1234")
     plate_number = models.CharField(max_length=20, null=True, blank=True)
@@ -50,6 +61,12 @@ class Violation(models.Model):
 
     # duplicate control
     rider_hash = models.CharField(max_length=64, null=True, blank=True)
+    # 64-bit perceptual hash (dHash, hex) of the rider crop for near-duplicate matching
+    rider_phash = models.CharField(max_length=16, null=True, blank=True)
+
+    # set for violations found in recorded video (`manage.py process_video`) instead of a live camera
+    source_file = models.CharField(max_length=255, null=True, blank=True)
+    source_frame = models.PositiveIntegerField(null=True, blank=True)
 
     def __str__(self):
         return f"Violation @ {self.timestamp} - {self.plate_number or 'UNKNOWN'} ({self.status})"
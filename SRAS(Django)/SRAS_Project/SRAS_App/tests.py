@@ -1,3 +1,957 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import cv2
+import numpy as np
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+
+import stream_mjpeg
+from SRAS_App.management.commands.process_video import (ChunkWriter, VideoChunk, drop_duplicates, plan_chunks,
+                                                        video_clock)
+from SRAS_App.models import Camera, Violation
+from streaming.backends import stub_backend
+from streaming.broadcast import FrameBroadcaster
+from streaming.classifier import HELMET, NO_HELMET, UNDECIDED, TrackClassifier
+from streaming.dedup import HammingIndex, TTLHashSet, create_rider_phash, hamming, phash_to_hex
+from streaming.detection import (KIND_HELMET, KIND_NO_HELMET, Detection, greedy_assignment, iou, iou_matrix,
+                                 pair_riders)
+from streaming.engine import StreamEngine, live_clock
+from streaming.evidence import EvidenceBuffer
+from streaming.framebus import FrameRing, RingInUse, _process_start
+from streaming.inference_server import BatchScheduler, Request
+from streaming.metrics import StageTimer, render_prometheus
+from streaming.motion import MotionGate
+from streaming.profiling import ProfileBusy, ThreadProfiler
+from streaming.roi import RegionOfInterest
+from streaming.server import MJPEGServer
+from streaming.sources import StubSource
+from streaming.tracker import RiderTracker
+from streaming.writer import MemoryWriter, ViolationRecord, ViolationWriter
+
+
+def wait_for(condition, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+class FakeClock:
+    """Stands in for a module's `time`; tests move `now` by hand."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+
+class StubEngineTests(TransactionTestCase):
+    """The live pipeline on a synthetic camera and stub models, writing to the test database."""
+
+    def setUp(self):
+        self.camera = Camera.objects.create(name='Stub', stream_url='http://stub.invalid/stream')
+        # TIME_WINDOW=0: the stub rider looks the same every time, so it may be saved again after a restart
+        self.config = stream_mjpeg.settings(CAPTURE_PROCESS=False, INFERENCE_SERVER=False, TRACK_MIN_HITS=1,
+                                            TIME_WINDOW=0, EVIDENCE_MAX_WAIT=0.2, WRITER_FLUSH_INTERVAL=0.05)
+        self.writer = ViolationWriter(flush_interval=0.05, duplicate_window=0)
+        self.engine = stream_mjpeg.build_stub_engine(self.config, cameras=[self.camera], writer=self.writer)
+
+    def tearDown(self):
+        self.engine.shutdown()
+
+    def test_violation_written_across_restart(self):
+        self.engine.start()
+        self.assertTrue(wait_for(lambda: Violation.objects.count() >= 1), 'no violation written')
+        self.engine.stop()
+        first = Violation.objects.count()
+
+        self.engine.start()
+        self.assertTrue(self.writer.thread.is_alive())
+        self.assertTrue(wait_for(lambda: Violation.objects.count() > first), 'no violation written after restart')
+
+        violation = Violation.objects.first()
+        self.assertEqual(violation.camera, self.camera)
+        self.assertTrue(violation.image)
+        self.assertTrue(violation.plate_image)
+
+    def test_status_reports_frames(self):
+        self.engine.start()
+        self.assertTrue(wait_for(lambda: self.engine.status()['cameras'][0]['frames_inferred'] > 0))
+        status = self.engine.status()
+        self.assertTrue(status['running'])
+        self.assertTrue(status['models_ready'])
+        metrics = render_prometheus(status, self.engine.timer)
+        self.assertIn(f'sras_frames_inferred_total{{camera="{self.camera.id}",name="Stub"}}', metrics)
+        self.assertIn('sras_stage_seconds_count{stage="detector"}', metrics)
+
+
+class WriterTests(TransactionTestCase):
+
+    def test_restart_after_stop(self):
+        writer = ViolationWriter(flush_interval=0.05)
+        writer.start()
+        writer.stop()
+        writer.start()
+        try:
+            self.assertTrue(writer.thread.is_alive())
+        finally:
+            writer.stop()
+
+    def test_timestamp_is_when_it_happened(self):
+        camera = Camera.objects.create(name='Stub', stream_url='http://stub.invalid/stream')
+        occurred_at = timezone.now() - timedelta(seconds=4)
+        writer = ViolationWriter()
+        writer.write_batch([
+            ViolationRecord(camera, b'jpeg', None, None, 'a' * 64, None, time.monotonic(), occurred_at=occurred_at),
+            ViolationRecord(camera, b'jpeg', None, None, 'b' * 64, None, time.monotonic()),
+        ])
+        stamped, unstamped = Violation.objects.order_by('rider_hash')
+        self.assertEqual(stamped.timestamp, occurred_at)
+        self.assertGreater(unstamped.timestamp, occurred_at)
+
+
+class ViolationClockTests(SimpleTestCase):
+
+    def test_live_clock(self):
+        delta = timezone.now() - live_clock(time.monotonic() - 4)
+        self.assertAlmostEqual(delta.total_seconds(), 4, delta=0.5)
+
+    def test_engine_clock(self):
+        config = stream_mjpeg.settings()
+        self.assertIsNotNone(StreamEngine(config, writer=MemoryWriter()).occurred_at(time.monotonic()))
+        self.assertIsNone(StreamEngine(config, writer=MemoryWriter()).occurred_at(None))
+        # e.g. recorded video, where timestamps are seconds into the file: stamped when written
+        self.assertIsNone(StreamEngine(config, writer=MemoryWriter(), clock=None).occurred_at(12.0))
+        started = timezone.now() - timedelta(days=2)
+        engine = StreamEngine(config, writer=MemoryWriter(), clock=lambda t: started + timedelta(seconds=t))
+        self.assertEqual(engine.occurred_at(12.0), started + timedelta(seconds=12))
+
+
+class StubSourceTests(SimpleTestCase):
+
+    def test_grab_retrieve_counters(self):
+        source = StubSource(size=(64, 48), realtime=False)
+        self.assertTrue(source.grab())
+        self.assertTrue(source.grab())
+        ok, frame = source.retrieve()
+        self.assertTrue(ok)
+        self.assertEqual(frame.shape, (48, 64, 3))
+        self.assertEqual((source.counters.grabbed, source.counters.decoded), (2, 1))
+        source.release()
+        self.assertEqual(source.read(), (False, None))
+
+    def test_finite_frames(self):
+        frames = [np.full((4, 4, 3), i, dtype=np.uint8) for i in range(3)]
+        source = StubSource(frames=frames, realtime=False, loop=False)
+        values = []
+        while True:
+            ok, frame = source.read()
+            if not ok:
+                break
+            values.append(int(frame[0, 0, 0]))
+        self.assertEqual(values, [0, 1, 2])
+
+
+class StubBackendTests(SimpleTestCase):
+
+    def test_boxes_scaled_to_image(self):
+        boxes = stub_backend('detector').predict([np.zeros((100, 200, 3), dtype=np.uint8)])[0]
+        self.assertEqual(boxes.shape, (2, 6))
+        np.testing.assert_allclose(boxes[0, :4], [80, 30, 110, 80])
+
+
+class EvidenceBufferTests(SimpleTestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.sharp = rng.integers(0, 255, (64, 32, 3), dtype=np.uint8)
+        self.blurred = np.full((64, 32, 3), 128, dtype=np.uint8)
+        self.frame = np.zeros((10, 10, 3), dtype=np.uint8)
+
+    def test_keeps_best_frame_until_confirmed_track_ends(self):
+        buffer = EvidenceBuffer(max_wait=10)
+        buffer.offer(1, 0.0, self.frame, self.blurred, 0.9)
+        self.assertTrue(buffer.offer(1, 0.1, self.frame, self.sharp, 0.9))
+        self.assertFalse(buffer.offer(1, 0.2, self.frame, self.blurred, 0.9))
+        buffer.confirm(1, 0.2)
+        self.assertEqual(buffer.due(1.0), [])
+        [(track_id, evidence)] = buffer.pop([1])
+        self.assertEqual((track_id, evidence.captured_at, evidence.candidates), (1, 0.1, 3))
+        self.assertEqual(len(buffer), 0)
+
+    def test_unconfirmed_tracks_are_dropped(self):
+        buffer = EvidenceBuffer(max_wait=0.5)
+        buffer.offer(1, 0.0, self.frame, self.sharp, 0.9)
+        buffer.offer(2, 0.0, self.frame, self.sharp, 0.9)
+        buffer.confirm(2, 0.0)
+        self.assertEqual([track_id for track_id, _ in buffer.due(1.0)], [2])
+        self.assertEqual(buffer.pop([1]), [])
+
+    def test_frame_is_copied(self):
+        buffer = EvidenceBuffer()
+        frame = self.frame.copy()
+        buffer.offer(1, 0.0, frame, self.sharp, 0.9)
+        frame[:] = 255  # later riders drawn on the same annotated frame
+        buffer.confirm(1, 0.0)
+        [(_, evidence)] = buffer.drain()
+        self.assertEqual(int(evidence.annotated.max()), 0)
+
+
+class FrameBroadcasterTests(SimpleTestCase):
+
+    def test_each_frame_encoded_once(self):
+        broadcaster = FrameBroadcaster()
+        self.assertIsNone(broadcaster.peek())
+        broadcaster.publish(np.zeros((48, 64, 3), dtype=np.uint8))
+        seq, jpeg = broadcaster.latest()
+        self.assertEqual(seq, 1)
+        self.assertIs(broadcaster.latest()[1], jpeg)  # second viewer gets the same bytes, no new encode
+        self.assertEqual(broadcaster.peek(), (1, jpeg))
+
+        broadcaster.publish(np.full((48, 64, 3), 255, dtype=np.uint8))
+        self.assertIsNone(broadcaster.peek())
+        seq, jpeg = broadcaster.latest()
+        self.assertEqual(seq, 2)
+        self.assertGreater(cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_GRAYSCALE).min(), 200)
+
+    def test_wait_wakes_on_publish(self):
+        broadcaster = FrameBroadcaster()
+        self.assertFalse(broadcaster.wait(0, timeout=0.01))
+        threading.Timer(0.05, broadcaster.publish, [np.zeros((4, 4, 3), dtype=np.uint8)]).start()
+        self.assertTrue(broadcaster.wait(0, timeout=5))
+        self.assertEqual(broadcaster.seq, 1)
+        self.assertTrue(broadcaster.wait(0, timeout=0))  # already past: returns at once
+
+    def test_wait_async_wakes_on_publish(self):
+        broadcaster = FrameBroadcaster()
+
+        async def viewer():
+            broadcaster.attach_loop(asyncio.get_running_loop())
+            self.assertFalse(await broadcaster.wait_async(0, timeout=0.01))
+            threading.Timer(0.05, broadcaster.publish, [np.zeros((4, 4, 3), dtype=np.uint8)]).start()
+            self.assertTrue(await broadcaster.wait_async(0, timeout=5))
+
+        asyncio.run(viewer())
+        self.assertEqual(broadcaster.seq, 1)
+
+    def test_publish_not_blocked_by_an_encode(self):
+        broadcaster = FrameBroadcaster()
+        broadcaster.publish(np.zeros((48, 64, 3), dtype=np.uint8))
+        encoding, release = threading.Event(), threading.Event()
+        imencode = cv2.imencode
+
+        def slow_imencode(*args, **kwargs):
+            encoding.set()
+            release.wait(5)
+            return imencode(*args, **kwargs)
+
+        with mock.patch('streaming.broadcast.cv2.imencode', slow_imencode):
+            viewer = threading.Thread(target=broadcaster.latest)
+            viewer.start()
+            self.assertTrue(encoding.wait(5))
+            capture = threading.Thread(target=broadcaster.publish, args=[np.ones((48, 64, 3), dtype=np.uint8)])
+            capture.start()
+            capture.join(timeout=1)
+            self.assertFalse(capture.is_alive(), 'publish() waited for the encode')
+            release.set()
+            viewer.join()
+        self.assertEqual((broadcaster.seq, broadcaster.jpeg_seq), (2, 1))
+        self.assertIsNone(broadcaster.peek())
+
+    def test_placeholder_before_first_frame(self):
+        seq, jpeg = FrameBroadcaster().latest()
+        self.assertEqual(seq, 0)
+        self.assertEqual(cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR).shape, (480, 640, 3))
+
+
+class TTLHashSetTests(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('streaming.dedup.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_entries_expire_after_ttl(self):
+        hashes = TTLHashSet(ttl=10)
+        hashes.add('a')
+        self.clock.now += 5
+        hashes.add('b')
+        self.assertIn('a', hashes)
+        self.clock.now += 5
+        self.assertNotIn('a', hashes)
+        self.assertIn('b', hashes)
+        self.assertEqual(len(hashes), 1)
+        self.assertNotIn(None, hashes)
+
+    def test_readding_refreshes(self):
+        hashes = TTLHashSet(ttl=10)
+        hashes.add('a')
+        hashes.add('b')
+        self.clock.now += 6
+        hashes.add('a')
+        self.clock.now += 6
+        self.assertIn('a', hashes)
+        self.assertNotIn('b', hashes)
+
+    def test_expired_entry_behind_a_fresher_one(self):
+        # warm_from_db adds entries with their remaining lifetime while live hashes are already arriving
+        hashes = TTLHashSet(ttl=10)
+        hashes.add('live')
+        hashes.add('warmed', expires_at=self.clock.now + 2)
+        self.clock.now += 3
+        self.assertNotIn('warmed', hashes)
+        self.assertIn('live', hashes)
+
+
+class HammingIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('streaming.dedup.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_near_match_within_max_distance(self):
+        index = HammingIndex(max_distance=6, ttl=10)
+        base = 0x0123_4567_89ab_cdef
+        index.add(base)
+        self.assertEqual(index.nearest(base), (0, base))
+        near = base ^ 0b10_0000_0001 ^ (1 << 63)  # 3 bits apart
+        self.assertEqual(index.nearest(near), (3, base))
+        self.assertIsNone(index.nearest(base ^ 0x7f))  # 7 bits apart
+        self.assertIsNone(index.nearest(near, max_distance=2))
+        self.assertIsNone(index.nearest(None))
+
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        index = HammingIndex(max_distance=6, ttl=10)
+        stored = [int(v) for v in rng.integers(0, 2 ** 63, 300, dtype=np.int64)]
+        for value in stored:
+            index.add(value)
+        for value in stored[:50]:
+            query = value
+            for bit in rng.choice(64, 5, replace=False):
+                query ^= 1 << int(bit)
+            expected = min(hamming(query, other) for other in stored)
+            self.assertEqual(index.nearest(query)[0], expected)
+
+    def test_entries_expire(self):
+        index = HammingIndex(max_distance=6, ttl=10)
+        live = 0xffff_ffff_0000_0000
+        index.add(live)
+        index.add(7, expires_at=self.clock.now + 2)  # warmed, older than the live entry in front of it
+        self.clock.now += 5
+        self.assertIsNone(index.nearest(7))
+        self.assertEqual(index.nearest(live), (0, live))
+        self.clock.now += 5
+        self.assertIsNone(index.nearest(live))
+        self.assertEqual(len(index), 0)
+
+    def test_phash_tolerates_noise_not_other_riders(self):
+        rng = np.random.default_rng(1)
+        rider = cv2.resize(rng.integers(0, 255, (8, 4, 3), dtype=np.uint8), (120, 240))
+        noisy = np.clip(rider + rng.normal(0, 6, rider.shape), 0, 255).astype(np.uint8)
+        other = cv2.resize(rng.integers(0, 255, (8, 4, 3), dtype=np.uint8), (120, 240))
+        self.assertLessEqual(hamming(create_rider_phash(rider), create_rider_phash(noisy)), 6)
+        self.assertGreater(hamming(create_rider_phash(rider), create_rider_phash(other)), 6)
+
+
+class WarmHashesTests(TestCase):
+
+    def setUp(self):
+        camera = Camera.objects.create(name='Stub', stream_url='http://stub.invalid/stream')
+        now = timezone.now()
+        for rider_hash, rider_phash, age in (('recent', 0xabc, 60), ('old', 0xdef, 600)):
+            Violation.objects.create(camera=camera, image=b'jpeg', rider_hash=rider_hash,
+                                     rider_phash=phash_to_hex(rider_phash), timestamp=now - timedelta(seconds=age))
+
+    def test_hashes_loaded_with_remaining_lifetime(self):
+        hashes = TTLHashSet(ttl=300)
+        self.assertEqual(hashes.warm_from_db(), 1)
+        self.assertIn('recent', hashes)
+        self.assertNotIn('old', hashes)
+        self.assertAlmostEqual(hashes.entries['recent'] - time.monotonic(), 240, delta=5)
+
+    def test_phashes_loaded_within_ttl(self):
+        index = HammingIndex(max_distance=6, ttl=300)
+        self.assertEqual(index.warm_from_db(), 1)
+        self.assertEqual(index.nearest(0xabc ^ 1), (1, 0xabc))
+        self.assertIsNone(index.nearest(0xdef))
+
+
+class PairingTests(SimpleTestCase):
+
+    def test_iou_matrix_matches_scalar_iou(self):
+        a = np.array([[0, 0, 10, 10], [5, 5, 15, 15], [0, 0, 0, 0]], dtype=np.float32)
+        b = np.array([[0, 0, 10, 10], [20, 20, 30, 30]], dtype=np.float32)
+        scores = iou_matrix(a, b)
+        self.assertEqual(scores.shape, (3, 2))
+        for i in range(3):
+            for j in range(2):
+                self.assertAlmostEqual(float(scores[i, j]), iou(a[i].tolist(), b[j].tolist()), places=5)
+        self.assertAlmostEqual(float(scores[1, 0]), 25 / 175, places=5)
+        self.assertEqual(float(scores[2, 0]), 0.0)  # degenerate box: no division by zero
+        self.assertEqual(iou_matrix(np.zeros((0, 4)), b).shape, (0, 2))
+
+    def test_greedy_assignment_is_one_to_one(self):
+        scores = np.array([[0.9, 0.8, 0.0],
+                           [0.85, 0.2, 0.0],
+                           [0.0, 0.0, 0.05]])
+        self.assertEqual(greedy_assignment(scores, 0.1), [(0, 0), (1, 1)])
+        self.assertEqual(greedy_assignment(scores, 0.95), [])
+        self.assertEqual(greedy_assignment(np.zeros((0, 3)), 0.1), [])
+
+    def test_pair_riders_unions_person_and_motorcycle(self):
+        xyxy = np.array([[100, 50, 140, 150],    # person on motorcycle A
+                         [90, 100, 160, 180],    # motorcycle A
+                         [400, 60, 440, 160],    # pedestrian, no motorcycle near
+                         [600, 100, 680, 180]],  # parked motorcycle, nobody on it
+                        dtype=np.float32)
+        cls = np.array([0, 3, 0, 3])
+        riders = pair_riders(xyxy, cls, np.array([0]), np.array([3]))
+        np.testing.assert_array_equal(riders, [[90, 50, 160, 180]])
+        self.assertEqual(pair_riders(xyxy[:1], cls[:1], np.array([0]), np.array([3])).shape, (0, 4))
+
+
+def moving_box(t, x0=100, speed=100, y=200):
+    """A 50x100 rider box moving right at `speed` px/s."""
+    x = x0 + speed * t
+    return [x, y, x + 50, y + 100]
+
+
+class RiderTrackerTests(SimpleTestCase):
+
+    def test_ids_stable_while_riders_move(self):
+        tracker = RiderTracker(min_hits=2, max_age=1.0)
+        first = None
+        for i in range(10):
+            t = i * 0.1
+            ids = tracker.update([moving_box(t), moving_box(t, x0=600, speed=-100)], t)
+            self.assertEqual(len(set(ids)), 2)
+            first = first or ids
+            self.assertEqual(ids, first)
+        vx, vy = tracker.velocity(first[0])
+        self.assertAlmostEqual(vx, 100, delta=10)
+        self.assertAlmostEqual(vy, 0, delta=10)
+        self.assertAlmostEqual(tracker.speed_kph(first[0], pixels_per_meter=10), 36, delta=4)
+
+    def test_confirmed_track_survives_a_gap(self):
+        tracker = RiderTracker(min_hits=2, max_age=1.0)
+        for i in range(5):
+            [track_id] = tracker.update([moving_box(i * 0.1)], i * 0.1)
+        tracker.update([], 0.5)
+        tracker.update([], 0.7)
+        self.assertEqual(tracker.update([moving_box(0.8)], 0.8), [track_id])  # predicted through the gap
+        self.assertEqual(tracker.pop_ended(), [])
+
+        tracker.update([], 2.0)
+        self.assertEqual(len(tracker), 0)
+        self.assertEqual(tracker.pop_ended(), [track_id])
+        self.assertEqual(tracker.pop_ended(), [])
+
+    def test_tentative_track_dropped_on_first_miss(self):
+        tracker = RiderTracker(min_hits=3, max_age=1.0)
+        [track_id] = tracker.update([moving_box(0)], 0.0)
+        tracker.update([], 0.1)
+        self.assertFalse(tracker.is_live(track_id))
+        self.assertEqual(tracker.pop_ended(), [track_id])
+        self.assertNotEqual(tracker.update([moving_box(0.2)], 0.2), [track_id])
+
+    def test_predict_does_not_change_state(self):
+        tracker = RiderTracker(min_hits=1)
+        for i in range(10):
+            [track_id] = tracker.update([moving_box(i * 0.1)], i * 0.1)
+        ids, boxes, _ = tracker.predict(1.4)
+        self.assertEqual(ids, [track_id])
+        np.testing.assert_allclose(boxes[0], moving_box(1.4), atol=5)
+        self.assertEqual(tracker.update([moving_box(1.0)], 1.0), [track_id])
+
+
+BARE = [Detection(10, 0, 30, 20, 'no helmet', KIND_NO_HELMET, None, 0.9)]
+HELMETED = [Detection(10, 0, 30, 20, 'helmet', KIND_HELMET, None, 0.9)]
+UNSURE = [Detection(10, 0, 30, 20, 'helmet', KIND_HELMET, None, 0.3)]
+
+
+class TrackClassifierTests(SimpleTestCase):
+
+    def setUp(self):
+        self.classifier = TrackClassifier(window=5, votes_needed=3, recheck_after=2.0, settle_conf=0.6)
+
+    def check(self, t, detections, track_id=1):
+        self.assertTrue(self.classifier.needs_check(track_id, t))
+        return self.classifier.record(track_id, t, detections, (40, 80))
+
+    def test_violation_needs_k_of_n_votes(self):
+        decisions = [self.check(t, d) for t, d in enumerate([BARE, HELMETED, BARE, [], BARE])]
+        self.assertEqual(decisions, [UNDECIDED] * 4 + [NO_HELMET])
+
+    def test_votes_older_than_the_window_do_not_count(self):
+        decisions = [self.check(t, d) for t, d in enumerate([BARE, BARE, [], [], [], BARE])]  # 3 in 6 checks
+        self.assertEqual(decisions[-1], UNDECIDED)
+
+    def test_helmet_settles_and_is_rechecked(self):
+        decisions = [self.check(t * 0.1, HELMETED) for t in range(3)]
+        self.assertEqual(decisions[-1], HELMET)
+        self.assertFalse(self.classifier.needs_check(1, 1.0))  # settled: second stage skipped
+        self.assertTrue(self.classifier.needs_check(1, 2.2))
+        # the re-check disagrees: back to voting
+        self.assertEqual(self.classifier.record(1, 2.2, BARE, (40, 80)), UNDECIDED)
+        self.assertTrue(self.classifier.needs_check(1, 2.3))
+
+    def test_low_confidence_never_settles(self):
+        decisions = [self.check(t, UNSURE) for t in range(5)]
+        self.assertEqual(decisions[-1], UNDECIDED)
+
+    def test_done_track_is_never_checked_again(self):
+        self.check(0, BARE)
+        self.classifier.mark_done(1)
+        self.assertFalse(self.classifier.needs_check(1, 100))
+        self.classifier.forget([1])
+        self.assertTrue(self.classifier.needs_check(1, 100))
+
+    def test_cached_detections_follow_the_crop_size(self):
+        self.check(0, HELMETED)
+        [cached] = self.classifier.cached(1, (80, 160))
+        self.assertEqual((cached.x1, cached.y1, cached.x2, cached.y2), (20, 0, 60, 40))
+        self.assertEqual(self.classifier.cached(2, (80, 160)), [])
+
+
+class MotionGateTests(SimpleTestCase):
+
+    def setUp(self):
+        self.gate = MotionGate(max_interval=5.0)
+        self.scene = np.full((360, 640, 3), 90, dtype=np.uint8)
+
+    def test_static_scene_is_gated(self):
+        self.assertTrue(self.gate.should_infer(self.scene, 0.0))  # first frame
+        self.assertFalse(self.gate.should_infer(self.scene, 0.5))
+        self.assertFalse(self.gate.should_infer(self.scene, 1.0))
+        self.assertEqual(self.gate.stats()['gated'], 2)
+
+    def test_motion_runs_the_detector(self):
+        self.gate.should_infer(self.scene, 0.0)
+        moved = self.scene.copy()
+        moved[100:200, 300:350] = 250  # a rider entering
+        self.assertTrue(self.gate.should_infer(moved, 0.5))
+
+    def test_detector_forced_after_max_interval_or_by_tracks(self):
+        self.gate.should_infer(self.scene, 0.0)
+        self.assertTrue(self.gate.should_infer(self.scene, 1.0, force=True))
+        self.assertFalse(self.gate.should_infer(self.scene, 5.5))
+        self.assertTrue(self.gate.should_infer(self.scene, 6.0))
+
+
+class RegionOfInterestTests(SimpleTestCase):
+
+    def setUp(self):
+        # lower-left triangle of the frame
+        self.roi = RegionOfInterest([[0, 0], [0, 1], [1, 1]])
+
+    def test_bounding_rect_in_pixels(self):
+        self.assertEqual(self.roi.bounding_rect((101, 201, 3)), (0, 0, 201, 101))
+        square = RegionOfInterest([[0.25, 0.5], [0.75, 0.5], [0.75, 1.0], [0.25, 1.0]])
+        self.assertEqual(square.bounding_rect((101, 201)), (50, 50, 151, 101))
+
+    def test_contains_tests_box_centres(self):
+        boxes = [[10, 60, 30, 90],     # centre (20, 75): below the diagonal
+                 [150, 5, 190, 25],    # centre (170, 15): above it
+                 [-50, 90, 10, 130]]   # centre clipped into the frame, bottom-left corner
+        np.testing.assert_array_equal(self.roi.contains(boxes, (101, 201)), [True, False, True])
+        self.assertEqual(self.roi.contains([], (101, 201)).shape, (0,))
+
+    def test_resolved_per_frame_size(self):
+        self.roi.contains([[0, 0, 1, 1]], (101, 201))
+        self.assertEqual(self.roi.bounding_rect((51, 101)), (0, 0, 101, 51))
+        self.assertEqual(self.roi.mask.shape, (51, 101))
+
+    def test_camera_without_polygon(self):
+        self.assertIsNone(RegionOfInterest.from_camera(Camera(roi_polygon=None)))
+        self.assertIsNone(RegionOfInterest.from_camera(Camera(roi_polygon=[[0, 0], [1, 1]])))
+        self.assertIsNotNone(RegionOfInterest.from_camera(Camera(roi_polygon=[[0, 0], [0, 1], [1, 1]])))
+
+
+class FrameRingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.name = f"sras_test_{os.getpid()}_{self.id().rsplit('.', 1)[-1]}"[:30]
+        self.ring = FrameRing.create(self.name, (4, 6, 3), slots=3)
+        self.addCleanup(self.close, self.ring)
+
+    @staticmethod
+    def close(ring):
+        if ring.shm is not None and ring.header is not None:
+            ring.close()
+
+    def frame(self, value):
+        return np.full((4, 6, 3), value, dtype=np.uint8)
+
+    def test_readers_see_published_frames(self):
+        reader = FrameRing.attach(self.name, track=True)  # same process as the writer, like the engine
+        self.addCleanup(self.close, reader)
+        self.assertIsNone(reader.read())
+        self.assertEqual(self.ring.publish(self.frame(1), captured_at=5.0), 0)
+        self.ring.publish(self.frame(2), captured_at=6.0)
+        latest = reader.read()
+        self.assertEqual((latest.seq, latest.captured_at, int(latest.frame[0, 0, 0])), (1, 6.0, 2))
+        self.assertEqual(int(reader.read(0).frame[0, 0, 0]), 1)
+        self.assertEqual(reader.wait_next(0, timeout=0), 1)
+        self.assertIsNone(reader.wait_next(1, timeout=0.01))
+        self.assertEqual(reader.writer_pid, os.getpid())
+
+    def test_lapped_and_torn_frames_are_not_returned(self):
+        for value in range(5):
+            self.ring.publish(self.frame(value))
+        self.assertIsNone(self.ring.read(1))  # overwritten: the ring holds the last 3
+        self.assertEqual(int(self.ring.read(2).frame[0, 0, 0]), 2)
+        self.ring.seqs[4 % 3][0] = -1  # writer mid-way through replacing the slot
+        self.assertIsNone(self.ring.read(4))
+        view = self.ring.read(3, copy=False)
+        self.assertTrue(self.ring.still_valid(3))
+        self.ring.publish(self.frame(8))
+        self.ring.publish(self.frame(9))  # seq 6 laps slot 0, where frame 3 lives
+        self.assertFalse(self.ring.still_valid(view.seq))
+
+    def test_frames_of_another_size_are_resized(self):
+        seq = self.ring.publish(np.full((8, 12, 3), 7, dtype=np.uint8))
+        self.assertEqual(self.ring.read(seq).frame.shape, (4, 6, 3))
+
+    def test_takes_over_a_dead_writers_ring(self):
+        self.ring.header[6] = 2 ** 22 + 12345  # above any pid_max: no such process
+        ring = FrameRing.create(self.name, (4, 6, 3), slots=3)
+        self.addCleanup(self.close, ring)
+        self.assertEqual(ring.writer_pid, os.getpid())
+
+    def test_refuses_a_live_writers_ring(self):
+        parent = os.getppid()
+        self.ring.header[6], self.ring.header[11] = parent, _process_start(parent)
+        with self.assertRaises(RingInUse):
+            FrameRing.create(self.name, (4, 6, 3), slots=3)
+
+    def test_takes_over_when_the_writer_pid_was_reused(self):
+        parent = os.getppid()
+        if not _process_start(parent):
+            self.skipTest('process start times are not available here')
+        self.ring.header[6], self.ring.header[11] = parent, _process_start(parent) + 1
+        ring = FrameRing.create(self.name, (4, 6, 3), slots=3)
+        self.addCleanup(self.close, ring)
+        self.assertEqual(ring.writer_pid, os.getpid())
+
+
+class BatchSchedulerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.stop = threading.Event()
+        self.ids = iter(range(1000))
+
+    def put(self, scheduler, camera, images=1, key='detector'):
+        request = Request(None, next(self.ids), camera, key, [None] * images)
+        scheduler.put(request)
+        return request
+
+    def test_cut_when_every_camera_is_waiting(self):
+        scheduler = BatchScheduler(budget=10.0, max_batch=8)
+        self.put(scheduler, 1)
+        self.put(scheduler, 2)
+        started = time.monotonic()
+        self.assertEqual(len(scheduler.next_batch(self.stop)), 2)
+        self.assertLess(time.monotonic() - started, 1.0)
+
+    def test_cut_at_max_batch(self):
+        scheduler = BatchScheduler(budget=10.0, max_batch=4)
+        self.put(scheduler, 2)  # camera 2 is active but has nothing queued now
+        scheduler.next_batch(self.stop)
+        for _ in range(3):
+            self.put(scheduler, 1, images=2)
+        batch = scheduler.next_batch(self.stop)
+        self.assertEqual([len(r.images) for r in batch], [2, 2])
+        self.assertEqual(len(scheduler.queues[1]), 1)
+
+    def test_cut_on_budget(self):
+        scheduler = BatchScheduler(budget=0.05, max_batch=8)
+        self.put(scheduler, 2)
+        scheduler.next_batch(self.stop)
+        self.put(scheduler, 1)
+        started = time.monotonic()
+        self.assertEqual(len(scheduler.next_batch(self.stop)), 1)  # waited for camera 2, which never came
+        self.assertGreaterEqual(time.monotonic() - started, 0.04)
+
+    def test_oversized_request_still_served(self):
+        scheduler = BatchScheduler(budget=10.0, max_batch=4)
+        self.put(scheduler, 1, images=6)
+        self.assertEqual(len(scheduler.next_batch(self.stop)[0].images), 6)
+
+    def test_only_matching_requests_share_a_batch(self):
+        scheduler = BatchScheduler(budget=0.0, max_batch=8)
+        first = self.put(scheduler, 1, key='detector')
+        self.put(scheduler, 2, key='helmet')
+        third = self.put(scheduler, 2, key='detector')
+        self.assertEqual(scheduler.next_batch(self.stop), [first, third])
+        self.assertEqual(scheduler.next_batch(self.stop)[0].key, 'helmet')
+
+    def test_round_robin_across_cameras(self):
+        scheduler = BatchScheduler(budget=0.0, max_batch=4)
+        for _ in range(4):
+            self.put(scheduler, 1)
+        for _ in range(4):
+            self.put(scheduler, 2)
+        batches = [scheduler.next_batch(self.stop) for _ in range(2)]
+        self.assertEqual([[r.camera for r in batch] for batch in batches], [[1, 2, 1, 2], [2, 1, 2, 1]])
+        for batch in batches:
+            scheduler.record(batch, 0.01)
+        stats = scheduler.stats()
+        self.assertEqual((stats['batches'], stats['avg_batch'], stats['queue_depth']), (2, 4.0, 0))
+        self.assertEqual(stats['cameras']['1']['requests'], 4)
+
+
+def record_at(frame, rider_hash=None, rider_phash=None, source_file='a.mp4'):
+    return ViolationRecord(None, b'jpeg', None, None, rider_hash, phash_to_hex(rider_phash), 0.0,
+                           source_file=source_file, source_frame=frame)
+
+
+class ProcessVideoTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.mkdtemp()
+        cls.video = os.path.join(cls.tmp, 'clip.avi')
+        out = cv2.VideoWriter(cls.video, cv2.VideoWriter_fourcc(*'MJPG'), 10.0, (32, 24))
+        for i in range(25):
+            out.write(np.full((24, 32, 3), i * 10, dtype=np.uint8))
+        out.release()
+        os.utime(cls.video, (1_700_000_000, 1_700_000_000))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+        super().tearDownClass()
+
+    def test_plan_chunks(self):
+        chunks = plan_chunks([self.video], chunk_seconds=1.0, warmup_seconds=0.5)
+        self.assertEqual([(c.start, c.stop, c.warmup) for c in chunks], [(0, 10, 5), (10, 20, 5), (20, 25, 5)])
+        # recorded until the file was last written: started its 2.5 s duration earlier
+        self.assertEqual(chunks[0].recorded_at, datetime.fromtimestamp(1_700_000_000 - 2.5, tz=dt_timezone.utc))
+
+        started = timezone.now()
+        self.assertEqual({c.recorded_at for c in plan_chunks([self.video], 1.0, 0.5, started)}, {started})
+        self.assertEqual(video_clock(started, 12 / 10.0), started + timedelta(seconds=1.2))  # frame 12 at 10 fps
+
+    def test_chunk_writer_keeps_its_own_frames(self):
+        writer = ChunkWriter(VideoChunk(self.video, 10, 20, 5, 10.0, timezone.now()))
+        writer.submit(record_at(None)._replace(captured_at=0.7))   # warm-up frame 7: the previous chunk's
+        writer.submit(record_at(None)._replace(captured_at=1.2))
+        writer.frame = 15
+        writer.submit(record_at(None))                             # no timestamp: the current frame
+        self.assertEqual([r.source_frame for r in writer.records], [12, 15])
+        self.assertEqual({r.source_file for r in writer.records}, {self.video})
+
+    def test_drop_duplicates_across_chunks(self):
+        fps = 10.0
+        records = [
+            record_at(0, rider_hash='a'),
+            record_at(50, rider_hash='a'),                   # same rider 5 s later: dropped
+            record_at(60, rider_phash=0xff00),
+            record_at(70, rider_phash=0xff01),               # 1 bit from the one before: dropped
+            record_at(40, rider_hash='a', source_file='b.mp4'),  # another file: kept
+            record_at(4000, rider_hash='a'),                 # outside the window: kept
+        ]
+        kept = drop_duplicates([(r, fps) for r in records], window=300, max_distance=6)
+        self.assertEqual([(r.source_file, r.source_frame) for r in kept],
+                         [('a.mp4', 0), ('a.mp4', 60), ('a.mp4', 4000), ('b.mp4', 40)])
+
+
+def engine_status():
+    """A StreamEngine.status() with one camera."""
+    return {
+        'running': True, 'uptime_seconds': 12.5, 'models_ready': True,
+        'cameras': [{
+            'id': 1, 'name': 'Gate "A"', 'precision': 'fp32', 'capture_fps': 25.0, 'inference_fps': 5.0,
+            'queue_depth': 0, 'frames_received': 300, 'frames_replaced': 12, 'frames_inferred': 60,
+            'motion_gated': 40, 'tracks': 2, 'pending_evidence': 1,
+            'capture': {'grabbed': 320, 'decoded': 300, 'dropped': 20, 'degraded': False},
+            'viewers': 0,
+        }],
+        'writer': {'queue_depth': 0, 'submitted': 3, 'written': 2, 'duplicates': 1, 'dropped': 0, 'failed': 0},
+        'inference_server': None,
+        'stages': {},
+    }
+
+
+class FakeEngine:
+    """What MJPEGServer needs from a StreamEngine, without cameras or models."""
+
+    def __init__(self):
+        self.timer = StageTimer()
+        self.stop_event = threading.Event()
+        self.streams = []
+
+    def status(self):
+        return engine_status()
+
+    def resolve_stream(self, path):
+        return None
+
+    def profile(self, seconds, sort='cumulative', limit=40):
+        if seconds == 13:
+            raise ProfileBusy('A profile is already running')
+        return f"profiled {seconds:g}s by {sort}\n"
+
+    def memory_report(self, limit=25, key='lineno', frames=1, reset=False, stop=False):
+        return f"memory by {key}, {frames} frame(s)\n"
+
+
+class FakeWriter:
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+
+def http_get(server, path, headers=()):
+    """Run one request through server.handle_client(); returns (status code, headers text, body)."""
+    async def request():
+        reader = asyncio.StreamReader()
+        reader.feed_data(f"GET {path} HTTP/1.1\r\n".encode()
+                         + b"".join(f"{header}\r\n".encode() for header in headers) + b"\r\n")
+        reader.feed_eof()
+        writer = FakeWriter()
+        await server.handle_client(reader, writer)
+        return bytes(writer.data)
+
+    head, _, body = asyncio.run(request()).partition(b"\r\n\r\n")
+    head = head.decode('latin-1')
+    return int(head.split()[1]), head, body
+
+
+class MetricsTests(SimpleTestCase):
+
+    def test_render_prometheus(self):
+        timer = StageTimer()
+        timer.record('detector', 0.004)
+        timer.record('detector', 0.2)
+        lines = render_prometheus(engine_status(), timer).splitlines()
+        camera = 'camera="1",name="Gate \\"A\\""'
+        for line in ('# TYPE sras_frames_inferred_total counter',
+                     f'sras_frames_inferred_total{{{camera}}} 60',
+                     f'sras_fps{{{camera},kind="capture"}} 25',
+                     f'sras_frames_dropped_total{{{camera},reason="queue"}} 12',
+                     f'sras_frames_dropped_total{{{camera},reason="undecoded"}} 20',
+                     f'sras_capture_degraded{{{camera}}} 0',
+                     f'sras_pending_evidence{{{camera}}} 1',
+                     'sras_violations_duplicates_total 1',
+                     '# TYPE sras_stage_seconds histogram',
+                     'sras_stage_seconds_bucket{stage="detector",le="0.0025"} 0',
+                     'sras_stage_seconds_bucket{stage="detector",le="0.005"} 1',
+                     'sras_stage_seconds_bucket{stage="detector",le="0.25"} 2',
+                     'sras_stage_seconds_bucket{stage="detector",le="+Inf"} 2',
+                     'sras_stage_seconds_count{stage="detector"} 2'):
+            self.assertIn(line, lines)
+
+    def test_stage_summary(self):
+        timer = StageTimer()
+        for ms in range(1, 101):
+            timer.record('tracking', ms / 1000)
+        summary = timer.summary()['tracking']
+        self.assertEqual(summary['count'], 100)
+        self.assertAlmostEqual(summary['p50_ms'], 50.5, places=3)
+        self.assertEqual(summary['max_ms'], 100.0)
+
+    def test_metrics_and_status_endpoints(self):
+        server = MJPEGServer(FakeEngine())
+        server.camera_viewers[1] = 2
+        code, head, body = http_get(server, '/metrics')
+        self.assertEqual(code, 200)
+        self.assertIn('text/plain; version=0.0.4', head)
+        self.assertIn(b'sras_viewers{camera="1",name="Gate \\"A\\""} 2', body)
+
+        code, head, body = http_get(server, '/status')
+        self.assertEqual(code, 200)
+        self.assertEqual(json.loads(body)['cameras'][0]['viewers'], 2)
+        self.assertEqual(http_get(server, '/video/9')[0], 404)
+
+
+class DebugEndpointTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = MJPEGServer(FakeEngine(), admin_token='s3cret')
+
+    def test_disabled_without_a_token(self):
+        server = MJPEGServer(FakeEngine())
+        self.assertEqual(http_get(server, '/debug/memory')[0], 404)
+        self.assertEqual(http_get(server, '/debug/memory', ['X-Admin-Token: '])[0], 404)
+
+    def test_token_required(self):
+        self.assertEqual(http_get(self.server, '/debug/profile?seconds=1')[0], 403)
+        self.assertEqual(http_get(self.server, '/debug/profile?seconds=1', ['X-Admin-Token: wrong'])[0], 403)
+        self.assertEqual(http_get(self.server, '/debug/profile?seconds=1', ['Authorization: Basic s3cret'])[0], 403)
+
+        code, _, body = http_get(self.server, '/debug/profile?seconds=1&sort=tottime',
+                                 ['Authorization: Bearer s3cret'])
+        self.assertEqual((code, body), (200, b'profiled 1s by tottime\n'))
+        code, _, body = http_get(self.server, '/debug/memory?key=traceback', ['X-Admin-Token: s3cret'])
+        self.assertEqual((code, body), (200, b'memory by traceback, 10 frame(s)\n'))
+
+    def test_bad_parameters_and_busy(self):
+        admin = ['X-Admin-Token: s3cret']
+        for path in ('/debug/profile?seconds=0', '/debug/profile?seconds=61', '/debug/profile?sort=name',
+                     '/debug/profile?limit=x', '/debug/memory?key=size', '/debug/memory?frames=0'):
+            self.assertEqual(http_get(self.server, path, admin)[0], 400, path)
+        self.assertEqual(http_get(self.server, '/debug/other', admin)[0], 404)
+        self.assertEqual(http_get(self.server, '/debug/profile?seconds=13', admin)[0], 409)
+
+
+class ThreadProfilerTests(SimpleTestCase):
+
+    def test_profiles_checkpointing_threads(self):
+        profiler = ThreadProfiler()
+        stop = threading.Event()
+
+        def busy_loop():
+            while not stop.is_set():
+                profiler.checkpoint()
+                sum(range(1000))
+                time.sleep(0.001)
+
+        worker = threading.Thread(target=busy_loop, name='inference')
+        worker.start()
+        try:
+            report = profiler.profile(0.2, sort='tottime', limit=5)
+        finally:
+            stop.set()
+            worker.join()
+        self.assertIn('Profiled 0.2s of thread(s): inference', report)
+        self.assertIn('builtins.sum', report)  # work done in the thread's loop
+        self.assertIsNone(profiler.window)
+
+    def test_one_profile_at_a_time(self):
+        profiler = ThreadProfiler()
+        worker = threading.Thread(target=profiler.profile, args=(0.2,))
+        worker.start()
+        try:
+            self.assertTrue(wait_for(lambda: profiler.window is not None, timeout=5))
+            with self.assertRaises(ProfileBusy):
+                profiler.profile(0.1)
+        finally:
+            worker.join()
@@ -0,0 +1,5 @@
+"""
+Building blocks for the MJPEG stream / helmet detection pipeline (stream_mjpeg.py).
+
+Modules here import Django models, so django.setup() must run before importing them.
+"""
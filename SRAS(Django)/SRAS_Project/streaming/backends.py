@@ -0,0 +1,335 @@
+"""
+Inference backends for the YOLO models used by the stream pipeline.
+
+Every backend exposes the same small interface used by streaming/detection.py:
+
+    backend.names                      -> {class_id: label}
+    backend.predict(images, conf, imgsz) -> [ (N, 6) float32 arrays of x1, y1, x2, y2, conf, cls ]
+    backend.warmup(runs)               -> seconds spent
+
+Boxes come back in the coordinates of each input image. `imgsz` may be an
+int (square) or (h, w), so the 640x360 detector frame can run on a 384x640
+tensor instead of being padded back up to 640x640.
+"""
+import ast
+import os
+import time
+
+import cv2
+import numpy as np
+
+
+PYTORCH = 'pytorch'
+ONNX = 'onnx'
+OPENVINO = 'openvino'
+STUB = 'stub'
+BACKENDS = (PYTORCH, ONNX, OPENVINO)
+
+FP32 = 'fp32'
+INT8 = 'int8'
+PRECISIONS = (FP32, INT8)
+
+NMS_IOU = 0.7   # same default as ultralytics
+STRIDE = 32
+
+
+def rect_imgsz(width, height, stride=STRIDE):
+    """Smallest (h, w) multiple of `stride` that holds a width x height image."""
+    return (int(np.ceil(height / stride) * stride), int(np.ceil(width / stride) * stride))
+
+
+def as_hw(imgsz):
+    if isinstance(imgsz, int):
+        return imgsz, imgsz
+    return int(imgsz[0]), int(imgsz[1])
+
+
+def exported_path(weights, backend, precision=FP32):
+    """
+    Where `yolo export` puts a model: yolov8n.pt -> yolov8n.onnx / yolov8n_openvino_model/.
+    INT8 models from `manage.py quantize_models` sit next to them as
+    yolov8n_int8.onnx / yolov8n_int8_openvino_model/.
+    """
+    stem, _ = os.path.splitext(weights)
+    if precision == INT8:
+        stem += '_int8'
+    if backend == ONNX:
+        return stem + '.onnx'
+    if backend == OPENVINO:
+        return stem + '_openvino_model'
+    return weights
+
+
+class UltralyticsBackend:
+    """PyTorch (or any format ultralytics can load itself) through the YOLO API."""
+
+    kind = PYTORCH
+
+    def __init__(self, weights, imgsz=640, threads=None):
+        from ultralytics import YOLO
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.weights = weights
+        self.imgsz = imgsz
+        self.model = YOLO(weights)
+        self.names = self.model.names
+
+    def predict(self, images, conf=0.25, imgsz=None):
+        results = self.model(list(images), conf=conf, imgsz=imgsz or self.imgsz, verbose=False)
+        out = []
+        for result in results:
+            data = result.boxes.data if result.boxes is not None else None
+            if data is None or len(data) == 0:
+                out.append(np.zeros((0, 6), np.float32))
+            else:
+                out.append(data.cpu().numpy().astype(np.float32))
+        return out
+
+    def warmup(self, runs=2):
+        h, w = as_hw(self.imgsz)
+        started = time.perf_counter()
+        for _ in range(runs):
+            self.predict([np.zeros((h, w, 3), np.uint8)])
+        return time.perf_counter() - started
+
+
+class ExportedYOLOBackend:
+    """
+    Shared pre/post-processing for raw exported YOLOv8 graphs
+    (input: 1x3xHxW float RGB 0..1, output: B x (4 + nc) x anchors).
+    Subclasses only implement _load() and _run().
+    """
+
+    kind = None
+
+    def __init__(self, weights, imgsz=640, threads=None):
+        self.weights = weights
+        self.imgsz = imgsz
+        self.threads = threads or os.cpu_count()
+        self.dynamic_batch = False
+        self.fixed_hw = None  # (h, w) when the graph was exported with a static shape
+        self.names = {}
+        self._load()
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _run(self, blob):
+        raise NotImplementedError
+
+    def _preprocess(self, image, hw):
+        h, w = hw
+        ih, iw = image.shape[:2]
+        scale = min(w / iw, h / ih)
+        nw, nh = int(round(iw * scale)), int(round(ih * scale))
+        pad_x, pad_y = (w - nw) // 2, (h - nh) // 2
+        canvas = np.full((h, w, 3), 114, dtype=np.uint8)
+        canvas[pad_y:pad_y + nh, pad_x:pad_x + nw] = cv2.resize(image, (nw, nh), interpolation=cv2.INTER_LINEAR)
+        blob = cv2.dnn.blobFromImage(canvas, 1 / 255.0, swapRB=True)
+        return blob, scale, (pad_x, pad_y)
+
+    def _postprocess(self, output, conf, scale, pad, shape):
+        preds = output.T  # anchors x (4 + nc)
+        scores = preds[:, 4:]
+        cls = scores.argmax(axis=1)
+        best = scores[np.arange(len(cls)), cls]
+        keep = best >= conf
+        if not np.any(keep):
+            return np.zeros((0, 6), np.float32)
+        boxes, best, cls = preds[keep, :4], best[keep], cls[keep]
+        xywh = np.concatenate([boxes[:, :2] - boxes[:, 2:] / 2, boxes[:, 2:]], axis=1)
+        idx = cv2.dnn.NMSBoxesBatched(xywh.tolist(), best.tolist(), cls.tolist(), conf, NMS_IOU)
+        idx = np.array(idx, dtype=np.int64).reshape(-1)
+        if idx.size == 0:
+            return np.zeros((0, 6), np.float32)
+        xyxy = np.concatenate([xywh[idx, :2], xywh[idx, :2] + xywh[idx, 2:]], axis=1)
+        xyxy = (xyxy - np.array([pad[0], pad[1], pad[0], pad[1]], dtype=np.float32)) / scale
+        xyxy[:, 0::2] = np.clip(xyxy[:, 0::2], 0, shape[1])
+        xyxy[:, 1::2] = np.clip(xyxy[:, 1::2], 0, shape[0])
+        return np.concatenate([xyxy, best[idx, None], cls[idx, None]], axis=1).astype(np.float32)
+
+    def predict(self, images, conf=0.25, imgsz=None):
+        hw = self.fixed_hw or as_hw(imgsz or self.imgsz)
+        prepared = [self._preprocess(image, hw) for image in images]
+        if not prepared:
+            return []
+        if self.dynamic_batch:
+            outputs = self._run(np.concatenate([p[0] for p in prepared]))
+        else:
+            outputs = np.concatenate([self._run(p[0]) for p in prepared])
+        return [
+            self._postprocess(output, conf, scale, pad, image.shape)
+            for output, (_, scale, pad), image in zip(outputs, prepared, images)
+        ]
+
+    def warmup(self, runs=2):
+        h, w = self.fixed_hw or as_hw(self.imgsz)
+        started = time.perf_counter()
+        for _ in range(runs):
+            self.predict([np.zeros((h, w, 3), np.uint8)])
+        return time.perf_counter() - started
+
+
+def _parse_names(raw):
+    if isinstance(raw, dict):
+        return {int(k): v for k, v in raw.items()}
+    try:
+        return {int(k): v for k, v in ast.literal_eval(raw).items()}
+    except (ValueError, SyntaxError, AttributeError):
+        return {}
+
+
+class OnnxRuntimeBackend(ExportedYOLOBackend):
+    kind = ONNX
+
+    def _load(self):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("The ONNX backend needs onnxruntime (pip install onnxruntime)") from e
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(self.weights, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, h, w = model_input.shape
+        self.dynamic_batch = not isinstance(batch, int)
+        if isinstance(h, int) and isinstance(w, int):
+            self.fixed_hw = (h, w)
+        self.names = _parse_names(self.session.get_modelmeta().custom_metadata_map.get('names', '{}'))
+
+    def _run(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVINOBackend(ExportedYOLOBackend):
+    kind = OPENVINO
+
+    def _load(self):
+        try:
+            import openvino as ov
+        except ImportError as e:
+            raise ImportError("The OpenVINO backend needs openvino (pip install openvino)") from e
+        xml = self.weights
+        if os.path.isdir(xml):
+            xml = next(os.path.join(xml, f) for f in sorted(os.listdir(xml)) if f.endswith('.xml'))
+        core = ov.Core()
+        model = core.read_model(xml)
+        shape = model.inputs[0].get_partial_shape()
+        self.dynamic_batch = shape[0].is_dynamic
+        if shape[2].is_static and shape[3].is_static:
+            self.fixed_hw = (shape[2].get_length(), shape[3].get_length())
+        self.compiled = core.compile_model(model, 'CPU', {
+            'INFERENCE_NUM_THREADS': self.threads,
+            'PERFORMANCE_HINT': 'LATENCY',
+        })
+        self.output = self.compiled.outputs[0]
+        metadata = os.path.join(os.path.dirname(xml), 'metadata.yaml')
+        if os.path.exists(metadata):
+            import yaml
+            with open(metadata) as f:
+                self.names = _parse_names((yaml.safe_load(f) or {}).get('names', {}))
+
+    def _run(self, blob):
+        return self.compiled([blob])[self.output]
+
+
+class StubBackend:
+    """
+    Model stand-in for tests, benchmarks and demos: returns the same boxes,
+    given as (x1, y1, x2, y2, conf, cls) in 0..1 image coordinates, for every
+    image, optionally after a fixed `delay` to mimic inference time.
+    """
+
+    kind = STUB
+
+    def __init__(self, names, boxes=(), delay=0.0):
+        self.names = dict(names)
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 6)
+        self.delay = delay
+        self.imgsz = 640
+        self.precision = FP32
+
+    def predict(self, images, conf=0.25, imgsz=None):
+        if self.delay:
+            time.sleep(self.delay)
+        out = []
+        for image in images:
+            h, w = image.shape[:2]
+            boxes = self.boxes[self.boxes[:, 4] >= conf].copy()
+            boxes[:, [0, 2]] *= w
+            boxes[:, [1, 3]] *= h
+            out.append(boxes)
+        return out
+
+    def warmup(self, runs=2):
+        return 0.0
+
+
+STUB_DETECTOR_NAMES = {0: 'person', 3: 'motorcycle'}
+STUB_HELMET_NAMES = {0: 'helmet', 1: 'no helmet', 2: 'plate_ABC_123'}
+
+
+def stub_backend(role, no_helmet=True, delay=0.0):
+    """A StubBackend for 'detector' (one rider mid-frame) or 'helmet' (helmet verdict + plate)."""
+    if role == 'detector':
+        return StubBackend(STUB_DETECTOR_NAMES, [
+            [0.40, 0.30, 0.55, 0.80, 0.9, 0],
+            [0.38, 0.50, 0.57, 0.90, 0.9, 3],
+        ], delay)
+    return StubBackend(STUB_HELMET_NAMES, [
+        [0.30, 0.00, 0.70, 0.20, 0.9, 1 if no_helmet else 0],
+        [0.35, 0.85, 0.65, 0.95, 0.8, 2],
+    ], delay)
+
+
+def load_backend(kind, weights, imgsz=640, threads=None, warmup=0, precision=FP32):
+    """
+    Build a backend by name. `weights` is the .pt path; for exported backends
+    the matching exported file next to it is used (see exported_path()).
+    INT8 is only available for the exported backends.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}' (expected one of {', '.join(PRECISIONS)})")
+    if kind == PYTORCH:
+        if precision != FP32:
+            raise ValueError("INT8 models need the onnx or openvino backend")
+        backend = UltralyticsBackend(weights, imgsz=imgsz, threads=threads)
+    elif kind == ONNX:
+        backend = OnnxRuntimeBackend(exported_path(weights, ONNX, precision), imgsz=imgsz, threads=threads)
+    elif kind == OPENVINO:
+        backend = OpenVINOBackend(exported_path(weights, OPENVINO, precision), imgsz=imgsz, threads=threads)
+    else:
+        raise ValueError(f"Unknown inference backend '{kind}' (expected one of {', '.join(BACKENDS)})")
+    backend.precision = precision
+    if warmup:
+        backend.warmup(warmup)
+    return backend
+
+
+def load_configured(config, role, precision=FP32):
+    """
+    Model loader for StreamEngine: the 'detector' or 'helmet' model as set up
+    in stream_mjpeg.py's settings. Module-level (with functools.partial) so it
+    can be handed to a spawned inference server process.
+    """
+    if role == 'detector':
+        return load_backend(config.INFERENCE_BACKEND, config.PRETRAINED_MODEL_PATH, imgsz=config.DETECTOR_IMGSZ,
+                            threads=config.INFERENCE_THREADS, warmup=config.WARMUP_RUNS, precision=precision)
+    return load_backend(config.INFERENCE_BACKEND, config.CUSTOM_MODEL_PATH, imgsz=config.RIDER_CROP_SIZE,
+                        threads=config.INFERENCE_THREADS, warmup=config.WARMUP_RUNS, precision=precision)
+
+
+def stub_loader(role, precision=FP32):
+    """Model loader that returns stub_backend(role) for either precision."""
+    return stub_backend(role)
+
+
+def export_model(weights, kind, imgsz, dynamic=False, **kwargs):
+    """Export a .pt model with ultralytics; returns the path of the exported model."""
+    from ultralytics import YOLO
+    fmt = {ONNX: 'onnx', OPENVINO: 'openvino'}[kind]
+    return YOLO(weights).export(format=fmt, imgsz=imgsz, dynamic=dynamic, **kwargs)
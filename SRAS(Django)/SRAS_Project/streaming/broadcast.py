@@ -0,0 +1,90 @@
+import asyncio
+import threading
+
+import cv2
+import numpy as np
+
+from .metrics import NULL_TIMER
+
+
+class FrameBroadcaster:
+    """
+    Holds the latest annotated frame for one camera and JPEG-encodes it at most
+    once per frame. Every connected client writes the same shared bytes.
+
+    Publishing bumps a sequence number and wakes waiters, so consumers block
+    until a new frame exists instead of polling on a fixed interval.
+    """
+
+    def __init__(self, quality=80, timer=NULL_TIMER):
+        self.quality = quality
+        self.timer = timer
+        self.lock = threading.Lock()
+        self.encode_lock = threading.Lock()
+        self.new_frame = threading.Condition(self.lock)
+        self.frame = None
+        self.seq = 0
+        self.jpeg = None
+        self.jpeg_seq = -1
+        self.loop = None
+        self.async_event = None
+
+    def attach_loop(self, loop):
+        """Let coroutines on `loop` wait for frames via wait_async()."""
+        self.loop = loop
+        self.async_event = asyncio.Event()
+
+    def _notify_async(self):
+        # swap in a fresh event so the next wait does not see a stale set()
+        event, self.async_event = self.async_event, asyncio.Event()
+        event.set()
+
+    def publish(self, frame):
+        with self.lock:
+            self.frame = frame
+            self.seq += 1
+            self.new_frame.notify_all()
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._notify_async)
+
+    def wait(self, last_seq, timeout=None):
+        """Block the calling thread until seq moves past last_seq. Returns True on a new frame."""
+        with self.lock:
+            return self.new_frame.wait_for(lambda: self.seq != last_seq, timeout=timeout)
+
+    async def wait_async(self, last_seq, timeout=None):
+        """Coroutine version of wait(); must run on the attached loop."""
+        if self.seq != last_seq:
+            return True
+        try:
+            await asyncio.wait_for(self.async_event.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def latest(self):
+        """Return (seq, jpeg_bytes), encoding only if this seq has not been encoded yet."""
+        # encode outside self.lock: publish() takes it for every captured frame, and capture must not
+        # wait for a viewer's encode. encode_lock keeps concurrent viewers from encoding the same frame twice.
+        with self.encode_lock:
+            with self.lock:
+                if self.jpeg is not None and self.jpeg_seq == self.seq:
+                    return self.jpeg_seq, self.jpeg
+                seq, frame = self.seq, self.frame  # published frames are never modified, so no copy
+            if frame is None:
+                frame = np.zeros((480, 640, 3), dtype=np.uint8)
+            with self.timer.stage('encode'):
+                ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            with self.lock:
+                if ok and seq > self.jpeg_seq:
+                    self.jpeg = jpeg.tobytes()
+                    self.jpeg_seq = seq
+                return self.jpeg_seq, self.jpeg
+
+    def peek(self):
+        """Return (seq, jpeg_bytes) if the current frame is already encoded, else None."""
+        with self.lock:
+            if self.jpeg is not None and self.jpeg_seq == self.seq:
+                return self.jpeg_seq, self.jpeg
+            return None
@@ -0,0 +1,118 @@
+import threading
+from collections import deque
+
+from streaming.detection import KIND_NO_HELMET, KIND_HELMET
+
+
+# Per-track decisions
+UNDECIDED = 0
+HELMET = 1
+NO_HELMET = 2
+
+
+class TrackState:
+    __slots__ = ('votes', 'decision', 'last_checked', 'confidence', 'detections', 'crop_size', 'done')
+
+    def __init__(self, window):
+        self.votes = deque(maxlen=window)  # True = this check saw "no helmet"
+        self.decision = UNDECIDED
+        self.last_checked = None
+        self.confidence = 0.0               # confidence behind the last helmet/no-helmet call
+        self.detections = []                # last second-stage detections, crop coordinates
+        self.crop_size = (1, 1)             # (w, h) of the crop those detections refer to
+        self.done = False                   # violation recorded, never re-check
+
+
+class TrackClassifier:
+    """
+    Caches helmet/plate classification per tracked rider.
+
+    A new track is classified on every inferred frame until k of its last n
+    checks agree: k "no helmet" votes declare a violation, k clean checks with
+    a confident helmet settle the track. Settled tracks skip the second stage
+    and are only re-checked every `recheck_after` seconds; low-confidence
+    checks never settle, so those riders keep being classified.
+    """
+
+    def __init__(self, window=5, votes_needed=3, recheck_after=2.0, settle_conf=0.6):
+        self.window = window
+        self.votes_needed = votes_needed
+        self.recheck_after = recheck_after
+        self.settle_conf = settle_conf
+        self.tracks = {}
+        self.lock = threading.Lock()
+        self.checks = 0
+        self.skips = 0
+
+    def needs_check(self, track_id, now):
+        with self.lock:
+            state = self.tracks.get(track_id)
+            if state is None:
+                needed = True
+            elif state.done:
+                needed = False
+            elif state.decision == HELMET:
+                needed = now - state.last_checked >= self.recheck_after
+            else:
+                needed = True
+            if needed:
+                self.checks += 1
+            else:
+                self.skips += 1
+            return needed
+
+    def record(self, track_id, now, detections, crop_size):
+        """Add one second-stage result for a track and return its decision."""
+        no_helmet = [d.conf for d in detections if d.kind == KIND_NO_HELMET]
+        helmet = [d.conf for d in detections if d.kind == KIND_HELMET]
+        with self.lock:
+            state = self.tracks.get(track_id)
+            if state is None:
+                state = self.tracks[track_id] = TrackState(self.window)
+            state.last_checked = now
+            state.detections = list(detections)
+            state.crop_size = crop_size
+            state.votes.append(bool(no_helmet))
+
+            recent = list(state.votes)[-self.votes_needed:]
+            if sum(state.votes) >= self.votes_needed:
+                state.decision = NO_HELMET
+                state.confidence = max(no_helmet) if no_helmet else state.confidence
+            elif (len(recent) >= self.votes_needed and not any(recent)
+                  and helmet and max(helmet) >= self.settle_conf):
+                state.decision = HELMET
+                state.confidence = max(helmet)
+            else:
+                # a helmet call that is re-checked and not confirmed goes back to voting
+                state.decision = UNDECIDED
+            return state.decision
+
+    def mark_done(self, track_id):
+        """The track has its violation; skip it for the rest of its life."""
+        with self.lock:
+            state = self.tracks.get(track_id)
+            if state is not None:
+                state.done = True
+
+    def cached(self, track_id, crop_size):
+        """Last detections of a track rescaled to a crop of `crop_size` (w, h)."""
+        with self.lock:
+            state = self.tracks.get(track_id)
+            if state is None or not state.detections:
+                return []
+            sx = crop_size[0] / max(1, state.crop_size[0])
+            sy = crop_size[1] / max(1, state.crop_size[1])
+            return [
+                d._replace(x1=int(d.x1 * sx), y1=int(d.y1 * sy), x2=int(d.x2 * sx), y2=int(d.y2 * sy))
+                for d in state.detections
+            ]
+
+    def decision(self, track_id):
+        with self.lock:
+            state = self.tracks.get(track_id)
+            return state.decision if state is not None else UNDECIDED
+
+    def forget(self, track_ids):
+        with self.lock:
+            for track_id in track_ids:
+                self.tracks.pop(track_id, None)
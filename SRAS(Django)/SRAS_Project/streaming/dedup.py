@@ -0,0 +1,233 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+import cv2
+import numpy as np
+from django.utils import timezone
+
+from SRAS_App.models import Violation
+
+
+def create_rider_hash(rider_crop, plate_number=None):
+    """Exact hash (md5) of a blurred 32x32 grayscale rider crop, salted with the plate number."""
+    try:
+        resized = cv2.resize(rider_crop, (32, 32))
+        gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
+        blurred = cv2.GaussianBlur(gray, (3, 3), 0)
+        image_hash = hashlib.md5(blurred.tobytes()).hexdigest()
+        if plate_number and plate_number.strip():
+            combined = f"{image_hash}_{plate_number.strip()}"
+            return hashlib.md5(combined.encode()).hexdigest()
+        return image_hash
+    except Exception as e:
+        print(f"Error creating rider hash: {e}")
+        return None
+
+
+def create_rider_phash(rider_crop):
+    """
+    64-bit difference hash (dHash) of a rider crop.
+
+    The crop is shrunk to 9x8 grayscale and each bit records whether a pixel is
+    brighter than its right neighbour, so small shifts, blur and JPEG noise flip
+    only a few bits. Compare two hashes with hamming().
+    """
+    try:
+        gray = rider_crop if rider_crop.ndim == 2 else cv2.cvtColor(rider_crop, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+        bits = (small[:, 1:] > small[:, :-1]).flatten()
+        return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+    except Exception as e:
+        print(f"Error creating rider phash: {e}")
+        return None
+
+
+def phash_to_hex(value):
+    return None if value is None else f"{value:016x}"
+
+
+def phash_from_hex(text):
+    try:
+        return int(text, 16) if text else None
+    except ValueError:
+        return None
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class TTLHashSet:
+    """
+    Set of rider hashes that forget entries `ttl` seconds after they were added.
+
+    Entries live in an OrderedDict in insertion order, so insert, lookup and
+    expiry are all O(1) amortized: expiry only ever pops from the front until
+    it reaches an entry that is still fresh. Insertion order is expiry order
+    except for entries added with an explicit `expires_at` (warm_from_db, which
+    may run while live hashes are being added), so lookups also check the
+    entry's own expiry rather than trusting the front-popping alone.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.entries = OrderedDict()  # hash -> expiry (time.monotonic())
+        self.lock = threading.Lock()
+
+    def _expire(self, now):
+        entries = self.entries
+        while entries:
+            key, expires_at = next(iter(entries.items()))
+            if expires_at > now:
+                break
+            entries.popitem(last=False)
+
+    def add(self, key, expires_at=None):
+        if not key:
+            return
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            self.entries[key] = expires_at if expires_at is not None else now + self.ttl
+            # re-adding refreshes the entry: move it to the back with the other fresh ones
+            self.entries.move_to_end(key)
+
+    def __contains__(self, key):
+        if not key:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            return self.entries.get(key, now) > now
+
+    def __len__(self):
+        with self.lock:
+            self._expire(time.monotonic())
+            return len(self.entries)
+
+    def warm_from_db(self):
+        """Load hashes of violations recorded within the last `ttl` seconds (one indexed query)."""
+        now_wall = timezone.now()
+        now = time.monotonic()
+        rows = (
+            Violation.objects
+            .filter(timestamp__gte=now_wall - timedelta(seconds=self.ttl), rider_hash__isnull=False)
+            .order_by('timestamp')
+            .values_list('rider_hash', 'timestamp')
+        )
+        count = 0
+        for rider_hash, ts in rows:
+            # keep the remaining lifetime the hash would have had in a long-running process
+            self.add(rider_hash, expires_at=now + self.ttl - (now_wall - ts).total_seconds())
+            count += 1
+        return count
+
+
+class HammingIndex:
+    """
+    Near-duplicate index for 64-bit perceptual hashes with a time-to-live.
+
+    Multi-index hashing: the hash is cut into max_distance + 1 disjoint chunks,
+    each with its own exact-match table. By the pigeonhole principle any hash
+    within max_distance bits of a query agrees with it exactly on at least one
+    chunk, so a lookup only verifies the few entries sharing a chunk instead of
+    scanning everything. Entries expire in insertion order like TTLHashSet, and
+    lookups skip any that have expired behind a fresher one.
+    """
+
+    def __init__(self, max_distance=6, ttl=300, bits=64):
+        self.max_distance = max_distance
+        self.ttl = ttl
+        parts = max_distance + 1
+        base, extra = divmod(bits, parts)
+        self.chunks = []  # (shift, mask) per table
+        shift = 0
+        for i in range(parts):
+            width = base + (1 if i < extra else 0)
+            self.chunks.append((shift, (1 << width) - 1))
+            shift += width
+        self.tables = [{} for _ in self.chunks]  # chunk value -> set of entry ids
+        self.entries = OrderedDict()             # entry id -> (hash, expiry)
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    def _keys(self, value):
+        return [(value >> shift) & mask for shift, mask in self.chunks]
+
+    def _expire(self, now):
+        entries = self.entries
+        while entries:
+            entry_id, (value, expires_at) = next(iter(entries.items()))
+            if expires_at > now:
+                break
+            entries.popitem(last=False)
+            for table, key in zip(self.tables, self._keys(value)):
+                bucket = table.get(key)
+                if bucket is not None:
+                    bucket.discard(entry_id)
+                    if not bucket:
+                        del table[key]
+
+    def add(self, value, expires_at=None):
+        if value is None:
+            return
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            entry_id = self.next_id
+            self.next_id += 1
+            self.entries[entry_id] = (value, expires_at if expires_at is not None else now + self.ttl)
+            for table, key in zip(self.tables, self._keys(value)):
+                table.setdefault(key, set()).add(entry_id)
+
+    def nearest(self, value, max_distance=None):
+        """Return (distance, hash) of the closest live entry within max_distance, or None."""
+        if value is None:
+            return None
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            candidates = set()
+            for table, key in zip(self.tables, self._keys(value)):
+                bucket = table.get(key)
+                if bucket:
+                    candidates.update(bucket)
+            best = None
+            for entry_id in candidates:
+                other, expires_at = self.entries[entry_id]
+                if expires_at <= now:
+                    continue
+                distance = hamming(value, other)
+                if distance <= max_distance and (best is None or distance < best[0]):
+                    best = (distance, other)
+                    if distance == 0:
+                        break
+            return best
+
+    def __len__(self):
+        with self.lock:
+            self._expire(time.monotonic())
+            return len(self.entries)
+
+    def warm_from_db(self):
+        """Load perceptual hashes of violations recorded within the last `ttl` seconds."""
+        now_wall = timezone.now()
+        now = time.monotonic()
+        rows = (
+            Violation.objects
+            .filter(timestamp__gte=now_wall - timedelta(seconds=self.ttl), rider_phash__isnull=False)
+            .order_by('timestamp')
+            .values_list('rider_phash', 'timestamp')
+        )
+        count = 0
+        for text, ts in rows:
+            value = phash_from_hex(text)
+            if value is not None:
+                self.add(value, expires_at=now + self.ttl - (now_wall - ts).total_seconds())
+                count += 1
+        return count
@@ -0,0 +1,244 @@
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from .metrics import NULL_TIMER
+
+
+# Defaults shared by the live stream and offline tools
+DETECTION_RESIZE = (640, 360)  # (w, h) frame size fed to the person/motorcycle detector
+DETECTION_CONF = 0.4
+SECOND_STAGE_CONF = 0.4
+RIDER_CROP_SIZE = 320          # letterbox size (square) for batched rider crops
+MAX_RIDER_BATCH = 16           # upper bound on crops per forward pass
+RIDER_PAIR_IOU = 0.1           # min person/motorcycle IoU to call them one rider
+
+# What a helmet/plate model class means, resolved once per model from its names
+KIND_OTHER = 0
+KIND_NO_HELMET = 1
+KIND_HELMET = 2
+KIND_PLATE = 3
+
+# One helmet/plate detection in rider-crop coordinates
+Detection = namedtuple('Detection', ['x1', 'y1', 'x2', 'y2', 'label', 'kind', 'plate', 'conf'])
+
+_class_tables = {}  # id(model) -> (names, lookup tables), see class_table()
+
+
+def iou(boxA, boxB):
+    xA = max(boxA[0], boxB[0])
+    yA = max(boxA[1], boxB[1])
+    xB = min(boxA[2], boxB[2])
+    yB = min(boxA[3], boxB[3])
+    interW = max(0, xB - xA)
+    interH = max(0, yB - yA)
+    interArea = interW * interH
+    boxAArea = (boxA[2] - boxA[0]) * (boxA[3] - boxA[1])
+    boxBArea = (boxB[2] - boxB[0]) * (boxB[3] - boxB[1])
+    unionArea = boxAArea + boxBArea - interArea
+    return interArea / unionArea if unionArea > 0 else 0.0
+
+
+def iou_matrix(a, b):
+    """Pairwise IoU between (N, 4) and (M, 4) xyxy arrays -> (N, M)."""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    ix1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    iy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    ix2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    iy2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def greedy_assignment(scores, threshold):
+    """
+    One-to-one matching on a score matrix: repeatedly take the highest remaining
+    score above threshold, so each row and each column is used at most once.
+    Returns a list of (row, col).
+    """
+    if scores.size == 0:
+        return []
+    rows, cols = np.nonzero(scores > threshold)
+    if rows.size == 0:
+        return []
+    order = np.argsort(-scores[rows, cols], kind='stable')
+    used_rows, used_cols, pairs = set(), set(), []
+    for k in order:
+        r, c = int(rows[k]), int(cols[k])
+        if r in used_rows or c in used_cols:
+            continue
+        used_rows.add(r)
+        used_cols.add(c)
+        pairs.append((r, c))
+    return pairs
+
+
+def boxes_to_numpy(result):
+    """Split one backend result, an (N, 6) x1, y1, x2, y2, conf, cls array, into xyxy / cls / conf."""
+    data = np.asarray(result, dtype=np.float32).reshape(-1, 6)
+    return data[:, :4], data[:, 5].astype(np.int64), data[:, 4]
+
+
+def class_table(model):
+    """
+    Per-model lookup tables built once from model.names:
+    class ids for person/motorcycle and, per class id, the helmet/plate kind
+    and parsed plate text, so per-box work is an array index instead of
+    string tests.
+    """
+    names = model.names
+    cached = _class_tables.get(id(model))
+    if cached is not None and cached[0] is names:
+        return cached[1]
+
+    size = max(names) + 1 if names else 0
+    kinds = np.full(size, KIND_OTHER, dtype=np.int64)
+    plates = [None] * size
+    person_ids, motorcycle_ids = [], []
+    for cls_id, label in names.items():
+        lowered = label.lower()
+        if label == "person":
+            person_ids.append(cls_id)
+        elif label == "motorcycle":
+            motorcycle_ids.append(cls_id)
+        if "no helmet" in lowered:
+            kinds[cls_id] = KIND_NO_HELMET
+        elif "helmet" in lowered:
+            kinds[cls_id] = KIND_HELMET
+        elif "plate" in lowered:
+            kinds[cls_id] = KIND_PLATE
+            plates[cls_id] = label.replace("plate_", "").replace("_", "")
+    table = {
+        'names': names,
+        'person': np.array(person_ids, dtype=np.int64),
+        'motorcycle': np.array(motorcycle_ids, dtype=np.int64),
+        'kinds': kinds,
+        'plates': plates,
+    }
+    _class_tables[id(model)] = (names, table)
+    return table
+
+
+def pair_riders(xyxy, cls, person_ids, motorcycle_ids, threshold=RIDER_PAIR_IOU):
+    """
+    Pair persons with motorcycles one-to-one on their IoU matrix.
+    Returns (K, 4) union boxes (same coordinate space as xyxy).
+    """
+    persons = xyxy[np.isin(cls, person_ids)]
+    motorcycles = xyxy[np.isin(cls, motorcycle_ids)]
+    if len(persons) == 0 or len(motorcycles) == 0:
+        return np.zeros((0, 4), np.float32)
+    pairs = greedy_assignment(iou_matrix(persons, motorcycles), threshold)
+    if not pairs:
+        return np.zeros((0, 4), np.float32)
+    p_idx, m_idx = np.array(pairs).T
+    p, m = persons[p_idx], motorcycles[m_idx]
+    return np.concatenate([np.minimum(p[:, :2], m[:, :2]), np.maximum(p[:, 2:], m[:, 2:])], axis=1)
+
+
+def letterbox(image, size=RIDER_CROP_SIZE, color=(114, 114, 114)):
+    """
+    Resize an image to fit a size x size canvas keeping aspect ratio.
+
+    Returns:
+        (canvas, scale, (pad_x, pad_y)) so boxes can be mapped back with
+        (x - pad_x) / scale and (y - pad_y) / scale.
+    """
+    h, w = image.shape[:2]
+    scale = min(size / w, size / h)
+    new_w = max(1, int(round(w * scale)))
+    new_h = max(1, int(round(h * scale)))
+    resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    pad_x = (size - new_w) // 2
+    pad_y = (size - new_h) // 2
+    canvas = np.full((size, size, 3), color, dtype=np.uint8)
+    canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = resized
+    return canvas, scale, (pad_x, pad_y)
+
+
+def detect_riders(model, frame, resize=DETECTION_RESIZE, conf=DETECTION_CONF, region=None, timer=NULL_TIMER):
+    """
+    Run the person/motorcycle detector (a streaming.backends backend) and pair each person with an overlapping
+    motorcycle. Returns rider boxes (x1, y1, x2, y2) in original frame coordinates.
+
+    With `region` (x1, y1, x2, y2) only that rectangle is fed to the detector,
+    scaled to fit `resize` with its aspect ratio kept, so a small region is
+    seen at a higher effective resolution than the whole frame would be.
+    `timer` (a metrics.StageTimer) gets the resize, detector and pairing times.
+    """
+    x0 = y0 = 0
+    src = frame
+    det_size = resize
+    if region is not None:
+        x0, y0, x1, y1 = region
+        src = frame[y0:y1, x0:x1]
+        if src.size == 0:
+            return []
+        fit = min(resize[0] / src.shape[1], resize[1] / src.shape[0])
+        det_size = (max(32, int(round(src.shape[1] * fit))), max(32, int(round(src.shape[0] * fit))))
+
+    with timer.stage('resize'):
+        det_frame = cv2.resize(src, det_size)
+    scale = np.array([src.shape[1] / det_size[0], src.shape[0] / det_size[1]] * 2, dtype=np.float32)
+    offset = np.array([x0, y0, x0, y0], dtype=np.float32)
+
+    with timer.stage('detector'):
+        result = model.predict([det_frame], conf=conf)[0]
+    with timer.stage('pairing'):
+        table = class_table(model)
+        xyxy, cls, _ = boxes_to_numpy(result)
+        riders = pair_riders(xyxy, cls, table['person'], table['motorcycle'])
+        # upscale to original frame coords
+        riders = np.rint(riders * scale + offset).astype(np.int64)
+        return [tuple(box) for box in riders.tolist()]
+
+
+def to_detections(model, result, crop_shape, scale=1.0, pad=(0, 0)):
+    """Convert one second-stage result into Detection tuples in crop coordinates."""
+    xyxy, cls, confs = boxes_to_numpy(result)
+    if len(xyxy) == 0:
+        return []
+    table = class_table(model)
+    h, w = crop_shape[:2]
+    # map letterboxed coords back to the original crop
+    xyxy = (xyxy - np.array([pad[0], pad[1], pad[0], pad[1]], dtype=np.float32)) / scale
+    xyxy[:, 0::2] = np.clip(xyxy[:, 0::2], 0, w)
+    xyxy[:, 1::2] = np.clip(xyxy[:, 1::2], 0, h)
+    xyxy = xyxy.astype(np.int64)
+    names, kinds, plates = table['names'], table['kinds'], table['plates']
+    return [
+        Detection(x1, y1, x2, y2, names[c], int(kinds[c]), plates[c], float(p))
+        for (x1, y1, x2, y2), c, p in zip(xyxy.tolist(), cls.tolist(), confs.tolist())
+    ]
+
+
+def run_second_stage(model, rider_crops, batch=True, crop_size=RIDER_CROP_SIZE,
+                     max_batch=MAX_RIDER_BATCH, conf=SECOND_STAGE_CONF):
+    """
+    Run the helmet/plate model on every rider crop of a frame.
+
+    With batch=True the crops are letterboxed to crop_size and sent through the
+    model in one call (chunked by max_batch).
+
+    Returns a list (one entry per crop) of Detection tuples in crop coordinates.
+    """
+    if not rider_crops:
+        return []
+
+    if not batch:
+        return [to_detections(model, model.predict([crop], conf=conf)[0], crop.shape)
+                for crop in rider_crops]
+
+    boxed = [letterbox(crop, crop_size) for crop in rider_crops]
+    per_crop = []
+    for start in range(0, len(boxed), max_batch):
+        chunk = boxed[start:start + max_batch]
+        results = model.predict([c[0] for c in chunk], conf=conf, imgsz=crop_size)
+        for (canvas, scale, pad), result, crop in zip(chunk, results, rider_crops[start:start + max_batch]):
+            per_crop.append(to_detections(model, result, crop.shape, scale, pad))
+    return per_crop
@@ -0,0 +1,884 @@
+"""
+StreamEngine: the capture -> detect -> track -> classify -> record pipeline
+behind stream_mjpeg.py, as an object with explicit start()/stop().
+
+Nothing happens at construction. start() returns as soon as the capture and
+inference threads are running; cameras are opened by their own capture
+processes (or threads, with CAPTURE_PROCESS off) and both models load in parallel in the background, so video is
+served (un-annotated) within moments of a (re)start and detection switches
+on once the models are ready. Each phase is timed; see startup_report().
+
+Display is decoupled from detection: every captured frame is published, with
+the last inference's boxes moved along their tracks (streaming/overlay.py).
+
+Frame sources and models are injectable (source_factory, model_loader), so
+the engine runs without a camera or YOLO weights using
+streaming.sources.StubSource and streaming.backends.stub_backend.
+
+With INFERENCE_SERVER on, the models live in a separate inference server
+process (streaming/inference_server.py) that batches requests from all
+cameras; each camera then gets its own inference thread so their requests
+can meet in one batch.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+import cv2
+from django.utils import timezone
+
+from SRAS_App.models import Camera
+from .backends import FP32, load_configured
+from .broadcast import FrameBroadcaster
+from .classifier import TrackClassifier, NO_HELMET
+from .dedup import TTLHashSet, HammingIndex, create_rider_hash, create_rider_phash, phash_to_hex
+from .detection import detect_riders, run_second_stage, KIND_NO_HELMET, KIND_HELMET, KIND_PLATE
+from .evidence import Evidence, EvidenceBuffer
+from .framebus import CaptureProcess
+from .metrics import NULL_TIMER, RateMeter, StageTimer
+from .inference_server import InferenceClient, InferenceServer, RemoteBackend
+from .motion import MotionGate
+from .overlay import OverlayItem, TrackOverlay, draw_rider
+from .profiling import MemoryTracker, ThreadProfiler
+from .roi import RegionOfInterest
+from .sources import CameraInfo, CaptureCounters, read_when_due, source_factory_for
+from .tracker import RiderTracker
+from .writer import ViolationWriter, ViolationRecord
+
+
+class CameraStream:
+    """Per-camera state: frame source, latest frame queue and annotated output."""
+
+    def __init__(self, camera, config, timer=NULL_TIMER):
+        self.camera = camera
+        self.camera_id = camera.id
+        self.name = camera.name
+        self.source = None  # opened on the capture thread, see StreamEngine.capture_worker()
+        self.capture = None  # CaptureProcess when capture runs out of process (CAPTURE_PROCESS)
+        self.ring = None     # its shared-memory FrameRing, attached by bus_reader()
+        self.frame_queue = queue.Queue(maxsize=5)
+        self.broadcaster = FrameBroadcaster(quality=config.JPEG_QUALITY, timer=timer)
+        self.tracker = RiderTracker(
+            iou_threshold=config.TRACK_IOU_THRESH, min_hits=config.TRACK_MIN_HITS,
+            max_age=config.TRACK_MAX_AGE,
+        )
+        self.roi = RegionOfInterest.from_camera(camera)  # None = whole frame
+        self.motion_gate = MotionGate(
+            size=config.MOTION_GATE_SIZE, pixel_threshold=config.MOTION_PIXEL_THRESHOLD,
+            area_threshold=config.MOTION_AREA_THRESHOLD, max_interval=config.MOTION_MAX_INTERVAL,
+        )
+        self.classifier = TrackClassifier(
+            window=config.CLASSIFY_VOTE_WINDOW, votes_needed=config.CLASSIFY_VOTES_NEEDED,
+            recheck_after=config.CLASSIFY_RECHECK_AFTER, settle_conf=config.CLASSIFY_SETTLE_CONF,
+        )
+        self.overlay = TrackOverlay(max_age=config.PROPAGATE_MAX_AGE, propagate=config.PROPAGATE_BOXES)
+        self.evidence = EvidenceBuffer(max_wait=config.EVIDENCE_MAX_WAIT)  # best frame per violating track
+        self.precision = getattr(camera, 'inference_precision', FP32) or FP32
+        self.frame_count = 0
+        self.last_inferred_at = None
+        self.counters = CaptureCounters()  # capture-thread mode; kept across reconnects
+        # pipeline counters, see StreamEngine.status()
+        self.frames_received = 0
+        self.frames_replaced = 0  # queued frames overwritten by a newer one before inference took them
+        self.frames_inferred = 0
+        self.capture_rate = RateMeter()
+        self.inference_rate = RateMeter()
+        self.capture_thread = None
+        self.inference_thread = None  # only with INFERENCE_SERVER; otherwise cameras share one thread
+
+    def open(self, source_factory):
+        if self.source is not None:
+            self.source.release()
+        self.source = source_factory(self.info())
+        self.source.counters = self.counters
+        if not self.source.is_opened():
+            print(f"❌ Error: Camera '{self.name}' could not be opened. Check its stream URL and network connection.")
+            return False
+        print(f"✅ Camera '{self.name}' (id={self.camera_id}) opened successfully.")
+        return True
+
+    def info(self):
+        return CameraInfo(self.camera_id, self.name, getattr(self.camera, 'stream_url', ''))
+
+    def capture_counters(self):
+        """Frames grabbed, decoded and dropped undecoded, from the capture process's ring or our own source."""
+        ring = self.ring
+        if self.capture is not None:
+            return ring.counters() if ring is not None else CaptureCounters().as_dict()
+        return self.counters.as_dict()
+
+    def close(self):
+        if self.source is not None:
+            self.source.release()
+        if self.capture is not None:
+            self.capture.stop()
+            self.capture = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+
+def get_default_camera(stream_url):
+    try:
+        camera, _ = Camera.objects.get_or_create(
+            name="Default Camera",
+            defaults={'stream_url': stream_url}
+        )
+        return camera
+    except Exception as e:
+        print(f"Error getting camera: {e}")
+        return None
+
+
+def load_cameras(default_url):
+    """Return every Camera row, falling back to the default camera when the table is empty."""
+    try:
+        cameras = list(Camera.objects.all().order_by('id'))
+    except Exception as e:
+        print(f"Error loading cameras: {e}")
+        cameras = []
+    if not cameras:
+        default = get_default_camera(default_url)
+        if default is not None:
+            cameras = [default]
+    return cameras
+
+
+def next_frames(streams, start):
+    """
+    Round-robin scheduler: starting after the last served camera, take at most
+    one (latest) frame from each camera so a busy feed cannot starve the others.
+    """
+    batch = []
+    n = len(streams)
+    for offset in range(n):
+        stream = streams[(start + offset) % n]
+        try:
+            batch.append((stream, stream.frame_queue.get_nowait()))
+        except queue.Empty:
+            continue
+    return batch
+
+
+def live_clock(captured_at):
+    """Wall-clock datetime of a live frame timestamp (time.monotonic())."""
+    return timezone.now() - timedelta(seconds=max(0.0, time.monotonic() - captured_at))
+
+
+class StreamEngine:
+    """
+    Args:
+        config: object with the stream_mjpeg.py settings as attributes
+            (the module itself, or stream_mjpeg.settings(**overrides)).
+        cameras: Camera-like objects (id, name, stream_url, ...); None loads
+            the Camera table at start().
+        source_factory: CameraInfo -> frame source; defaults to the CAPTURE_BACKEND
+            source (OpenCV or PyAV) on the stream URL. Must be picklable (a module-level function or a
+            functools.partial of one) when CAPTURE_PROCESS is on.
+        model_loader: (role, precision) -> backend, role being 'detector' or
+            'helmet'; defaults to backends.load_configured() with these settings.
+            With INFERENCE_SERVER on it runs in the server process, so it
+            (and config) must be picklable.
+        writer: ViolationWriter-like sink (submit/start/stop/stats).
+        warm_hashes: preload recent violation hashes from the database at start().
+        clock: frame timestamp -> datetime the frame was taken, stamped on its
+            violations; live_clock for time.monotonic() timestamps. None stamps
+            violations when they are written.
+    """
+
+    def __init__(self, config, cameras=None, source_factory=None, model_loader=None, writer=None,
+                 warm_hashes=True, clock=live_clock):
+        self.config = config
+        self.cameras = cameras
+        self.source_factory = source_factory or source_factory_for(
+            config.CAPTURE_BACKEND, threads=config.DECODE_THREADS, max_lag=config.DECODE_MAX_LAG)
+        self.model_loader = model_loader or partial(load_configured, config)
+        self.warm_hashes = warm_hashes
+        self.hashes_warmed = False
+        self.clock = clock
+        self.timer = StageTimer()  # per-stage latencies of the hot path, see stage_report()
+        self.profiler = ThreadProfiler()  # on-demand cProfile of the inference thread(s), see profile()
+        self.memory = MemoryTracker()     # on-demand tracemalloc diffs, see memory_report()
+        self.writer = writer or ViolationWriter(
+            batch_size=config.WRITER_BATCH_SIZE,
+            flush_interval=config.WRITER_FLUSH_INTERVAL,
+            max_queue=config.WRITER_MAX_QUEUE,
+            max_retries=config.WRITER_MAX_RETRIES,
+            duplicate_window=config.TIME_WINDOW,
+            timer=self.timer,
+        )
+
+        # In-memory hash tracking for faster duplicate detection (entries expire after TIME_WINDOW)
+        self.recent_hashes = TTLHashSet(config.TIME_WINDOW)
+        self.recent_phashes = HammingIndex(max_distance=config.PHASH_MAX_DISTANCE, ttl=config.TIME_WINDOW)
+
+        self.streams = []
+        self.streams_by_id = {}
+        self.frame_ready = threading.Event()  # set by any capture worker when a new frame is queued
+        self.stop_event = threading.Event()
+        self.inference_threads = []
+        self.executor = None
+        self.inference_server = None  # InferenceServer process, with INFERENCE_SERVER
+        self.inference_client = None
+        self.client_lock = threading.Lock()
+        self.ready_reported = False
+        # precision -> {'detector': Future, 'helmet': Future}; kept across restarts
+        self.models = {}
+        self.models_lock = threading.Lock()
+
+        self.started_at = None
+        self.timings = {}
+        self.timings_lock = threading.Lock()
+
+    # -- startup ---------------------------------------------------------------
+
+    @property
+    def running(self):
+        return bool(self.inference_threads) and not self.stop_event.is_set()
+
+    def mark(self, name, since=None):
+        """Record `name` as seconds since start() (or since `since`), first occurrence only."""
+        if since is None and self.started_at is None:
+            return  # driven without start(), e.g. manage.py process_video
+        elapsed = time.perf_counter() - (since if since is not None else self.started_at)
+        with self.timings_lock:
+            self.timings.setdefault(name, round(elapsed, 3))
+
+    def timed(self, name, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.mark(name, since=started)
+
+    def request_models(self, precision):
+        """Start loading both models for `precision` in parallel (once); returns their futures."""
+        with self.models_lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='engine-init')
+            futures = self.models.get(precision)
+            if futures is None:
+                futures = {
+                    role: self.executor.submit(self.timed, f"load {role} ({precision})",
+                                               self.load_model, role, precision)
+                    for role in ('detector', 'helmet')
+                }
+                self.models[precision] = futures
+            return futures
+
+    def load_model(self, role, precision):
+        if self.config.INFERENCE_SERVER:
+            return RemoteBackend(self.remote_client(), role, precision)
+        return self.model_loader(role, precision)
+
+    def remote_client(self):
+        """Start the inference server process (once) and connect to it."""
+        cfg = self.config
+        with self.client_lock:
+            if self.inference_server is None or not self.inference_server.is_alive():
+                if self.inference_server is not None:
+                    self.inference_server.stop()  # dead: just removes its socket directory
+                self.inference_server = InferenceServer(
+                    self.model_loader, cfg.INFERENCE_SOCKET, budget=cfg.INFERENCE_BATCH_BUDGET,
+                    max_batch=cfg.INFERENCE_MAX_BATCH,
+                ).start()
+                self.inference_client = None
+            if self.inference_client is None or self.inference_client.closed:
+                self.inference_client = InferenceClient(self.inference_server.address, self.inference_server.authkey)
+                self.mark('inference server connected')
+            return self.inference_client
+
+    def inference_stats(self):
+        """Batching and per-camera queue metrics from the inference server (None when not in use)."""
+        client = self.inference_client
+        if client is None or client.closed:
+            return None
+        try:
+            return client.stats()
+        except (ConnectionError, RuntimeError, TimeoutError, OSError):
+            return None
+
+    def models_for(self, stream):
+        """
+        (detector, helmet_model) for a stream once both have loaded, else None.
+        A camera whose INT8 models fail to load falls back to FP32.
+        """
+        futures = self.request_models(stream.precision)
+        if not all(f.done() for f in futures.values()):
+            return None
+        try:
+            return futures['detector'].result(), futures['helmet'].result()
+        except Exception as e:
+            if stream.precision == FP32:
+                if not getattr(stream, 'model_error_reported', False):
+                    print(f"❌ Could not load models ({e}); streaming without detection")
+                    stream.model_error_reported = True
+                return None
+            print(f"⚠️ Could not load {stream.precision} models for '{stream.name}' ({e}); using {FP32}")
+            stream.precision = FP32
+            return self.models_for(stream)
+
+    def wait_ready(self, timeout=None):
+        """Block until every requested model has loaded (or failed). Returns True if all loaded."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ok = True
+        for futures in list(self.models.values()):
+            for future in futures.values():
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    future.result(timeout=remaining)
+                except Exception:
+                    ok = False
+        return ok
+
+    def warm_recent_hashes(self):
+        try:
+            count = self.recent_hashes.warm_from_db()
+            pcount = self.recent_phashes.warm_from_db()
+            print(f"🔄 Loaded {count} recent violation hash(es) and {pcount} perceptual hash(es) for duplicate detection")
+        except Exception as e:
+            print(f"Error loading recent hashes: {e}")
+
+    def start(self):
+        """Start capture, inference and the DB writer; models and cameras come up in the background."""
+        if self.running:
+            return self
+        cfg = self.config
+        self.started_at = time.perf_counter()
+        with self.timings_lock:
+            self.timings = {}
+        self.stop_event.clear()
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='engine-init')
+
+        if self.warm_hashes and not self.hashes_warmed:
+            # once per engine: the in-memory hashes are kept across restarts
+            self.hashes_warmed = True
+            self.executor.submit(self.timed, 'warm duplicate hashes', self.warm_recent_hashes)
+        self.writer.start()
+
+        cameras = self.cameras if self.cameras is not None else load_cameras(cfg.DEFAULT_STREAM_URL)
+        self.mark('cameras listed')
+        self.streams = [CameraStream(camera, cfg, self.timer) for camera in cameras]
+        self.streams_by_id = {stream.camera_id: stream for stream in self.streams}
+        if cfg.INFERENCE_SERVER:
+            # a dead server took its models (and our proxies to them) along
+            if self.inference_server is not None and not self.inference_server.is_alive():
+                self.models = {}
+        for precision in {stream.precision for stream in self.streams} or {FP32}:
+            self.request_models(precision)
+
+        # decode in one process per camera (off this process's GIL) publishing to a
+        # shared-memory ring, or on a thread per camera with CAPTURE_PROCESS off
+        worker = self.bus_reader if cfg.CAPTURE_PROCESS else self.capture_worker
+        for stream in self.streams:
+            if cfg.CAPTURE_PROCESS:
+                self.start_capture_process(stream)
+            stream.capture_thread = threading.Thread(
+                target=worker, args=(stream,), name=f"capture-{stream.camera_id}", daemon=True)
+            stream.capture_thread.start()
+        self.ready_reported = False
+        if cfg.INFERENCE_SERVER:
+            # one thread per camera: the server batches their concurrent requests
+            for stream in self.streams:
+                stream.inference_thread = threading.Thread(
+                    target=self.camera_inference_worker, args=(stream,),
+                    name=f"inference-{stream.camera_id}", daemon=True)
+                self.inference_threads.append(stream.inference_thread)
+        else:
+            self.inference_threads.append(
+                threading.Thread(target=self.inference_worker, name="inference", daemon=True))
+        for thread in self.inference_threads:
+            thread.start()
+        self.mark('threads started')
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self.frame_ready.set()
+        # no timeout: a thread inside a forward pass may still submit a violation, which must reach
+        # the writer before it stops (remote model calls time out on their own)
+        for thread in self.inference_threads:
+            thread.join()
+        self.inference_threads = []
+        for stream in self.streams:
+            # violations still collecting evidence are saved with the best frame so far
+            self.record_violations(stream, stream.evidence.drain())
+        for stream in self.streams:
+            if stream.capture_thread is not None and stream.capture_thread.is_alive():
+                stream.capture_thread.join(timeout=1)
+            stream.close()
+        self.writer.stop()
+
+    def shutdown(self):
+        """stop() and release the loader pool and inference server (models loaded so far are dropped)."""
+        self.stop()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        with self.client_lock:
+            if self.inference_client is not None:
+                self.inference_client.close()
+                self.inference_client = None
+            if self.inference_server is not None:
+                self.inference_server.stop()
+                self.inference_server = None
+        self.models = {}
+
+    def status(self):
+        """Health snapshot for /status and /metrics: FPS, queue depths, drops, writer and stage latencies."""
+        started = self.started_at
+        return {
+            'running': self.running,
+            'uptime_seconds': round(time.perf_counter() - started, 1) if started is not None else 0.0,
+            'models_ready': bool(self.models) and all(
+                f.done() and f.exception() is None for futures in self.models.values() for f in futures.values()),
+            'cameras': [{
+                'id': stream.camera_id,
+                'name': stream.name,
+                'precision': stream.precision,
+                'capture_fps': round(stream.capture_rate.rate(), 1),
+                'inference_fps': round(stream.inference_rate.rate(), 1),
+                'queue_depth': stream.frame_queue.qsize(),
+                'frames_received': stream.frames_received,
+                'frames_replaced': stream.frames_replaced,
+                'frames_inferred': stream.frames_inferred,
+                'motion_gated': stream.motion_gate.gated,
+                'tracks': len(stream.tracker),
+                'pending_evidence': len(stream.evidence),
+                'capture': stream.capture_counters(),
+                'viewers': 0,  # filled in by the server
+            } for stream in self.streams],
+            'writer': self.writer.stats(),
+            'inference_server': self.inference_stats(),
+            'stages': self.stage_report(),
+        }
+
+    def capture_stats(self):
+        """{camera_id: {'grabbed', 'decoded', 'dropped', 'degraded'}} for every camera."""
+        return {stream.camera_id: stream.capture_counters() for stream in self.streams}
+
+    def startup_report(self):
+        """Seconds from start() to each startup milestone, plus per-phase durations."""
+        with self.timings_lock:
+            return dict(self.timings)
+
+    def stage_report(self):
+        """Latency percentiles per pipeline stage (capture, resize, detector, pairing, ...), in ms."""
+        return self.timer.summary()
+
+    def profile(self, seconds, sort='cumulative', limit=40):
+        """cProfile the inference thread(s) for `seconds`; the pstats report as text. Blocks for the window."""
+        return self.profiler.profile(seconds, sort=sort, limit=limit)
+
+    def container_sizes(self):
+        """Entries held by the long-lived per-process and per-camera structures (growth suspects)."""
+        return {
+            'recent_hashes': len(self.recent_hashes),
+            'recent_phashes': len(self.recent_phashes),
+            'writer_queue': self.writer.stats().get('queue_depth', 0),
+            'cameras': {stream.camera_id: {
+                'tracks': len(stream.tracker),
+                'ended_tracks': len(stream.tracker.ended),
+                'classifier_tracks': len(stream.classifier.tracks),
+                'pending_evidence': len(stream.evidence),
+                'overlay_items': len(stream.overlay.state[0]),
+                'queued_frames': stream.frame_queue.qsize(),
+                'broadcast_frame_kb': round(getattr(stream.broadcaster.frame, 'nbytes', 0) / 1024, 1),
+                'broadcast_jpeg_kb': round(len(stream.broadcaster.jpeg or b'') / 1024, 1),
+            } for stream in self.streams},
+        }
+
+    def memory_report(self, limit=25, key='lineno', frames=1, reset=False, stop=False):
+        """
+        Container sizes plus a tracemalloc diff against the previous call (the
+        first call starts tracing). Tracing slows allocation-heavy code, so
+        stop=True turns it off again once the leak is found.
+        """
+        sizes = self.container_sizes()
+        lines = [f"recent_hashes {sizes['recent_hashes']}, recent_phashes {sizes['recent_phashes']}, "
+                 f"writer queue {sizes['writer_queue']}"]
+        for camera_id, camera in sizes['cameras'].items():
+            lines.append(f"camera {camera_id}: " + ", ".join(f"{name} {value}" for name, value in camera.items()))
+        report = self.memory.stop() if stop else self.memory.snapshot(limit=limit, key=key, frames=frames, reset=reset)
+        return "\n".join(lines) + "\n\n" + report
+
+    def print_startup_report(self):
+        report = self.startup_report()
+        print("🚀 Startup: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in report.items()))
+
+    # -- capture / inference ---------------------------------------------------
+
+    def start_capture_process(self, stream):
+        cfg = self.config
+        stream.capture = CaptureProcess(stream.info(), self.source_factory, slots=cfg.FRAME_RING_SLOTS,
+                                        reconnect_after=cfg.RECONNECT_AFTER, max_fps=cfg.CAPTURE_FPS)
+        stream.capture.start()
+
+    def queue_frame(self, stream, frame, captured_at):
+        # every captured frame is shown, with the latest tracked boxes moved to where the riders are now
+        with self.timer.stage('annotation'):
+            shown = stream.overlay.render(frame, stream.tracker, captured_at)
+        stream.broadcaster.publish(shown)
+        self.mark('first frame served')
+
+        # keep only latest
+        stream.frames_received += 1
+        stream.capture_rate.tick()
+        while not stream.frame_queue.empty():
+            try:
+                stream.frame_queue.get_nowait()
+                stream.frames_replaced += 1
+            except queue.Empty:
+                break
+        stream.frame_queue.put((frame, captured_at))
+        self.mark(f"camera {stream.camera_id} first frame")
+        self.frame_ready.set()
+
+    def bus_reader(self, stream):
+        """
+        Feed the inference loop from the camera's shared-memory ring. Other local
+        processes can attach to the same ring (streaming.framebus.ring_name()).
+        A capture process that dies is restarted.
+        """
+        last_seq = -1
+        while not self.stop_event.is_set():
+            if stream.ring is None:
+                stream.ring = stream.capture.attach(timeout=1.0)
+                if stream.ring is None:
+                    if not stream.capture.is_alive() and not self.stop_event.is_set():
+                        print(f"🔁 Capture process for '{stream.name}' exited, restarting...")
+                        self.start_capture_process(stream)
+                    continue
+                print(f"✅ Camera '{stream.name}' (id={stream.camera_id}) streaming via {stream.capture.name}")
+                self.mark(f"camera {stream.camera_id} opened")
+                last_seq = -1
+
+            seq = stream.ring.wait_next(last_seq, timeout=0.5)
+            if seq is None:
+                if not stream.capture.is_alive() or not stream.capture.owns(stream.ring):
+                    stream.ring.close()
+                    stream.ring = None
+                continue
+            with self.timer.stage('capture'):
+                bus_frame = stream.ring.read(seq)
+            if bus_frame is None:
+                continue
+            last_seq = bus_frame.seq
+            self.queue_frame(stream, bus_frame.frame, bus_frame.captured_at)
+
+    def capture_worker(self, stream):
+        cfg = self.config
+        if stream.open(self.source_factory):
+            self.mark(f"camera {stream.camera_id} opened")
+        interval = 1.0 / cfg.CAPTURE_FPS if cfg.CAPTURE_FPS else 0.0
+        last_frame = time.monotonic()
+        while not self.stop_event.is_set():
+            # frames that arrive before the next one is due are grabbed but never decoded
+            success, frame = read_when_due(stream.source, last_frame, interval, self.timer)
+            if not success:
+                # camera dropped (or never came up): reopen rather than spin on a dead handle
+                if time.monotonic() - last_frame > cfg.RECONNECT_AFTER:
+                    print(f"🔌 Camera '{stream.name}' stalled, reconnecting...")
+                    stream.open(self.source_factory)
+                    last_frame = time.monotonic()
+                time.sleep(0.01)
+                continue
+            last_frame = time.monotonic()
+            self.queue_frame(stream, frame, last_frame)
+            time.sleep(0.001)
+
+    def report_when_ready(self):
+        if not self.ready_reported and all(f.done() for futures in self.models.values() for f in futures.values()):
+            self.ready_reported = True
+            self.mark('models ready')
+            self.print_startup_report()
+
+    def inference_worker(self):
+        cursor = 0
+
+        while not self.stop_event.is_set():
+            self.profiler.checkpoint()
+            self.frame_ready.clear()
+            batch = next_frames(self.streams, cursor)
+            if not batch:
+                self.frame_ready.wait(timeout=0.1)
+                continue
+            cursor = (cursor + 1) % len(self.streams)
+
+            for stream, (frame, captured_at) in batch:
+                try:
+                    with self.timer.stage('process_frame'):
+                        self.process_frame(stream, frame, captured_at)
+                except Exception as e:
+                    print(f"Inference error ({stream.name}): {e}")
+            self.report_when_ready()
+
+    def camera_inference_worker(self, stream):
+        """INFERENCE_SERVER mode: process one camera's frames; its model calls are batched server-side."""
+        while not self.stop_event.is_set():
+            self.profiler.checkpoint()
+            try:
+                frame, captured_at = stream.frame_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if self.inference_client is not None:
+                self.inference_client.set_camera(stream.camera_id)
+            try:
+                with self.timer.stage('process_frame'):
+                    self.process_frame(stream, frame, captured_at)
+            except Exception as e:
+                print(f"Inference error ({stream.name}): {e}")
+            self.report_when_ready()
+
+    def is_duplicate_violation(self, rider_hash, rider_phash=None):
+        """In-memory check only; the writer re-checks the database off the inference thread."""
+        if rider_hash and rider_hash in self.recent_hashes:
+            print(f"⚠️ Duplicate (memory): {rider_hash[:8]}...")
+            return True
+        match = self.recent_phashes.nearest(rider_phash)
+        if match is not None:
+            print(f"⚠️ Duplicate (perceptual, {match[0]} bits): {phash_to_hex(rider_phash)}")
+            return True
+        return False
+
+    def save_violation(self, camera, image_data, plate_number=None, rider_hash=None, plate_image_data=None,
+                       rider_phash=None, captured_at=None):
+        """Queue violation (annotated frame + optional cropped plate bytes) for the writer thread."""
+        if camera is None:
+            print("No camera available for violation recording")
+            return False
+
+        if self.is_duplicate_violation(rider_hash, rider_phash):
+            print(f"[LOG] Duplicate violation detected for hash: {rider_hash}")
+            return False
+
+        queued = self.writer.submit(ViolationRecord(
+            camera=camera,
+            image=image_data,
+            plate_number=plate_number,
+            plate_image=plate_image_data,
+            rider_hash=rider_hash,
+            rider_phash=phash_to_hex(rider_phash),
+            detected_at=time.monotonic(),
+            captured_at=captured_at,
+            occurred_at=self.occurred_at(captured_at),
+        ))
+
+        if queued:
+            self.recent_hashes.add(rider_hash)
+            self.recent_phashes.add(rider_phash)
+        return queued
+
+    def occurred_at(self, captured_at):
+        """When the frame at `captured_at` was taken, by the engine's clock; None = stamp when written."""
+        if self.clock is None or captured_at is None:
+            return None
+        return self.clock(captured_at)
+
+    def record_violation(self, stream, track_id, evidence):
+        """Duplicate check, encode and queue one rider's evidence; the track is not checked again."""
+        cfg = self.config
+        with self.timer.stage('dedup'):
+            rider_hash = create_rider_hash(evidence.rider_crop, evidence.plate_number)
+            rider_phash = create_rider_phash(evidence.rider_crop)
+            duplicate = self.is_duplicate_violation(rider_hash, rider_phash)
+        if duplicate:
+            stream.classifier.mark_done(track_id)
+            return False
+
+        with self.timer.stage('evidence_encode'):
+            ok_ann, ann_jpg = cv2.imencode('.jpg', evidence.annotated, [cv2.IMWRITE_JPEG_QUALITY, cfg.JPEG_QUALITY])
+            plate_bytes = None
+            if evidence.plate_crop is not None:
+                ok_pl, pl_jpg = cv2.imencode('.jpg', evidence.plate_crop, [cv2.IMWRITE_JPEG_QUALITY, 90])
+                if ok_pl:
+                    plate_bytes = pl_jpg.tobytes()
+        if not ok_ann:
+            print("❌ Failed to encode annotated frame")
+            return False
+
+        if evidence.candidates > 1:
+            print(f"📸 Rider {track_id}: best of {evidence.candidates} frames (score {evidence.score:.2f})")
+        saved = self.save_violation(
+            stream.camera,
+            ann_jpg.tobytes(),
+            plate_number=evidence.plate_number,
+            rider_hash=rider_hash,
+            plate_image_data=plate_bytes,
+            rider_phash=rider_phash,
+            captured_at=evidence.captured_at,
+        )
+        if saved:
+            stream.classifier.mark_done(track_id)
+        return saved
+
+    def record_violations(self, stream, ready):
+        for track_id, evidence in ready:
+            self.record_violation(stream, track_id, evidence)
+
+    def process_frame(self, stream, frame, captured_at):
+        """Run detection, second stage and violation capture on one camera frame."""
+        cfg = self.config
+        stream.frame_count += 1
+        local_frame_count = stream.frame_count
+
+        models = self.models_for(stream)
+        if models is None:
+            return  # models still loading: the live feed is shown un-annotated meanwhile
+        detector, helmet_model = models
+
+        if local_frame_count % cfg.SKIP_INFERENCE != 0:
+            return
+        if cfg.INFERENCE_FPS and stream.last_inferred_at is not None and \
+                captured_at - stream.last_inferred_at < 1.0 / cfg.INFERENCE_FPS:
+            return
+
+        region = stream.roi.bounding_rect(frame.shape) if stream.roi is not None else None
+
+        # static scene and nobody being tracked: keep the last overlay, skip YOLO
+        if cfg.MOTION_GATE:
+            gate_frame = frame if region is None else frame[region[1]:region[3], region[0]:region[2]]
+            if not stream.motion_gate.should_infer(gate_frame, captured_at, force=len(stream.tracker) > 0):
+                return
+        stream.last_inferred_at = captured_at
+        stream.frames_inferred += 1
+        stream.inference_rate.tick()
+
+        if region is not None:
+            # detect only inside the ROI's bounding rectangle, then drop riders centred outside the polygon
+            riders = detect_riders(detector, frame, resize=cfg.DETECTION_RESIZE, region=region, timer=self.timer)
+            riders = [box for box, inside in zip(riders, stream.roi.contains(riders, frame.shape)) if inside]
+        else:
+            riders = detect_riders(detector, frame, resize=cfg.DETECTION_RESIZE, timer=self.timer)
+
+        annotated = frame.copy()
+
+        # collect every rider crop first so the second stage runs as one batch
+        rider_boxes, rider_crops = [], []
+        for rx1, ry1, rx2, ry2 in riders:
+            rider_crop = frame[ry1:ry2, rx1:rx2]
+            if rider_crop.size == 0:
+                continue
+            rider_boxes.append((rx1, ry1, rx2, ry2))
+            rider_crops.append(rider_crop)
+
+        with self.timer.stage('tracking'):
+            track_ids = stream.tracker.update(rider_boxes, captured_at)
+            ended = stream.tracker.pop_ended()
+            stream.classifier.forget(ended)
+        # riders that left the scene: save the best frame they had
+        self.record_violations(stream, stream.evidence.pop(ended))
+
+        rider_speeds, rider_styles = [], []
+        for (rx1, ry1, rx2, ry2), track_id in zip(rider_boxes, track_ids):
+            speed_kph = stream.tracker.speed_kph(track_id, cfg.PIXELS_PER_METER)
+            rider_speeds.append(speed_kph)
+            box_color = (255, 0, 0) if speed_kph >= cfg.MIN_SPEED_KPH else (128, 128, 128)
+            rider_styles.append((box_color, f"Rider {track_id}: {speed_kph:.1f} km/h"))
+
+        # second stage only for tracks that are new, unsettled or due for a re-check
+        to_check = [i for i, track_id in enumerate(track_ids) if stream.classifier.needs_check(track_id, captured_at)]
+        with self.timer.stage('second_stage'):
+            fresh = dict(zip(to_check, run_second_stage(
+                helmet_model, [rider_crops[i] for i in to_check], batch=cfg.BATCH_SECOND_STAGE,
+                crop_size=cfg.RIDER_CROP_SIZE, max_batch=cfg.MAX_RIDER_BATCH,
+            )))
+
+        overlay_items = []
+        for i, ((rx1, ry1, rx2, ry2), rider_crop, track_id, speed_kph, (box_color, label)) in enumerate(
+                zip(rider_boxes, rider_crops, track_ids, rider_speeds, rider_styles)):
+            crop_size = (rider_crop.shape[1], rider_crop.shape[0])
+            checked = i in fresh
+            if checked:
+                detections = fresh[i]
+                decision = stream.classifier.record(track_id, captured_at, detections, crop_size)
+            else:
+                # settled track: redraw its last result instead of running the model again
+                detections = stream.classifier.cached(track_id, crop_size)
+                decision = stream.classifier.decision(track_id)
+
+            found_no_helmet = False
+            no_helmet_conf = 0.0
+            plate_number = None
+
+            # NEW: keep the best (largest) plate crop
+            best_plate_crop = None
+            best_area = 0
+            parts = []
+
+            for cx1, cy1, cx2, cy2, clabel, kind, plate, conf in detections:
+
+                color = (0, 255, 0)
+                if kind == KIND_NO_HELMET:
+                    color = (0, 0, 255)
+                    found_no_helmet = True
+                    no_helmet_conf = max(no_helmet_conf, conf)
+                elif kind == KIND_HELMET:
+                    color = (0, 255, 0)
+                elif kind == KIND_PLATE:
+                    color = (255, 255, 0)
+                    plate_number = plate
+
+                    # guard bounds and crop (cached boxes are only approximate, so fresh results only)
+                    h, w = rider_crop.shape[:2]
+                    px1 = max(0, min(w, cx1))
+                    py1 = max(0, min(h, cy1))
+                    px2 = max(0, min(w, cx2))
+                    py2 = max(0, min(h, cy2))
+                    crop = rider_crop[py1:py2, px1:px2]
+                    area = max(0, (px2 - px1) * (py2 - py1))
+                    if checked and crop.size > 0 and area > best_area and (px2 - px1) >= 12 and (py2 - py1) >= 8:
+                        best_area = area
+                        best_plate_crop = crop
+
+                parts.append((cx1, cy1, cx2, cy2, color, clabel))
+
+            # draw rider and sub-boxes on full frame
+            overlay_items.append(OverlayItem(track_id, (rx1, ry1, rx2, ry2), box_color, label, parts))
+            draw_rider(annotated, (rx1, ry1, rx2, ry2), box_color, label, parts)
+
+            moving = speed_kph >= cfg.MIN_SPEED_KPH
+            if cfg.EVIDENCE_BEST_FRAME and checked and found_no_helmet and moving:
+                with self.timer.stage('evidence_score'):
+                    stream.evidence.offer(track_id, captured_at, annotated, rider_crop, no_helmet_conf,
+                                          best_plate_crop, plate_number)
+
+            # Only capture violation once k-of-n checks agree on "no helmet" AND the rider is moving
+            violation = checked and found_no_helmet and decision == NO_HELMET
+            if violation and not moving:
+                print(f"⏸️  Stationary rider {track_id} ignored: Speed {speed_kph:.1f} km/h (min: {cfg.MIN_SPEED_KPH} km/h)")
+            elif violation and cfg.EVIDENCE_BEST_FRAME:
+                # keep scoring this rider's frames; saved when the track ends or EVIDENCE_MAX_WAIT passes
+                stream.evidence.confirm(track_id, captured_at)
+            elif violation:
+                evidence = Evidence()
+                evidence.annotated = annotated
+                evidence.rider_crop = rider_crop
+                evidence.captured_at = captured_at
+                evidence.plate_crop = best_plate_crop
+                evidence.plate_number = plate_number
+                self.record_violation(stream, track_id, evidence)
+
+        self.record_violations(stream, stream.evidence.due(captured_at))
+
+        # the display path (queue_frame) draws these on every frame until the next detection
+        stream.overlay.update(overlay_items, captured_at)
+        self.mark('first detection frame')
+
+    # -- serving -----------------------------------------------------------------
+
+    def resolve_stream(self, path):
+        """Map /video (first camera) or /video/<camera_id> to a CameraStream."""
+        path = path.split('?', 1)[0].rstrip('/')
+        if path == '/video':
+            return self.streams[0] if self.streams else None
+        if path.startswith('/video/'):
+            try:
+                return self.streams_by_id.get(int(path[len('/video/'):]))
+            except ValueError:
+                return None
+        return None
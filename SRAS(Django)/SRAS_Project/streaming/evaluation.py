@@ -0,0 +1,159 @@
+"""
+Offline helpers for comparing two model setups (backend, precision) on the
+same frames: sampling recorded video or stored violation snapshots, running
+the two-stage pipeline, and scoring one run against a reference run.
+"""
+import bisect
+import itertools
+import random
+import time
+
+import cv2
+import numpy as np
+
+from SRAS_App.models import Violation
+from .detection import detect_riders, iou_matrix, run_second_stage, KIND_NO_HELMET
+
+MATCH_IOU = 0.5  # rider boxes at least this close count as the same rider
+SEEK_GAP = 60    # sampled frames further apart than this are reached by seeking, nearer ones by grab()
+
+
+def decode_image(data):
+    if not data:
+        return None
+    return cv2.imdecode(np.frombuffer(bytes(data), dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def sample_violation_frames(limit, seed=0, exclude=()):
+    """
+    Up to `limit` decoded violation snapshots picked at random (seeded, so
+    reruns see the same frames). Returns a list of (violation_id, camera_id, frame).
+    """
+    ids = list(Violation.objects.exclude(pk__in=exclude).values_list('id', flat=True))
+    random.Random(seed).shuffle(ids)
+    frames = []
+    for start in range(0, len(ids), 100):
+        if len(frames) >= limit:
+            break
+        chunk = ids[start:start + 100]
+        for pk, camera_id, image in Violation.objects.filter(pk__in=chunk).values_list('id', 'camera_id', 'image'):
+            frame = decode_image(image)
+            if frame is not None:
+                frames.append((pk, camera_id, frame))
+    return frames[:limit]
+
+
+def sample_video_frames(paths, limit, seed=0, exclude=(), camera_id=None):
+    """
+    Up to `limit` frames picked at random (seeded) from recorded video: clean
+    frames with the live mix of empty road, helmeted and bare-headed riders.
+    Returns a list of ((path, frame index), camera_id, frame), like
+    sample_violation_frames().
+
+    Frame indices are drawn over the files' total frame count without listing
+    every frame, then read file by file in order, seeking only across gaps.
+    """
+    excluded = set(exclude)
+    counts = []
+    for path in paths:
+        cap = cv2.VideoCapture(path)
+        counts.append(max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT))))
+        cap.release()
+    starts = list(itertools.accumulate(counts, initial=0))  # global index of each file's first frame
+    total = starts[-1]
+
+    # draw enough extra indices to make up for the excluded ones; sample order is random, so keep the first
+    drawn = random.Random(seed).sample(range(total), min(total, limit + len(excluded)))
+    by_path = {}
+    kept = 0
+    for n in drawn:
+        if kept >= limit:
+            break
+        i = bisect.bisect_right(starts, n) - 1
+        if (paths[i], n - starts[i]) in excluded:
+            continue
+        by_path.setdefault(paths[i], []).append(n - starts[i])
+        kept += 1
+
+    frames = []
+    for path, indices in by_path.items():
+        cap = cv2.VideoCapture(path)
+        position = 0  # index of the frame the next read() returns
+        for index in sorted(indices):
+            if index < position or index - position > SEEK_GAP:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            else:
+                while position < index and cap.grab():  # close by: step forward without decoding
+                    position += 1
+            ok, frame = cap.read()
+            position = index + 1
+            if ok:
+                frames.append(((path, index), camera_id, frame))
+        cap.release()
+    return frames
+
+
+def run_pipeline(detector, helmet_model, frame):
+    """Rider boxes and per-rider helmet/plate detections for one frame."""
+    riders = detect_riders(detector, frame)
+    crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in riders]
+    keep = [i for i, crop in enumerate(crops) if crop.size > 0]
+    detections = run_second_stage(helmet_model, [crops[i] for i in keep])
+    return [riders[i] for i in keep], detections
+
+
+def timed_runs(detector, helmet_model, frames):
+    """Run the pipeline on every frame; returns (outputs, per-frame latency in ms)."""
+    outputs, latencies = [], []
+    for frame in frames:
+        started = time.perf_counter()
+        outputs.append(run_pipeline(detector, helmet_model, frame))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return outputs, np.array(latencies)
+
+
+def latency_summary(latencies):
+    if len(latencies) == 0:
+        return {}
+    mean = float(latencies.mean())
+    return {
+        'mean_ms': round(mean, 2),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 2),
+        'fps': round(1000 / mean, 1) if mean > 0 else None,
+    }
+
+
+def compare_outputs(reference, candidate):
+    """
+    Score a candidate run against a reference run over the same frames:
+    rider recall/precision at MATCH_IOU, and on matched riders how often the
+    no-helmet verdict and the set of helmet/plate classes agree.
+    """
+    ref_total = cand_total = matched = verdict_same = classes_same = 0
+    for (ref_riders, ref_dets), (riders, dets) in zip(reference, candidate):
+        ref_total += len(ref_riders)
+        cand_total += len(riders)
+        if not ref_riders or not riders:
+            continue
+        ious = iou_matrix(ref_riders, riders)
+        used = set()
+        for i in np.argsort(-ious.max(axis=1)):
+            j = int(ious[i].argmax())
+            if ious[i, j] < MATCH_IOU or j in used:
+                continue
+            used.add(j)
+            matched += 1
+            ref_kinds = sorted(d.kind for d in ref_dets[i])
+            kinds = sorted(d.kind for d in dets[j])
+            classes_same += ref_kinds == kinds
+            verdict_same += (KIND_NO_HELMET in ref_kinds) == (KIND_NO_HELMET in kinds)
+    return {
+        'reference_riders': ref_total,
+        'candidate_riders': cand_total,
+        'matched_riders': matched,
+        'rider_recall': round(matched / ref_total, 4) if ref_total else None,
+        'rider_precision': round(matched / cand_total, 4) if cand_total else None,
+        'verdict_agreement': round(verdict_same / matched, 4) if matched else None,
+        'class_agreement': round(classes_same / matched, 4) if matched else None,
+    }
@@ -0,0 +1,136 @@
+"""
+Best-frame evidence per tracked rider.
+
+Instead of saving the first frame that shows "no helmet" (often blurred, or
+with the plate cut off), every such frame of a track is scored and only the
+best one is kept. The violation is encoded and queued once, when the track
+ends or `max_wait` seconds after it was confirmed, whichever comes first.
+"""
+import threading
+
+import cv2
+
+SHARPNESS_HEIGHT = 128   # crops are scored at this height so near and far riders compare fairly
+SHARPNESS_HALF = 100.0   # Laplacian variance that scores 0.5 on the sharpness term
+PLATE_AREA_FULL = 2000   # plate crop area (px) that scores 1.0 on the plate term
+WEIGHTS = (0.4, 0.35, 0.25)  # sharpness, plate area, no-helmet confidence
+
+
+def sharpness(image):
+    """Variance of the Laplacian of the grey image (at most SHARPNESS_HEIGHT tall); higher is sharper."""
+    grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    h, w = grey.shape
+    if h > SHARPNESS_HEIGHT:
+        grey = cv2.resize(grey, (max(1, w * SHARPNESS_HEIGHT // h), SHARPNESS_HEIGHT), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(grey, cv2.CV_64F).var())
+
+
+def _unit(sharp):
+    return sharp / (sharp + SHARPNESS_HALF)
+
+
+def frame_score(rider_sharpness, plate_area, conf, weights=WEIGHTS):
+    """0..1 score of one candidate frame: sharp rider, large plate, confident "no helmet"."""
+    return (weights[0] * _unit(rider_sharpness)
+            + weights[1] * min(1.0, plate_area / PLATE_AREA_FULL)
+            + weights[2] * conf)
+
+
+def plate_score(plate_crop):
+    """0..1 score of a plate crop: large and sharp enough to read."""
+    h, w = plate_crop.shape[:2]
+    return min(1.0, w * h / PLATE_AREA_FULL) * _unit(sharpness(plate_crop))
+
+
+class Evidence:
+    """The best frame and the best plate crop seen so far for one track."""
+
+    __slots__ = ('annotated', 'rider_crop', 'score', 'captured_at', 'plate_crop', 'plate_number',
+                 'plate_score', 'candidates', 'confirmed_at')
+
+    def __init__(self):
+        self.annotated = None     # copy of the full annotated frame as it was when offered
+        self.rider_crop = None
+        self.score = -1.0
+        self.captured_at = None
+        self.plate_crop = None
+        self.plate_number = None
+        self.plate_score = -1.0
+        self.candidates = 0
+        self.confirmed_at = None  # when k-of-n voting declared the violation; None = not (yet) a violation
+
+
+class EvidenceBuffer:
+    """
+    Candidate evidence per track id for one camera.
+
+        offer(...)     every checked frame that shows "no helmet"
+        confirm(...)   the track's violation is decided
+        due(now)       confirmed tracks that have waited `max_wait` seconds
+        pop(ids)       tracks that ended; unconfirmed ones are discarded
+        drain()        everything confirmed (engine stop)
+
+    due/pop/drain remove what they return, so each rider is saved at most once.
+    """
+
+    def __init__(self, max_wait=3.0):
+        self.max_wait = max_wait
+        self.pending = {}  # track_id -> Evidence
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def offer(self, track_id, captured_at, annotated, rider_crop, conf, plate_crop=None, plate_number=None):
+        """
+        Score a candidate frame; keep a copy of it if it beats the track's
+        best. Returns True if it did. Only improvements are copied, so a
+        rider costs a few frame copies, not one per check.
+        """
+        plate_area = plate_crop.shape[0] * plate_crop.shape[1] if plate_crop is not None else 0
+        score = frame_score(sharpness(rider_crop), plate_area, conf)
+        plate = plate_score(plate_crop) if plate_crop is not None else -1.0
+        with self.lock:
+            evidence = self.pending.get(track_id)
+            if evidence is None:
+                evidence = self.pending[track_id] = Evidence()
+            evidence.candidates += 1
+            if plate > evidence.plate_score:
+                evidence.plate_score = plate
+                evidence.plate_crop = plate_crop.copy()
+                evidence.plate_number = plate_number or evidence.plate_number
+            elif plate_number and not evidence.plate_number:
+                evidence.plate_number = plate_number
+            if score <= evidence.score:
+                return False
+            evidence.score = score
+            # process_frame keeps drawing later riders on `annotated`, so snapshot it now
+            evidence.annotated = annotated.copy()
+            evidence.rider_crop = rider_crop.copy()  # a view would keep the whole source frame alive
+            evidence.captured_at = captured_at
+            return True
+
+    def confirm(self, track_id, now):
+        with self.lock:
+            evidence = self.pending.get(track_id)
+            if evidence is not None and evidence.confirmed_at is None:
+                evidence.confirmed_at = now
+
+    def due(self, now):
+        """[(track_id, Evidence)] of confirmed tracks whose time limit is up."""
+        with self.lock:
+            ready = [track_id for track_id, evidence in self.pending.items()
+                     if evidence.confirmed_at is not None and now - evidence.confirmed_at >= self.max_wait]
+            return [(track_id, self.pending.pop(track_id)) for track_id in ready]
+
+    def pop(self, track_ids):
+        """[(track_id, Evidence)] of the confirmed tracks among `track_ids`; the rest are dropped."""
+        with self.lock:
+            ended = [(track_id, self.pending.pop(track_id, None)) for track_id in track_ids]
+        return [(track_id, evidence) for track_id, evidence in ended
+                if evidence is not None and evidence.confirmed_at is not None]
+
+    def drain(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        return [(track_id, evidence) for track_id, evidence in pending.items() if evidence.confirmed_at is not None]
@@ -0,0 +1,320 @@
+"""
+Shared-memory frame bus: one capture process per camera decodes the feed and
+publishes frames into a ring of fixed-size slots in a named
+multiprocessing.shared_memory block; any number of local processes attach by
+name and read frames without another RTSP connection or decode.
+
+Layout of the block (all little-endian, native alignment):
+
+    header   int64[12]  magic, slots, height, width, channels, latest_seq, writer_pid,
+                        grabbed, decoded, dropped, degraded, writer_start
+    slot i   int64 seq, float64 monotonic, float64 wall time, then height*width*channels bytes
+
+Writes follow a seqlock: a slot's seq is set to -1 while its pixels are being
+replaced and to the new sequence number after, and the header's latest_seq
+moves last. Readers check the slot's seq before and after copying, so a
+frame overwritten mid-read is detected and retried instead of returned torn.
+Do not import Django here; capture processes are spawned without it.
+"""
+import multiprocessing as mp
+import os
+import time
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+MAGIC = 0x53524153_46425553  # "SRASFBUS"
+HEADER_FIELDS = 12
+COUNTERS = slice(7, 11)  # the capture process's CaptureCounters, refreshed on every publish
+SLOT_META = 24  # seq, monotonic, wall
+DEFAULT_SLOTS = 8
+
+BusFrame = namedtuple('BusFrame', ['seq', 'frame', 'captured_at', 'wall_time'])
+
+
+class RingInUse(FileExistsError):
+    """The ring's name belongs to a live writer (another engine is capturing this camera)."""
+
+
+def ring_name(camera_id):
+    return f"sras_cam_{camera_id}"
+
+
+def _pid_alive(pid):
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # exists, owned by another user
+    return True
+
+
+def _process_start(pid):
+    """Start time of `pid` in clock ticks since boot (Linux /proc), 0 where unknown."""
+    try:
+        with open(f"/proc/{pid}/stat", 'rb') as f:
+            stat = f.read()
+        # fields after the command name, which may itself contain spaces; starttime is field 22
+        return int(stat[stat.rindex(b')') + 2:].split()[19])
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _writer_alive(pid, started):
+    """Whether the ring's writer still runs: its pid exists and was not reused by a newer process."""
+    if not _pid_alive(pid):
+        return False
+    current = _process_start(pid)
+    return not (started and current and current != started)
+
+
+def _attach(name, track):
+    """
+    Open an existing block. Unrelated reader processes pass track=False so
+    their resource tracker does not unlink the ring when they exit; the
+    engine shares a tracker with the capture processes it spawned, so it
+    keeps tracking (and cleans up after a capture process that was killed).
+    """
+    if track:
+        return shared_memory.SharedMemory(name=name)
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+        return shm
+
+
+class FrameRing:
+    """A ring of frame slots in shared memory. create() in the writer, attach() in readers."""
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        if self.header[0] != MAGIC:
+            raise ValueError(f"Shared memory block '{shm.name}' is not a frame ring")
+        self.slots = int(self.header[1])
+        self.shape = (int(self.header[2]), int(self.header[3]), int(self.header[4]))
+        self.frame_bytes = int(np.prod(self.shape))
+        self.slot_bytes = SLOT_META + self.frame_bytes
+        base = HEADER_FIELDS * 8
+        self.meta = [
+            np.ndarray((3,), dtype=np.float64, buffer=shm.buf, offset=base + i * self.slot_bytes)
+            for i in range(self.slots)
+        ]
+        self.seqs = [
+            np.ndarray((1,), dtype=np.int64, buffer=shm.buf, offset=base + i * self.slot_bytes)
+            for i in range(self.slots)
+        ]
+        self.pixels = [
+            np.ndarray(self.shape, dtype=np.uint8, buffer=shm.buf, offset=base + i * self.slot_bytes + SLOT_META)
+            for i in range(self.slots)
+        ]
+
+    @classmethod
+    def create(cls, name, shape, slots=DEFAULT_SLOTS):
+        h, w, c = shape
+        size = HEADER_FIELDS * 8 + slots * (SLOT_META + h * w * c)
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # take over a block left behind by a capture process that died, never a live writer's
+            existing = shared_memory.SharedMemory(name=name)
+            pid = started = 0
+            if existing.size >= HEADER_FIELDS * 8:
+                old = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=existing.buf)
+                pid, started = int(old[6]), int(old[11])
+                del old
+            if pid != os.getpid() and _writer_alive(pid, started):
+                existing.close()
+                raise RingInUse(f"Frame ring '{name}' is in use by process {pid}")
+            existing.close()
+            existing.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        header[1:] = [slots, h, w, c, -1, os.getpid(), 0, 0, 0, 0, _process_start(os.getpid())]
+        for i in range(slots):
+            np.ndarray((1,), dtype=np.int64, buffer=shm.buf, offset=HEADER_FIELDS * 8 + i * (SLOT_META + h * w * c))[0] = -1
+        header[0] = MAGIC  # last, so readers never attach to a half-initialised block
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name, track=False):
+        return cls(_attach(name, track), owner=False)
+
+    @property
+    def latest_seq(self):
+        return int(self.header[5])
+
+    @property
+    def writer_pid(self):
+        return int(self.header[6])
+
+    def counters(self):
+        """The writer's grabbed/decoded/dropped counters as a dict."""
+        grabbed, decoded, dropped, degraded = (int(v) for v in self.header[COUNTERS])
+        return {'grabbed': grabbed, 'decoded': decoded, 'dropped': dropped, 'degraded': bool(degraded)}
+
+    def set_counters(self, counters):
+        self.header[COUNTERS] = [counters.grabbed, counters.decoded, counters.dropped, int(counters.degraded)]
+
+    def publish(self, frame, captured_at=None, wall_time=None):
+        """Write one frame (resized if the camera changed resolution). Returns its sequence number."""
+        if frame.shape != self.shape:
+            import cv2
+            frame = cv2.resize(frame, (self.shape[1], self.shape[0]))
+        seq = self.latest_seq + 1
+        i = seq % self.slots
+        self.seqs[i][0] = -1
+        self.pixels[i][...] = frame
+        meta = self.meta[i]
+        meta[1] = captured_at if captured_at is not None else time.monotonic()
+        meta[2] = wall_time if wall_time is not None else time.time()
+        self.seqs[i][0] = seq
+        self.header[5] = seq
+        return seq
+
+    def read(self, seq=None, copy=True):
+        """
+        Frame `seq` (default: the latest) as a BusFrame, or None if it is not
+        (or no longer) in the ring. With copy=False the frame is a view into
+        shared memory: valid only until the writer laps the ring, so check
+        still_valid(seq) after using it.
+        """
+        for _ in range(3):
+            latest = self.latest_seq
+            target = latest if seq is None else seq
+            if target < 0 or target > latest or latest - target >= self.slots:
+                return None
+            i = target % self.slots
+            if self.seqs[i][0] != target:
+                continue
+            captured_at, wall_time = float(self.meta[i][1]), float(self.meta[i][2])
+            frame = self.pixels[i].copy() if copy else self.pixels[i]
+            if self.seqs[i][0] == target:
+                return BusFrame(target, frame, captured_at, wall_time)
+        return None
+
+    def still_valid(self, seq):
+        return self.seqs[seq % self.slots][0] == seq
+
+    def wait_next(self, last_seq, timeout=1.0, poll=0.002):
+        """Poll until a frame newer than last_seq exists; returns the latest seq, or None on timeout."""
+        deadline = time.monotonic() + timeout
+        while True:
+            latest = self.latest_seq
+            if latest > last_seq:
+                return latest
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(poll)
+
+    def close(self):
+        # drop our views before closing the mapping
+        self.header = self.meta = self.seqs = self.pixels = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def capture_main(camera, source_factory, name, slots, reconnect_after, stop_event, max_fps=0):
+    """
+    Capture process body: open the source, create the ring on the first frame,
+    then publish decoded frames. With max_fps, frames arriving faster than that
+    are grabbed but not decoded (sources.read_when_due()). Reopens the source
+    after `reconnect_after` seconds without a frame.
+    """
+    from .sources import CaptureCounters, read_when_due
+
+    counters = CaptureCounters()  # kept across reconnects
+    source = source_factory(camera)
+    source.counters = counters
+    interval = 1.0 / max_fps if max_fps else 0.0
+    ring = None
+    last_frame = time.monotonic()
+    try:
+        while not stop_event.is_set():
+            ok, frame = read_when_due(source, last_frame, interval)
+            if not ok:
+                if time.monotonic() - last_frame > reconnect_after:
+                    print(f"🔌 Camera '{camera.name}' stalled, reconnecting...")
+                    source.release()
+                    source = source_factory(camera)
+                    source.counters = counters
+                    last_frame = time.monotonic()
+                time.sleep(0.01)
+                continue
+            last_frame = time.monotonic()
+            if ring is None:
+                try:
+                    ring = FrameRing.create(name, frame.shape, slots)
+                except RingInUse as e:
+                    print(f"❌ Camera '{camera.name}': {e}; is another stream server running?")
+                    return
+            ring.publish(frame, captured_at=last_frame)
+            ring.set_counters(counters)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        source.release()
+        if ring is not None:
+            ring.close()
+
+
+class CaptureProcess:
+    """Runs capture_main() for one camera in a spawned process that owns the ring."""
+
+    def __init__(self, camera, source_factory, slots=DEFAULT_SLOTS, reconnect_after=5.0, max_fps=0):
+        self.camera = camera
+        self.name = ring_name(camera.id)
+        ctx = mp.get_context('spawn')
+        self.stop_event = ctx.Event()
+        self.process = ctx.Process(
+            target=capture_main,
+            args=(camera, source_factory, self.name, slots, reconnect_after, self.stop_event, max_fps),
+            name=f"capture-{camera.id}",
+            daemon=True,
+        )
+
+    def start(self):
+        self.process.start()
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def attach(self, timeout=10.0):
+        """Attach to the ring once the capture process has published its first frame (None on timeout)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and self.process.is_alive():
+            try:
+                ring = FrameRing.attach(self.name, track=True)
+            except (FileNotFoundError, ValueError):
+                time.sleep(0.05)
+                continue
+            if self.owns(ring):
+                return ring
+            ring.close()  # left over from a previous capture process that was killed
+            time.sleep(0.05)
+        return None
+
+    def owns(self, ring):
+        return ring.writer_pid == self.process.pid
+
+    def stop(self, timeout=2.0):
+        self.stop_event.set()
+        self.process.join(timeout=timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=1.0)
@@ -0,0 +1,411 @@
+"""
+Cross-camera inference server.
+
+One process owns the detector and helmet/plate models and serves predict()
+calls from any number of clients over a local socket
+(multiprocessing.connection). Requests that arrive within a small latency
+budget are merged into one forward pass:
+
+    - a batch is cut when its oldest request has waited `budget` seconds, when
+      it reaches `max_batch` images, or when every connected camera already
+      has a request queued (waiting longer cannot grow the batch);
+    - only requests for the same (model, precision, conf, imgsz) share a batch;
+    - requests are queued per camera and taken round-robin, one per camera per
+      turn, so a camera with many riders cannot starve the others.
+
+Clients use RemoteBackend, which has the same names/predict()/warmup()
+interface as the local backends, so detection.py runs unchanged against it.
+Do not import Django here; the server is a spawned process.
+
+The connection carries pickles, so it must only be reachable by this
+engine: by default the socket lives in a fresh 0700 directory and every run
+uses a random authentication key, handed to the clients by the engine.
+"""
+import itertools
+import multiprocessing as mp
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from .backends import FP32
+
+SOCKET_NAME = 'inference.sock'
+WAIT_SAMPLES = 500  # recent queue waits kept per camera for percentiles
+
+
+class Request:
+    __slots__ = ('conn', 'request_id', 'camera', 'key', 'images', 'queued_at')
+
+    def __init__(self, conn, request_id, camera, key, images):
+        self.conn = conn
+        self.request_id = request_id
+        self.camera = camera
+        self.key = key
+        self.images = images
+        self.queued_at = time.monotonic()
+
+
+class BatchScheduler:
+    """Per-camera request queues, batch assembly and metrics (server side)."""
+
+    def __init__(self, budget=0.015, max_batch=8):
+        self.budget = budget
+        self.max_batch = max_batch
+        self.cond = threading.Condition()
+        self.queues = defaultdict(deque)   # camera -> deque[Request]
+        self.cursor = 0
+        self.cameras = set()               # cameras seen recently, for the "everyone is waiting" cut
+        self.last_seen = {}
+
+        # metrics
+        self.served = defaultdict(int)
+        self.images = defaultdict(int)
+        self.waits = defaultdict(lambda: deque(maxlen=WAIT_SAMPLES))
+        self.batches = 0
+        self.batch_images = 0
+        self.max_batch_seen = 0
+        self.infer_time = 0.0
+
+    def put(self, request):
+        with self.cond:
+            self.queues[request.camera].append(request)
+            self.last_seen[request.camera] = request.queued_at
+            self.cond.notify()
+
+    def _active_cameras(self, now):
+        # a camera that has not asked for anything in a second is not worth waiting for
+        return [c for c, t in self.last_seen.items() if now - t < 1.0]
+
+    def next_batch(self, stop_event):
+        """Block until a batch is due; returns a list of Requests sharing one key."""
+        with self.cond:
+            while not stop_event.is_set():
+                pending = [q[0] for q in self.queues.values() if q]
+                if not pending:
+                    self.cond.wait(timeout=0.1)
+                    continue
+                oldest = min(pending, key=lambda r: r.queued_at)
+                key = oldest.key
+                now = time.monotonic()
+                same_key = [r for q in self.queues.values() for r in q if r.key == key]
+                n_images = sum(len(r.images) for r in same_key)
+                waiting = {r.camera for r in same_key}
+                due = (now - oldest.queued_at >= self.budget
+                       or n_images >= self.max_batch
+                       or waiting >= set(self._active_cameras(now)))
+                if not due:
+                    self.cond.wait(timeout=max(0.0, self.budget - (now - oldest.queued_at)))
+                    continue
+                return self._take(key)
+            return []
+
+    def _take(self, key):
+        """Round-robin over cameras, one request each per turn, until max_batch images."""
+        cameras = sorted(self.queues, key=str)
+        if not cameras:
+            return []
+        start = self.cursor % len(cameras)
+        order = cameras[start:] + cameras[:start]
+        self.cursor += 1
+        batch, n_images = [], 0
+        progress = True
+        while progress and n_images < self.max_batch:
+            progress = False
+            for camera in order:
+                q = self.queues[camera]
+                for i, request in enumerate(q):
+                    if request.key != key:
+                        continue
+                    # always take at least one request, even if it alone exceeds max_batch
+                    if batch and n_images + len(request.images) > self.max_batch:
+                        break
+                    del q[i]
+                    batch.append(request)
+                    n_images += len(request.images)
+                    progress = True
+                    break
+                if n_images >= self.max_batch:
+                    break
+        return batch
+
+    def record(self, batch, seconds):
+        now = time.monotonic()
+        n_images = sum(len(r.images) for r in batch)
+        with self.cond:
+            self.batches += 1
+            self.batch_images += n_images
+            self.max_batch_seen = max(self.max_batch_seen, n_images)
+            self.infer_time += seconds
+            for r in batch:
+                self.served[r.camera] += 1
+                self.images[r.camera] += len(r.images)
+                self.waits[r.camera].append(now - seconds - r.queued_at)
+
+    def stats(self):
+        with self.cond:
+            cameras = {}
+            for camera in set(self.served) | set(self.queues):
+                waits = np.array(self.waits[camera]) * 1000 if self.waits[camera] else np.zeros(1)
+                cameras[str(camera)] = {
+                    'queue_depth': len(self.queues[camera]),
+                    'requests': self.served[camera],
+                    'images': self.images[camera],
+                    'wait_ms_mean': round(float(waits.mean()), 2),
+                    'wait_ms_p95': round(float(np.percentile(waits, 95)), 2),
+                }
+            return {
+                'batches': self.batches,
+                'avg_batch': round(self.batch_images / self.batches, 2) if self.batches else 0.0,
+                'max_batch': self.max_batch_seen,
+                'avg_infer_ms': round(self.infer_time / self.batches * 1000, 2) if self.batches else 0.0,
+                'queue_depth': sum(len(q) for q in self.queues.values()),
+                'cameras': cameras,
+            }
+
+
+class _Server:
+    def __init__(self, loader, address, budget, max_batch):
+        self.loader = loader
+        self.address = address
+        self.scheduler = BatchScheduler(budget, max_batch)
+        self.stop_event = threading.Event()
+        self.models = {}   # (role, precision) -> Future
+        self.models_lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='model-load')
+        self.send_locks = {}  # connection -> lock, while it is open
+
+    def model(self, role, precision):
+        with self.models_lock:
+            future = self.models.get((role, precision))
+            if future is None:
+                future = self.pool.submit(self.loader, role, precision)
+                self.models[(role, precision)] = future
+        return future.result()
+
+    def send(self, conn, message):
+        lock = self.send_locks.get(conn)
+        if lock is None:
+            return  # the client has gone
+        with lock:
+            try:
+                conn.send(message)
+            except (OSError, EOFError, BrokenPipeError):
+                pass
+
+    def reply_names(self, conn, request_id, role, precision):
+        try:
+            names = self.model(role, precision).names
+            self.send(conn, (request_id, True, names))
+        except Exception as e:
+            self.send(conn, (request_id, False, f"{type(e).__name__}: {e}"))
+
+    def serve_connection(self, conn):
+        self.send_locks[conn] = threading.Lock()
+        try:
+            while not self.stop_event.is_set():
+                message = conn.recv()
+                op, request_id = message[0], message[1]
+                if op == 'predict':
+                    _, _, camera, role, precision, images, conf, imgsz = message
+                    key = (role, precision, conf, imgsz if not isinstance(imgsz, list) else tuple(imgsz))
+                    self.scheduler.put(Request(conn, request_id, camera, key, images))
+                elif op == 'names':
+                    self.pool.submit(self.reply_names, conn, request_id, message[2], message[3])
+                elif op == 'stats':
+                    self.send(conn, (request_id, True, self.scheduler.stats()))
+        except (EOFError, OSError):
+            pass
+        finally:
+            lock = self.send_locks.pop(conn)
+            with lock:
+                conn.close()
+
+    def accept_loop(self, listener):
+        while not self.stop_event.is_set():
+            try:
+                conn = listener.accept()
+            except AuthenticationError:
+                continue  # wrong key: drop that client, keep serving
+            except OSError:
+                break
+            threading.Thread(target=self.serve_connection, args=(conn,), daemon=True).start()
+
+    def run_batches(self):
+        while not self.stop_event.is_set():
+            batch = self.scheduler.next_batch(self.stop_event)
+            if not batch:
+                continue
+            role, precision, conf, imgsz = batch[0].key
+            images = [image for r in batch for image in r.images]
+            started = time.perf_counter()
+            try:
+                results = self.model(role, precision).predict(images, conf=conf, imgsz=imgsz)
+            except Exception as e:
+                for r in batch:
+                    self.send(r.conn, (r.request_id, False, f"{type(e).__name__}: {e}"))
+                continue
+            self.scheduler.record(batch, time.perf_counter() - started)
+            offset = 0
+            for r in batch:
+                self.send(r.conn, (r.request_id, True, results[offset:offset + len(r.images)]))
+                offset += len(r.images)
+
+
+def server_main(loader, address, authkey, budget, max_batch, stop_event):
+    if os.path.exists(address):
+        os.unlink(address)
+    server = _Server(loader, address, budget, max_batch)
+    listener = Listener(address, family='AF_UNIX', authkey=authkey)
+    threading.Thread(target=server.accept_loop, args=(listener,), daemon=True).start()
+    threading.Thread(target=server.run_batches, daemon=True).start()
+    try:
+        stop_event.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop_event.set()
+        listener.close()
+        if os.path.exists(address):
+            os.unlink(address)
+
+
+class InferenceServer:
+    """
+    Spawns server_main() in its own process. `loader` must be picklable:
+    (role, precision) -> backend. Without an `address` the socket is created
+    in a private temporary directory. Clients connect with
+    InferenceClient(server.address, server.authkey).
+    """
+
+    def __init__(self, loader, address=None, budget=0.015, max_batch=8):
+        self.private_dir = None
+        if address is None:
+            self.private_dir = tempfile.mkdtemp(prefix='sras-inference-')  # mode 0700
+            address = os.path.join(self.private_dir, SOCKET_NAME)
+        self.address = address
+        self.authkey = os.urandom(32)
+        ctx = mp.get_context('spawn')
+        self.stop_event = ctx.Event()
+        self.process = ctx.Process(
+            target=server_main, args=(loader, address, self.authkey, budget, max_batch, self.stop_event),
+            name='inference-server', daemon=True,
+        )
+
+    def start(self):
+        self.process.start()
+        return self
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def stop(self, timeout=2.0):
+        self.stop_event.set()
+        self.process.join(timeout=timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=1.0)
+        if self.private_dir is not None:
+            shutil.rmtree(self.private_dir, ignore_errors=True)
+
+
+class InferenceClient:
+    """
+    One connection to the server, shared by every thread of a process.
+    Replies are matched to callers by request id. Set the calling thread's
+    camera with set_camera() so the server can queue its requests fairly.
+    """
+
+    def __init__(self, address, authkey, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.conn = Client(address, family='AF_UNIX', authkey=authkey)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        self.ids = itertools.count()
+        self.send_lock = threading.Lock()
+        self.pending = {}  # request id -> [Event, ok, value]
+        self.pending_lock = threading.Lock()
+        self.local = threading.local()
+        self.closed = False
+        self.reader = threading.Thread(target=self._read_replies, name='inference-client', daemon=True)
+        self.reader.start()
+
+    def set_camera(self, camera):
+        self.local.camera = camera
+
+    def _read_replies(self):
+        try:
+            while True:
+                request_id, ok, value = self.conn.recv()
+                with self.pending_lock:
+                    slot = self.pending.pop(request_id, None)
+                if slot is not None:
+                    slot[1], slot[2] = ok, value
+                    slot[0].set()
+        except (EOFError, OSError):
+            self.closed = True
+            with self.pending_lock:
+                for slot in self.pending.values():
+                    slot[1], slot[2] = False, 'inference server connection closed'
+                    slot[0].set()
+                self.pending.clear()
+
+    def call(self, op, *args, timeout=60.0):
+        if self.closed:
+            raise ConnectionError('inference server connection closed')
+        request_id = next(self.ids)
+        slot = [threading.Event(), False, None]
+        with self.pending_lock:
+            self.pending[request_id] = slot
+        with self.send_lock:
+            self.conn.send((op, request_id) + args)
+        if not slot[0].wait(timeout):
+            with self.pending_lock:
+                self.pending.pop(request_id, None)
+            raise TimeoutError(f"inference server did not answer '{op}' within {timeout}s")
+        if not slot[1]:
+            raise RuntimeError(slot[2])
+        return slot[2]
+
+    def predict(self, role, precision, images, conf, imgsz):
+        camera = getattr(self.local, 'camera', None)
+        return self.call('predict', camera, role, precision, list(images), conf, imgsz)
+
+    def names(self, role, precision, timeout=300.0):
+        return self.call('names', role, precision, timeout=timeout)
+
+    def stats(self):
+        return self.call('stats')
+
+    def close(self):
+        self.closed = True
+        self.conn.close()
+
+
+class RemoteBackend:
+    """Backend interface (names/predict/warmup) over an InferenceClient."""
+
+    def __init__(self, client, role, precision=FP32):
+        self.client = client
+        self.role = role
+        self.precision = precision
+        self.kind = 'remote'
+        self.names = client.names(role, precision)  # blocks until the server has the model loaded
+
+    def predict(self, images, conf=0.25, imgsz=None):
+        return self.client.predict(self.role, self.precision, images, conf, imgsz)
+
+    def warmup(self, runs=2):
+        return 0.0  # the server warms its own models
@@ -0,0 +1,241 @@
+import bisect
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Prometheus histogram bucket bounds for stage latencies (seconds)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class _Stage:
+    """Context manager timing one stage; reused per name so the hot path does not allocate."""
+
+    __slots__ = ('timer', 'name', 'started')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.record(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class StageTimer:
+    """
+    Wall time per pipeline stage (capture, resize, detector, pairing, ...),
+    kept as the last `keep` samples per stage for percentiles, and as
+    cumulative histogram buckets (`buckets`, seconds) since start for
+    Prometheus.
+
+        with timer.stage('detector'):
+            result = model.predict(...)
+
+    stage() contexts are not re-entrant per name across threads; each camera's
+    work runs on one thread at a time, and record() itself is thread-safe.
+    """
+
+    def __init__(self, keep=2048, buckets=STAGE_BUCKETS):
+        self.keep = keep
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.samples = {}   # stage -> deque of seconds
+        self.counts = {}    # stage -> total samples ever recorded
+        self.totals = {}    # stage -> total seconds ever recorded
+        self.bucket_counts = {}  # stage -> per-bucket (non-cumulative) counts, last one is +Inf
+        self.local = threading.local()
+
+    def stage(self, name):
+        stages = getattr(self.local, 'stages', None)
+        if stages is None:
+            stages = self.local.stages = {}
+        ctx = stages.get(name)
+        if ctx is None:
+            ctx = stages[name] = _Stage(self, name)
+        return ctx
+
+    def record(self, name, seconds):
+        with self.lock:
+            samples = self.samples.get(name)
+            if samples is None:
+                samples = self.samples[name] = deque(maxlen=self.keep)
+                self.counts[name] = 0
+                self.totals[name] = 0.0
+                self.bucket_counts[name] = [0] * (len(self.buckets) + 1)
+            samples.append(seconds)
+            self.counts[name] += 1
+            self.totals[name] += seconds
+            self.bucket_counts[name][bisect.bisect_left(self.buckets, seconds)] += 1
+
+    def reset(self):
+        with self.lock:
+            self.samples = {}
+            self.counts = {}
+            self.totals = {}
+            self.bucket_counts = {}
+
+    def histograms(self):
+        """{stage: ([(upper bound, cumulative count), ..., ('+Inf', count)], sum seconds, count)}"""
+        with self.lock:
+            out = {}
+            for name, counts in self.bucket_counts.items():
+                cumulative = np.cumsum(counts).tolist()
+                bounds = list(self.buckets) + ['+Inf']
+                out[name] = (list(zip(bounds, cumulative)), self.totals[name], self.counts[name])
+            return out
+
+    def summary(self):
+        """{stage: {count, mean_ms, p50_ms, p90_ms, p99_ms, max_ms}} over the kept samples."""
+        with self.lock:
+            snapshot = {name: (np.array(samples) * 1000, self.counts[name]) for name, samples in self.samples.items()}
+        out = {}
+        for name, (ms, count) in snapshot.items():
+            if len(ms) == 0:
+                continue
+            p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+            out[name] = {
+                'count': count,
+                'mean_ms': round(float(ms.mean()), 3),
+                'p50_ms': round(float(p50), 3),
+                'p90_ms': round(float(p90), 3),
+                'p99_ms': round(float(p99), 3),
+                'max_ms': round(float(ms.max()), 3),
+            }
+        return out
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullTimer:
+    """StageTimer stand-in that records nothing (the default for library callers)."""
+
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def record(self, name, seconds):
+        pass
+
+    def summary(self):
+        return {}
+
+    def histograms(self):
+        return {}
+
+
+NULL_TIMER = NullTimer()
+
+
+class RateMeter:
+    """Events per second over the last `window` seconds (capture FPS, inference FPS, ...)."""
+
+    def __init__(self, window=5.0):
+        self.window = window
+        self.times = deque()
+        self.lock = threading.Lock()
+
+    def tick(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.times.append(now)
+            self._expire(now)
+
+    def _expire(self, now):
+        while self.times and now - self.times[0] > self.window:
+            self.times.popleft()
+
+    def rate(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self._expire(now)
+            if len(self.times) < 2:
+                return 0.0
+            span = max(now - self.times[0], 1e-6)
+            return len(self.times) / span
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+
+def render_prometheus(status, timer):
+    """
+    Prometheus text exposition (version 0.0.4) of StreamEngine.status() plus
+    the stage latency histograms of `timer`.
+    """
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{_labels(labels)} {float(value):g}")
+
+    cameras = status['cameras']
+
+    def per_camera(key, nested=None):
+        return [({'camera': c['id'], 'name': c['name']}, (c[nested][key] if nested else c[key])) for c in cameras]
+
+    metric('sras_uptime_seconds', 'gauge', 'Seconds since the engine started.', [({}, status['uptime_seconds'])])
+    metric('sras_models_ready', 'gauge', '1 once every requested model has loaded.',
+           [({}, int(status['models_ready']))])
+    metric('sras_viewers', 'gauge', 'Connected MJPEG viewers.', per_camera('viewers'))
+    metric('sras_fps', 'gauge', 'Frames per second over the last few seconds.',
+           [({'camera': c['id'], 'name': c['name'], 'kind': kind}, c[f'{kind}_fps'])
+            for c in cameras for kind in ('capture', 'inference')])
+    metric('sras_frame_queue_depth', 'gauge', 'Frames waiting for the inference thread.', per_camera('queue_depth'))
+    metric('sras_pending_evidence', 'gauge', 'Violating riders whose best frame is still being chosen.',
+           per_camera('pending_evidence'))
+    metric('sras_frames_captured_total', 'counter', 'Frames handed to the pipeline.', per_camera('frames_received'))
+    metric('sras_frames_inferred_total', 'counter', 'Frames the detector ran on.', per_camera('frames_inferred'))
+    metric('sras_motion_gated_total', 'counter', 'Frames skipped by the motion gate.', per_camera('motion_gated'))
+    metric('sras_frames_dropped_total', 'counter', 'Frames dropped, by where.',
+           [({'camera': c['id'], 'name': c['name'], 'reason': 'queue'}, c['frames_replaced']) for c in cameras]
+           + [({'camera': c['id'], 'name': c['name'], 'reason': 'undecoded'}, c['capture']['dropped'])
+              for c in cameras])
+    metric('sras_capture_grabbed_total', 'counter', 'Frames grabbed from the camera.', per_camera('grabbed', 'capture'))
+    metric('sras_capture_decoded_total', 'counter', 'Frames decoded to BGR.', per_camera('decoded', 'capture'))
+    metric('sras_capture_degraded', 'gauge', '1 while the decoder only decodes keyframes.',
+           [(labels, int(value)) for labels, value in per_camera('degraded', 'capture')])
+
+    writer = status['writer']
+    for key, help_text in (('submitted', 'Violations queued for the database.'),
+                           ('written', 'Violations written to the database.'),
+                           ('duplicates', 'Violations dropped as database duplicates.'),
+                           ('dropped', 'Violations dropped because the writer queue was full.'),
+                           ('failed', 'Violations that could not be written.')):
+        if key in writer:
+            metric(f'sras_violations_{key}_total', 'counter', help_text, [({}, writer[key])])
+    metric('sras_writer_queue_depth', 'gauge', 'Violations waiting for the writer thread.',
+           [({}, writer.get('queue_depth', 0))])
+
+    histograms = timer.histograms()
+    if histograms:
+        lines.append('# HELP sras_stage_seconds Wall time per pipeline stage.')
+        lines.append('# TYPE sras_stage_seconds histogram')
+        for stage, (buckets, total, count) in sorted(histograms.items()):
+            for bound, cumulative in buckets:
+                le = bound if bound == '+Inf' else f'{bound:g}'
+                lines.append(f'sras_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'sras_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'sras_stage_seconds_count{{stage="{stage}"}} {count}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,68 @@
+import threading
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Cheap scene-change test run before the detector.
+
+    Each frame is shrunk to a small grayscale image and compared with a running
+    average background (cv2.accumulateWeighted). If fewer than `area_threshold`
+    of the pixels differ by more than `pixel_threshold` grey levels, the scene
+    is considered static and full detection can be skipped. Detection is still
+    forced every `max_interval` seconds so slow changes are never missed.
+    """
+
+    def __init__(self, size=(160, 90), pixel_threshold=25, area_threshold=0.002,
+                 alpha=0.05, max_interval=5.0):
+        self.size = size
+        self.pixel_threshold = pixel_threshold
+        self.area_threshold = area_threshold
+        self.alpha = alpha
+        self.max_interval = max_interval
+        self.background = None
+        self.last_inferred = None
+        self.last_fraction = 0.0
+        self.lock = threading.Lock()
+        self.gated = 0
+        self.inferred = 0
+
+    def motion_fraction(self, frame):
+        """Fraction of (downscaled) pixels that differ from the background; updates the background."""
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        gray = small if small.ndim == 2 else cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+        if self.background is None:
+            self.background = gray.astype(np.float32)
+            return 1.0
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        changed = np.count_nonzero(diff > self.pixel_threshold)
+        cv2.accumulateWeighted(gray, self.background, self.alpha)
+        return changed / diff.size
+
+    def should_infer(self, frame, now, force=False):
+        """
+        True if the detector should run on this frame. `force` (e.g. live
+        tracks on screen) bypasses the gate but still updates the background.
+        """
+        with self.lock:
+            fraction = self.motion_fraction(frame)
+            self.last_fraction = float(fraction)
+            stale = self.last_inferred is None or now - self.last_inferred >= self.max_interval
+            run = bool(force or stale or fraction >= self.area_threshold)
+            if run:
+                self.inferred += 1
+                self.last_inferred = now
+            else:
+                self.gated += 1
+            return run
+
+    def stats(self):
+        with self.lock:
+            return {
+                'gated': self.gated,
+                'inferred': self.inferred,
+                'last_motion_fraction': round(self.last_fraction, 5),
+            }
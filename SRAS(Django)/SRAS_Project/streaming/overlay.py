@@ -0,0 +1,60 @@
+from collections import namedtuple
+
+import cv2
+
+# One rider as drawn on an inferred frame. `parts` are the helmet/plate boxes as
+# (x1, y1, x2, y2, color, label) relative to the rider box's top-left corner.
+OverlayItem = namedtuple('OverlayItem', ['track_id', 'box', 'color', 'label', 'parts'])
+
+
+def draw_rider(image, box, color, label, parts=()):
+    rx1, ry1, rx2, ry2 = box
+    cv2.rectangle(image, (rx1, ry1), (rx2, ry2), color, 2)
+    cv2.putText(image, label, (rx1, ry1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+    for cx1, cy1, cx2, cy2, part_color, part_label in parts:
+        cv2.rectangle(image, (rx1 + cx1, ry1 + cy1), (rx1 + cx2, ry1 + cy2), part_color, 2)
+        cv2.putText(image, part_label, (rx1 + cx1, ry1 + cy1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, part_color, 2)
+
+
+class TrackOverlay:
+    """
+    The boxes and labels from the latest inference for one camera, redrawn on
+    every captured frame so the display runs at camera rate while the
+    detector runs less often.
+
+    Between detector runs each rider box is moved to the tracker's Kalman
+    prediction for the frame's timestamp (its helmet/plate boxes move with
+    it); tracks that have ended are dropped, and once the overlay is older
+    than `max_age` seconds nothing is drawn rather than boxes that have
+    drifted off their riders.
+    """
+
+    def __init__(self, max_age=1.0, propagate=True):
+        self.max_age = max_age
+        self.propagate = propagate
+        self.state = ((), None)  # (items, timestamp), replaced whole so readers never see half an update
+
+    def update(self, items, timestamp):
+        self.state = (tuple(items), timestamp)
+
+    def render(self, frame, tracker, timestamp):
+        """`frame` with the overlay drawn on a copy, or `frame` itself when there is nothing to draw."""
+        items, drawn_at = self.state
+        if not items or drawn_at is None or timestamp - drawn_at > self.max_age:
+            return frame
+        positions = None
+        if self.propagate and timestamp > drawn_at:
+            ids, boxes, _ = tracker.predict(timestamp)
+            positions = dict(zip(ids, boxes))
+        image = frame.copy()
+        h, w = image.shape[:2]
+        for item in items:
+            box = item.box
+            if positions is not None:
+                if item.track_id not in positions:
+                    continue  # track ended since the detector last saw it
+                x1, y1, x2, y2 = positions[item.track_id]
+                box = (int(min(max(x1, 0), w - 1)), int(min(max(y1, 0), h - 1)),
+                       int(min(max(x2, 0), w - 1)), int(min(max(y2, 0), h - 1)))
+            draw_rider(image, box, item.color, item.label, item.parts)
+        return image
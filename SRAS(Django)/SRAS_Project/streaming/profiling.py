@@ -0,0 +1,143 @@
+"""
+On-demand diagnostics for a running stream process, behind the server's
+admin-only /debug/ endpoints:
+
+    ThreadProfiler   cProfile the pipeline threads for N seconds
+    MemoryTracker    tracemalloc snapshots, each diffed against the previous one
+"""
+import cProfile
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+
+SORT_KEYS = ('cumulative', 'tottime', 'ncalls', 'time')
+SNAPSHOT_KEYS = ('lineno', 'filename', 'traceback')
+
+
+class ProfileBusy(RuntimeError):
+    pass
+
+
+class _Window:
+    def __init__(self, seconds):
+        self.deadline = time.monotonic() + seconds
+        self.lock = threading.Lock()
+        self.profiles = {}    # thread name -> cProfile.Profile, while enabled
+        self.finished = []    # profiles disabled after the deadline
+        self.done = threading.Event()
+
+
+class ThreadProfiler:
+    """
+    cProfile only sees the thread that enabled it, so the profiled threads
+    call checkpoint() once per loop iteration: inside a window each enables
+    its own profiler, and after the deadline disables it and hands its stats
+    back. profile() waits for the window and merges every thread's stats.
+    Outside a window checkpoint() is a single attribute read.
+    """
+
+    def __init__(self):
+        self.window = None
+        self.lock = threading.Lock()
+
+    def checkpoint(self):
+        window = self.window
+        if window is None:
+            return
+        name = threading.current_thread().name
+        with window.lock:
+            profile = window.profiles.get(name)
+            if time.monotonic() < window.deadline:
+                if profile is None and not window.done.is_set():
+                    profile = window.profiles[name] = cProfile.Profile()
+                    profile.enable()
+            elif profile is not None:
+                profile.disable()
+                del window.profiles[name]
+                window.finished.append((name, profile))
+                if not window.profiles:
+                    window.done.set()
+
+    def profile(self, seconds, sort='cumulative', limit=40, grace=2.0):
+        """Profile the checkpointing threads for `seconds`; returns the pstats report as text."""
+        with self.lock:
+            if self.window is not None:
+                raise ProfileBusy('A profile is already running')
+            window = self.window = _Window(seconds)
+        try:
+            time.sleep(seconds)
+            # threads disable their own profiler at their next checkpoint
+            if window.profiles:
+                window.done.wait(grace)
+        finally:
+            with window.lock:
+                window.done.set()  # a thread that missed the grace period must not start a new profiler
+            self.window = None
+
+        with window.lock:
+            finished = list(window.finished)
+            stuck = sorted(window.profiles)
+        out = io.StringIO()
+        names = ', '.join(name for name, _ in finished) or 'none'
+        out.write(f"Profiled {seconds:g}s of thread(s): {names}\n")
+        if stuck:
+            out.write(f"Not included (busy past the window): {', '.join(stuck)}\n")
+        if not finished:
+            out.write("No pipeline thread ran during the window.\n")
+            return out.getvalue()
+        stats = pstats.Stats(finished[0][1], stream=out)
+        for _, profile in finished[1:]:
+            stats.add(profile)
+        stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+class MemoryTracker:
+    """
+    tracemalloc on demand. The first snapshot() starts tracing and keeps a
+    baseline; each later call reports the top allocation sites that grew (or
+    shrank) since the previous snapshot, so repeated calls hours apart show
+    where memory is accumulating.
+    """
+
+    def __init__(self):
+        self.previous = None
+        self.previous_at = None
+        self.lock = threading.Lock()
+
+    def snapshot(self, limit=25, key='lineno', frames=1, reset=False):
+        with self.lock:
+            if reset or not tracemalloc.is_tracing():
+                if tracemalloc.is_tracing():
+                    tracemalloc.stop()
+                tracemalloc.start(frames)
+                self.previous = tracemalloc.take_snapshot()
+                self.previous_at = time.monotonic()
+                return (f"tracemalloc started ({frames} frame(s) per trace); baseline taken. "
+                        "Call again later for the allocation diff.\n")
+
+            snapshot = tracemalloc.take_snapshot()
+            diff = snapshot.compare_to(self.previous, key)
+            elapsed = time.monotonic() - self.previous_at
+            current, peak = tracemalloc.get_traced_memory()
+            self.previous, self.previous_at = snapshot, time.monotonic()
+
+        out = io.StringIO()
+        out.write(f"Traced memory {current / 2**20:.1f} MiB (peak {peak / 2**20:.1f} MiB); "
+                  f"top {limit} changes over the last {elapsed:.0f}s by {key}:\n")
+        for stat in diff[:limit]:
+            out.write(f"{stat.size_diff / 1024:+10.1f} KiB {stat.count_diff:+8d} blocks  "
+                      f"({stat.size / 1024:.1f} KiB total)  {stat.traceback}\n")
+            if key == 'traceback':
+                for line in stat.traceback.format(most_recent_first=True):
+                    out.write(f"{'':12}{line.strip()}\n")
+        return out.getvalue()
+
+    def stop(self):
+        with self.lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            self.previous = self.previous_at = None
+        return "tracemalloc stopped\n"
@@ -0,0 +1,133 @@
+"""
+Post-training INT8 quantization of the exported YOLO models.
+
+Calibration tensors are built with the FP32 backend's own pre-processing, so
+the quantizer sees the same tensors the live pipeline would feed the model
+for those frames: whole detector frames for yolov8n, letterboxed rider crops
+for the helmet/plate model. How well that matches live traffic depends on the
+frames: recordings from the cameras do, stored violation snapshots (annotated,
+all "no helmet") only roughly. The detection head's box decoding (DFL softmax, anchor arithmetic,
+concat) is left in float; quantizing it costs far more accuracy than it
+saves time.
+"""
+import os
+import re
+import shutil
+
+import cv2
+
+from .backends import ONNX, OPENVINO, INT8, as_hw, exported_path
+from .detection import DETECTION_RESIZE, detect_riders, letterbox
+
+HEAD_OPS = ('Add', 'Sub', 'Mul', 'Div', 'Sigmoid', 'Softmax', 'Concat', 'Split', 'Reshape', 'Transpose', 'Slice')
+
+
+def detector_calibration(fp32_detector, frames, resize=DETECTION_RESIZE):
+    """One input tensor per frame, resized as detect_riders() does."""
+    hw = fp32_detector.fixed_hw or as_hw(fp32_detector.imgsz)
+    return [fp32_detector._preprocess(cv2.resize(frame, resize), hw)[0] for frame in frames]
+
+
+def helmet_calibration(fp32_detector, fp32_helmet, frames, crop_size, limit):
+    """Letterboxed rider crops, found with the FP32 detector, as helmet-model inputs."""
+    hw = fp32_helmet.fixed_hw or (crop_size, crop_size)
+    blobs = []
+    for frame in frames:
+        for x1, y1, x2, y2 in detect_riders(fp32_detector, frame):
+            crop = frame[y1:y2, x1:x2]
+            if crop.size == 0:
+                continue
+            blobs.append(fp32_helmet._preprocess(letterbox(crop, crop_size)[0], hw)[0])
+            if len(blobs) >= limit:
+                return blobs
+    return blobs
+
+
+def _head_prefix(names):
+    """'/model.22/' for yolov8n: the last numbered module is the Detect head."""
+    indices = [int(m.group(1)) for name in names for m in [re.search(r'/model\.(\d+)/', name)] if m]
+    return f"/model.{max(indices)}/" if indices else None
+
+
+def quantize_onnx(src, dst, blobs):
+    """Static QDQ quantization with ONNX Runtime; returns dst."""
+    try:
+        import onnx
+        from onnxruntime.quantization import (
+            CalibrationDataReader, QuantFormat, QuantType, quantize_static,
+        )
+    except ImportError as e:
+        raise ImportError("ONNX quantization needs onnxruntime and onnx (pip install onnxruntime onnx)") from e
+
+    model = onnx.load(src)
+    input_name = model.graph.input[0].name
+    head = _head_prefix(node.name for node in model.graph.node)
+    exclude = [node.name for node in model.graph.node
+               if head and node.name.startswith(head) and node.op_type in HEAD_OPS]
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.items = iter(blobs)
+
+        def get_next(self):
+            blob = next(self.items, None)
+            return None if blob is None else {input_name: blob}
+
+    quantize_static(
+        src, dst, Reader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+        nodes_to_exclude=exclude,
+    )
+    # keep the class names (and the rest of the export metadata) on the INT8 model
+    quantized = onnx.load(dst)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(model.metadata_props)
+    onnx.save(quantized, dst)
+    return dst
+
+
+def quantize_openvino(src_dir, dst_dir, blobs):
+    """NNCF post-training quantization of an OpenVINO IR directory; returns dst_dir."""
+    try:
+        import nncf
+        import openvino as ov
+    except ImportError as e:
+        raise ImportError("OpenVINO quantization needs openvino and nncf (pip install openvino nncf)") from e
+
+    xml = next(os.path.join(src_dir, f) for f in sorted(os.listdir(src_dir)) if f.endswith('.xml'))
+    model = ov.Core().read_model(xml)
+    head = _head_prefix(op.get_friendly_name() for op in model.get_ops())
+    ignored = nncf.IgnoredScope(
+        patterns=[f".*{re.escape(head)}.*({'|'.join(HEAD_OPS)})"] if head else [],
+        types=['Sigmoid', 'SoftMax'],
+        validate=False,
+    )
+    quantized = nncf.quantize(
+        model, nncf.Dataset(blobs),
+        preset=nncf.QuantizationPreset.MIXED,
+        subset_size=len(blobs),
+        ignored_scope=ignored,
+    )
+    os.makedirs(dst_dir, exist_ok=True)
+    ov.save_model(quantized, os.path.join(dst_dir, os.path.basename(xml)))
+    metadata = os.path.join(src_dir, 'metadata.yaml')
+    if os.path.exists(metadata):
+        shutil.copy(metadata, dst_dir)
+    return dst_dir
+
+
+def quantize(kind, weights, blobs):
+    """Quantize the exported FP32 model for `weights` into its INT8 path."""
+    src, dst = exported_path(weights, kind), exported_path(weights, kind, INT8)
+    if not os.path.exists(src):
+        raise FileNotFoundError(f"{src} not found; run `manage.py export_models` first")
+    if not blobs:
+        raise ValueError(f"No calibration data for {os.path.basename(weights)}")
+    if kind == ONNX:
+        return quantize_onnx(src, dst, blobs)
+    if kind == OPENVINO:
+        return quantize_openvino(src, dst, blobs)
+    raise ValueError(f"INT8 quantization is not supported for the '{kind}' backend")
@@ -0,0 +1,51 @@
+import cv2
+import numpy as np
+
+
+class RegionOfInterest:
+    """
+    Camera region of interest: a polygon in normalised (0..1) image coordinates,
+    as stored in Camera.roi_polygon, resolved lazily to pixels for a frame size.
+
+    bounding_rect() gives the detector crop; contains() tests box centres
+    against a pre-rendered mask, so the test costs one array lookup per box.
+    """
+
+    def __init__(self, polygon):
+        points = np.asarray(polygon or [], dtype=np.float32).reshape(-1, 2)
+        self.polygon = np.clip(points, 0.0, 1.0) if len(points) >= 3 else None
+        self.shape = None
+        self.rect = None
+        self.mask = None
+
+    @classmethod
+    def from_camera(cls, camera):
+        roi = cls(getattr(camera, 'roi_polygon', None))
+        return roi if roi.polygon is not None else None
+
+    def _resolve(self, shape):
+        h, w = shape[:2]
+        if self.shape == (h, w):
+            return
+        pts = np.rint(self.polygon * np.array([w - 1, h - 1], dtype=np.float32)).astype(np.int32)
+        x, y, bw, bh = cv2.boundingRect(pts)
+        self.rect = (x, y, min(w, x + bw), min(h, y + bh))
+        self.mask = np.zeros((h, w), dtype=np.uint8)
+        cv2.fillPoly(self.mask, [pts], 1)
+        self.shape = (h, w)
+
+    def bounding_rect(self, shape):
+        """(x1, y1, x2, y2) pixel rectangle enclosing the polygon for a frame of `shape`."""
+        self._resolve(shape)
+        return self.rect
+
+    def contains(self, boxes, shape):
+        """Boolean array: is the centre of each (x1, y1, x2, y2) box inside the polygon?"""
+        self._resolve(shape)
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        if len(boxes) == 0:
+            return np.zeros(0, dtype=bool)
+        h, w = self.shape
+        cx = np.clip(((boxes[:, 0] + boxes[:, 2]) / 2).astype(np.int64), 0, w - 1)
+        cy = np.clip(((boxes[:, 1] + boxes[:, 3]) / 2).astype(np.int64), 0, h - 1)
+        return self.mask[cy, cx].astype(bool)
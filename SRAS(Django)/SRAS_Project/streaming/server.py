@@ -0,0 +1,210 @@
+import asyncio
+import hmac
+import json
+from functools import partial
+from urllib.parse import parse_qs
+
+from .metrics import render_prometheus
+from .profiling import SNAPSHOT_KEYS, SORT_KEYS, ProfileBusy
+
+MAX_PROFILE_SECONDS = 60
+
+
+STREAM_HEADERS = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: multipart/x-mixed-replace; boundary=frame\r\n"
+    b"Cache-Control: no-cache, no-store, must-revalidate\r\n"
+    b"Pragma: no-cache\r\n"
+    b"Expires: 0\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+)
+
+
+class MJPEGServer:
+    """
+    asyncio MJPEG server: every viewer is a coroutine on one event loop instead
+    of a thread, so hundreds of connections cost little more than their sockets.
+
+    Besides /video[/<camera_id>] it serves /metrics (Prometheus text) and
+    /status (JSON) from StreamEngine.status(). With an `admin_token` it also
+    serves /debug/profile and /debug/memory to requests that send the token
+    (Authorization: Bearer <token> or X-Admin-Token: <token>).
+    """
+
+    def __init__(self, engine, host='0.0.0.0', port=8081, keepalive=2.0, write_timeout=5.0, frame_interval=1 / 30,
+                 admin_token=''):
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.keepalive = keepalive              # resend the last frame after this many idle seconds (0 = never)
+        self.write_timeout = write_timeout      # seconds a viewer may stall before it is dropped
+        self.frame_interval = frame_interval
+        self.viewers = 0
+        self.camera_viewers = {}  # camera_id -> connected viewers
+        self.admin_token = admin_token  # '' = /debug/ endpoints disabled
+
+    async def send_error(self, writer, code, reason):
+        body = f"{code} {reason}\n".encode()
+        writer.write(
+            f"HTTP/1.1 {code} {reason}\r\nContent-Type: text/plain\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+    def is_admin(self, headers):
+        if not self.admin_token:
+            return False
+        token = headers.get('x-admin-token', '')
+        scheme, _, bearer = headers.get('authorization', '').partition(' ')
+        if scheme.lower() == 'bearer':
+            token = bearer.strip()
+        return hmac.compare_digest(token.encode(), self.admin_token.encode())
+
+    async def handle_debug(self, writer, path, query, headers):
+        """/debug/profile?seconds=&sort=&limit= and /debug/memory?limit=&key=&frames=&reset=1&stop=1"""
+        if not self.admin_token:
+            await self.send_error(writer, 404, "Not Found")
+            return
+        if not self.is_admin(headers):
+            await self.send_error(writer, 403, "Forbidden")
+            return
+
+        params = {name: values[-1] for name, values in parse_qs(query).items()}
+        try:
+            limit = int(params.get('limit', 40 if path == '/debug/profile' else 25))
+            if path == '/debug/profile':
+                seconds = float(params.get('seconds', 10))
+                sort = params.get('sort', 'cumulative')
+                if not 0 < seconds <= MAX_PROFILE_SECONDS or sort not in SORT_KEYS:
+                    raise ValueError
+                job = partial(self.engine.profile, seconds, sort=sort, limit=limit)
+            elif path == '/debug/memory':
+                key = params.get('key', 'lineno')
+                frames = int(params.get('frames', 10 if key == 'traceback' else 1))
+                if key not in SNAPSHOT_KEYS or frames < 1:
+                    raise ValueError
+                job = partial(self.engine.memory_report, limit=limit, key=key, frames=frames,
+                              reset=params.get('reset') == '1', stop=params.get('stop') == '1')
+            else:
+                await self.send_error(writer, 404, "Not Found")
+                return
+        except ValueError:
+            await self.send_error(writer, 400, "Bad Request")
+            return
+
+        # both block (a profile for its whole window), so they run off the event loop
+        try:
+            body = await asyncio.get_running_loop().run_in_executor(None, job)
+        except ProfileBusy:
+            await self.send_error(writer, 409, "Conflict")
+            return
+        await self.send_body(writer, 'text/plain; charset=utf-8', body.encode())
+
+    async def send_body(self, writer, content_type, body):
+        writer.write(
+            f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\nCache-Control: no-cache\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await asyncio.wait_for(writer.drain(), timeout=self.write_timeout)
+
+    def status(self):
+        status = self.engine.status()
+        for camera in status['cameras']:
+            camera['viewers'] = self.camera_viewers.get(camera['id'], 0)
+        status['viewers'] = self.viewers
+        return status
+
+    async def handle_client(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=self.write_timeout)
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=self.write_timeout)
+                if not line or line in (b"\r\n", b"\n"):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            parts = request_line.decode('latin-1').split()
+            if len(parts) < 2 or parts[0] != 'GET':
+                await self.send_error(writer, 405, "Method Not Allowed")
+                return
+
+            path, _, query = parts[1].partition('?')
+            if path.startswith('/debug/'):
+                await self.handle_debug(writer, path, query, headers)
+                return
+            if path in ('/metrics', '/status'):
+                # percentiles and counters are gathered off the event loop
+                status = await asyncio.get_running_loop().run_in_executor(None, self.status)
+                if path == '/metrics':
+                    body = render_prometheus(status, self.engine.timer).encode()
+                    await self.send_body(writer, 'text/plain; version=0.0.4; charset=utf-8', body)
+                else:
+                    await self.send_body(writer, 'application/json', json.dumps(status, indent=2).encode())
+                return
+
+            stream = self.engine.resolve_stream(parts[1])
+            if stream is None:
+                await self.send_error(writer, 404, "Not Found")
+                return
+
+            await self.stream_video(stream, writer)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            print(f"Stream error: {e}")
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def stream_video(self, stream, writer):
+        loop = asyncio.get_running_loop()
+        broadcaster = stream.broadcaster
+        if broadcaster.loop is not loop:
+            broadcaster.attach_loop(loop)  # stream created by an engine restart after serve() began
+        writer.write(STREAM_HEADERS)
+        await asyncio.wait_for(writer.drain(), timeout=self.write_timeout)
+
+        self.viewers += 1
+        self.camera_viewers[stream.camera_id] = self.camera_viewers.get(stream.camera_id, 0) + 1
+        last_seq = -1
+        try:
+            while not self.engine.stop_event.is_set():
+                if last_seq >= 0:
+                    # sleep until inference publishes a new frame; resend the old one
+                    # only after `keepalive` idle seconds so proxies keep the socket
+                    has_new = await broadcaster.wait_async(last_seq, timeout=self.keepalive or 1.0)
+                    if not has_new and not self.keepalive:
+                        continue
+
+                # only the first viewer of a new frame pays for the encode, off the event loop
+                seq, jpeg = broadcaster.peek() or await loop.run_in_executor(None, broadcaster.latest)
+                if jpeg is None:
+                    await asyncio.sleep(self.frame_interval)
+                    continue
+                writer.write(
+                    b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: "
+                    + str(len(jpeg)).encode() + b"\r\n\r\n" + jpeg + b"\r\n"
+                )
+                # a stalled or vanished viewer is dropped instead of piling up buffers
+                await asyncio.wait_for(writer.drain(), timeout=self.write_timeout)
+                last_seq = seq
+        finally:
+            self.viewers -= 1
+            self.camera_viewers[stream.camera_id] -= 1
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        for camera_stream in self.engine.streams:
+            camera_stream.broadcaster.attach_loop(loop)
+        server = await asyncio.start_server(self.handle_client, self.host, self.port, reuse_address=True)
+        async with server:
+            await server.serve_forever()
+
+    def serve_forever(self):
+        asyncio.run(self.serve())
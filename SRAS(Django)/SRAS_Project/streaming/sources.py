@@ -0,0 +1,276 @@
+"""
+Frame sources for StreamEngine. A source is anything with
+
+    grab()      -> bool           advance to the next frame without converting it
+    retrieve()  -> (ok, frame)    BGR image of the last grabbed frame
+    read()      -> (ok, frame)    grab() + retrieve()
+    is_opened() -> bool
+    release()
+    counters    CaptureCounters (grabbed / decoded / dropped)
+
+and is created per camera by the engine's source factory, so tests and
+benchmarks can swap the RTSP camera for a file or a synthetic feed.
+
+Capture loops call read_when_due(): frames are grabbed as they arrive but only
+retrieved when the consumer wants the next one, so frames that would be
+dropped anyway are never converted to BGR.
+"""
+import time
+from collections import namedtuple
+from functools import partial
+
+import cv2
+import numpy as np
+
+from .metrics import NULL_TIMER
+
+OPENCV = 'opencv'
+PYAV = 'pyav'
+CAPTURE_BACKENDS = (OPENCV, PYAV)
+
+# What a source factory is given: picklable, so factories also work in capture processes
+CameraInfo = namedtuple('CameraInfo', ['id', 'name', 'stream_url'])
+
+
+class CaptureCounters:
+    """Frames grabbed from the feed, decoded to BGR for the pipeline, and dropped undecoded."""
+
+    __slots__ = ('grabbed', 'decoded', 'dropped', 'degraded')
+
+    def __init__(self):
+        self.grabbed = 0
+        self.decoded = 0
+        self.dropped = 0
+        self.degraded = False  # PyAVSource is decoding keyframes only
+
+    def as_dict(self):
+        return {'grabbed': self.grabbed, 'decoded': self.decoded, 'dropped': self.dropped,
+                'degraded': self.degraded}
+
+
+def open_source(camera):
+    """Default source factory: the camera's stream URL through OpenCV."""
+    return OpenCVSource(camera.stream_url)
+
+
+def pyav_source(camera, threads=0, max_lag=1.0):
+    """Source factory for PyAVSource (use functools.partial to set threads/max_lag)."""
+    return PyAVSource(camera.stream_url, threads=threads, max_lag=max_lag)
+
+
+def stub_source(camera, fps=30):
+    """Source factory for StubSource (use functools.partial to set fps)."""
+    return StubSource(fps=fps)
+
+
+def source_factory_for(kind, threads=0, max_lag=1.0):
+    """The source factory for a CAPTURE_BACKEND name."""
+    if kind == OPENCV:
+        return open_source
+    if kind == PYAV:
+        return partial(pyav_source, threads=threads, max_lag=max_lag)
+    raise ValueError(f"Unknown capture backend '{kind}' (expected one of {', '.join(CAPTURE_BACKENDS)})")
+
+
+def read_when_due(source, last_at, interval, timer=NULL_TIMER):
+    """
+    grab() frames until the next one is due, `interval` seconds after the
+    monotonic time `last_at` (less a quarter interval of slack for arrival
+    jitter), then retrieve() it. Frames grabbed before then are counted as
+    dropped and never converted. Returns (ok, frame) like read(); the
+    retrieve() is timed as the 'capture' stage.
+    """
+    due_at = last_at + interval * 0.75
+    while True:
+        if not source.grab():
+            return False, None
+        if time.monotonic() >= due_at:
+            with timer.stage('capture'):
+                return source.retrieve()
+        source.counters.dropped += 1
+
+
+class OpenCVSource:
+    """
+    A camera URL or video file through cv2.VideoCapture. grab() demuxes and
+    decodes into the backend's own buffer; retrieve() does the colour
+    conversion and copy into a BGR array.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.cap = cv2.VideoCapture(url)
+        self.counters = CaptureCounters()
+
+    def is_opened(self):
+        return self.cap.isOpened()
+
+    def grab(self):
+        ok = self.cap.grab()
+        if ok:
+            self.counters.grabbed += 1
+        return ok
+
+    def retrieve(self):
+        ok, frame = self.cap.retrieve()
+        if ok:
+            self.counters.decoded += 1
+        return ok, frame
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def release(self):
+        self.cap.release()
+
+
+class PyAVSource:
+    """
+    A camera URL or video file through PyAV (FFmpeg) with threaded decoding.
+
+    When decoding falls more than `max_lag` seconds behind the stream (the
+    frames' presentation times against the wall clock), the source degrades
+    to keyframes only: other packets are dropped before they reach the
+    decoder. It returns to full decoding at the first keyframe after it has
+    caught up.
+    """
+
+    def __init__(self, url, threads=0, max_lag=1.0):
+        try:
+            import av
+        except ImportError as e:
+            raise ImportError("The PyAV capture backend needs av (pip install av)") from e
+        self.url = url
+        self.max_lag = max_lag
+        self.counters = CaptureCounters()
+        self.frame = None
+        self.clock = None  # (wall time, stream time) of the first frame
+        try:
+            options = {'rtsp_transport': 'tcp'} if url.startswith('rtsp') else {}
+            self.container = av.open(url, options=options, timeout=10.0)
+            self.stream = self.container.streams.video[0]
+        except Exception as e:
+            print(f"PyAV could not open {url}: {e}")
+            self.container = self.stream = None
+            return
+        self.stream.thread_type = 'AUTO'  # frame + slice threads
+        self.stream.codec_context.thread_count = threads
+        self.packets = self.container.demux(self.stream)
+        self.pending = []  # decoded frames not yet grabbed (a packet may yield several)
+
+    def is_opened(self):
+        return self.container is not None
+
+    def lag(self, stream_time):
+        now = time.monotonic()
+        if self.clock is None:
+            self.clock = (now, stream_time)
+            return 0.0
+        return (now - self.clock[0]) - (stream_time - self.clock[1])
+
+    def grab(self):
+        if self.container is None:
+            return False
+        while not self.pending:
+            try:
+                packet = next(self.packets)
+            except Exception:
+                return False  # end of stream or a network error; the capture loop reconnects
+            if packet.size == 0:
+                continue  # flush packet
+            if packet.pts is not None and packet.time_base is not None:
+                lag = self.lag(float(packet.pts * packet.time_base))
+                if not self.counters.degraded and lag > self.max_lag:
+                    print(f"⚠️ Decoding {lag:.1f}s behind {self.url}; keyframes only until it catches up")
+                    self.counters.degraded = True
+                elif self.counters.degraded and packet.is_keyframe and lag < self.max_lag / 4:
+                    self.counters.degraded = False
+            if self.counters.degraded and not packet.is_keyframe:
+                self.counters.grabbed += 1
+                self.counters.dropped += 1
+                continue
+            try:
+                self.pending = list(packet.decode())
+            except Exception:
+                continue  # corrupt packet; the next keyframe resyncs the decoder
+        self.frame = self.pending.pop(0)
+        self.counters.grabbed += 1
+        return True
+
+    def retrieve(self):
+        if self.frame is None:
+            return False, None
+        self.counters.decoded += 1
+        return True, self.frame.to_ndarray(format='bgr24')
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def release(self):
+        if self.container is not None:
+            self.container.close()
+            self.container = None
+
+
+class StubSource:
+    """
+    Synthetic camera for tests and demos: replays `frames` (or, by default, a
+    grey frame with a block sweeping across it) at `fps`. With realtime=False
+    frames are returned as fast as they are read.
+    """
+
+    def __init__(self, frames=None, size=(1280, 720), fps=30, loop=True, realtime=True):
+        self.frames = frames
+        self.size = size
+        self.interval = 1.0 / fps if fps else 0.0
+        self.loop = loop
+        self.realtime = realtime
+        self.index = 0
+        self.next_at = time.monotonic()
+        self.closed = False
+        self.counters = CaptureCounters()
+
+    def is_opened(self):
+        return not self.closed
+
+    def _synthetic(self, i):
+        w, h = self.size
+        frame = np.full((h, w, 3), 90, dtype=np.uint8)
+        x = int((i * 8) % max(1, w - w // 8))
+        cv2.rectangle(frame, (x, h // 3), (x + w // 8, h // 3 + h // 2), (40, 40, 200), -1)
+        return frame
+
+    def grab(self):
+        if self.closed:
+            return False
+        if self.frames is not None and self.index >= len(self.frames):
+            if not self.loop:
+                return False
+            self.index = 0
+        if self.realtime and self.interval:
+            delay = self.next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_at = max(self.next_at + self.interval, time.monotonic() - self.interval)
+        self.index += 1
+        self.counters.grabbed += 1
+        return True
+
+    def retrieve(self):
+        if self.closed or self.index == 0:
+            return False, None
+        i = self.index - 1
+        self.counters.decoded += 1
+        return True, self.frames[i].copy() if self.frames is not None else self._synthetic(i)
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def release(self):
+        self.closed = True
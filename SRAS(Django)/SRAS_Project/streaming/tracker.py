@@ -0,0 +1,221 @@
+import threading
+
+import numpy as np
+
+from streaming.detection import iou_matrix, greedy_assignment
+
+
+# Track lifecycle states
+TENTATIVE = 0   # seen fewer than min_hits times, dropped on its first miss
+CONFIRMED = 1   # matched on this update
+LOST = 2        # confirmed track missed on this update, kept alive until max_age
+
+# Kalman noise as a fraction of box height (DeepSORT weights), per REF_DT of motion
+STD_WEIGHT_POSITION = 1.0 / 20
+STD_WEIGHT_VELOCITY = 1.0 / 160
+REF_DT = 0.1  # seconds; the noise weights above are tuned for ~10 Hz updates
+
+_H = np.hstack([np.eye(4), np.zeros((4, 4))])  # measure (cx, cy, w, h) out of the 8-d state
+
+
+def xyxy_to_cxcywh(boxes):
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    wh = boxes[:, 2:] - boxes[:, :2]
+    return np.concatenate([boxes[:, :2] + wh / 2, wh], axis=1)
+
+
+def cxcywh_to_xyxy(boxes):
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    half = boxes[:, 2:] / 2
+    return np.concatenate([boxes[:, :2] - half, boxes[:, :2] + half], axis=1)
+
+
+class RiderTracker:
+    """
+    SORT/ByteTrack-style multi-object tracker for rider boxes.
+
+    Every track carries a constant-velocity Kalman filter over (cx, cy, w, h)
+    with velocities in pixels per second, so prediction works on real frame
+    timestamps even when inference skips frames. Association is an IoU matrix
+    between predicted and detected boxes, solved one-to-one, first for
+    confirmed/lost tracks and then for tentative ones.
+
+    Track state is stored column-wise in NumPy arrays (one row per live track),
+    so predicting all tracks is a couple of batched matrix products.
+    """
+
+    def __init__(self, iou_threshold=0.3, min_hits=2, max_age=1.5):
+        self.iou_threshold = iou_threshold
+        self.min_hits = min_hits
+        self.max_age = max_age  # seconds a track may go unmatched before removal
+        self.lock = threading.Lock()
+        self.next_id = 1
+        self.ended = []         # track ids removed since the last pop_ended()
+
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.mean = np.zeros((0, 8))
+        self.cov = np.zeros((0, 8, 8))
+        self.state = np.zeros(0, dtype=np.int8)
+        self.hits = np.zeros(0, dtype=np.int32)
+        self.first_time = np.zeros(0)
+        self.last_time = np.zeros(0)   # last matched detection
+        self.pred_time = np.zeros(0)   # time the mean/cov currently describe
+
+    def __len__(self):
+        return len(self.ids)
+
+    # --- Kalman filter -------------------------------------------------
+
+    def _predict(self, timestamp):
+        """Advance every track to `timestamp` in place."""
+        if len(self.ids) == 0:
+            return
+        dt = np.clip(timestamp - self.pred_time, 0.0, None)
+        n = len(dt)
+        F = np.tile(np.eye(8), (n, 1, 1))
+        F[:, 0, 4] = F[:, 1, 5] = F[:, 2, 6] = F[:, 3, 7] = dt
+        h = self.mean[:, 3]
+        k = dt / REF_DT
+        std_pos = STD_WEIGHT_POSITION * h
+        std_vel = STD_WEIGHT_VELOCITY * h / REF_DT
+        q = np.stack([std_pos, std_pos, std_pos, std_pos, std_vel, std_vel, std_vel, std_vel], axis=1) ** 2
+        Q = q[:, :, None] * np.eye(8)[None] * k[:, None, None]
+        self.mean = np.einsum('nij,nj->ni', F, self.mean)
+        self.cov = F @ self.cov @ F.transpose(0, 2, 1) + Q
+        self.pred_time = np.maximum(self.pred_time, timestamp)
+
+    def _update(self, rows, measurements):
+        """Kalman correction for the tracks at `rows` with (K, 4) cxcywh measurements."""
+        mean, cov = self.mean[rows], self.cov[rows]
+        std = STD_WEIGHT_POSITION * mean[:, 3]
+        R = (std ** 2)[:, None, None] * np.eye(4)[None]
+        S = cov[:, :4, :4] + R
+        gain = cov[:, :, :4] @ np.linalg.inv(S)
+        innovation = measurements - mean[:, :4]
+        self.mean[rows] = mean + np.einsum('nij,nj->ni', gain, innovation)
+        self.cov[rows] = cov - gain @ cov[:, :4, :]
+
+    def _spawn(self, measurements, timestamp):
+        n = len(measurements)
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+        new_ids = np.arange(self.next_id, self.next_id + n, dtype=np.int64)
+        self.next_id += n
+        mean = np.hstack([measurements, np.zeros((n, 4))])
+        h = measurements[:, 3]
+        std = np.stack([
+            2 * STD_WEIGHT_POSITION * h, 2 * STD_WEIGHT_POSITION * h,
+            2 * STD_WEIGHT_POSITION * h, 2 * STD_WEIGHT_POSITION * h,
+            10 * STD_WEIGHT_VELOCITY * h / REF_DT, 10 * STD_WEIGHT_VELOCITY * h / REF_DT,
+            10 * STD_WEIGHT_VELOCITY * h / REF_DT, 10 * STD_WEIGHT_VELOCITY * h / REF_DT,
+        ], axis=1)
+        cov = (std ** 2)[:, :, None] * np.eye(8)[None]
+        self.ids = np.concatenate([self.ids, new_ids])
+        self.mean = np.concatenate([self.mean, mean])
+        self.cov = np.concatenate([self.cov, cov])
+        initial_state = CONFIRMED if self.min_hits <= 1 else TENTATIVE
+        self.state = np.concatenate([self.state, np.full(n, initial_state, dtype=np.int8)])
+        self.hits = np.concatenate([self.hits, np.ones(n, dtype=np.int32)])
+        self.first_time = np.concatenate([self.first_time, np.full(n, timestamp)])
+        self.last_time = np.concatenate([self.last_time, np.full(n, timestamp)])
+        self.pred_time = np.concatenate([self.pred_time, np.full(n, timestamp)])
+        return new_ids
+
+    def _keep(self, mask):
+        removed = self.ids[~mask]
+        if len(removed):
+            self.ended.extend(removed.tolist())
+        for name in ('ids', 'mean', 'cov', 'state', 'hits', 'first_time', 'last_time', 'pred_time'):
+            setattr(self, name, getattr(self, name)[mask])
+
+    # --- public API ----------------------------------------------------
+
+    def update(self, boxes, timestamp):
+        """
+        Feed one frame of rider boxes (x1, y1, x2, y2) taken at `timestamp`
+        (seconds, monotonic). Returns the track id for each box, in order.
+        """
+        with self.lock:
+            boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+            self._predict(timestamp)
+            track_ids = np.zeros(len(boxes), dtype=np.int64)
+            unmatched_dets = np.arange(len(boxes))
+            matched_rows = []
+
+            if len(self.ids) and len(boxes):
+                predicted = cxcywh_to_xyxy(self.mean[:, :4])
+                scores = iou_matrix(predicted, boxes)
+                # established tracks get first pick, tentative ones take what is left
+                for group in (self.state != TENTATIVE, self.state == TENTATIVE):
+                    rows = np.nonzero(group)[0]
+                    if len(rows) == 0 or len(unmatched_dets) == 0:
+                        continue
+                    sub = scores[np.ix_(rows, unmatched_dets)]
+                    pairs = greedy_assignment(sub, self.iou_threshold)
+                    used = set()
+                    for r, c in pairs:
+                        det = unmatched_dets[c]
+                        matched_rows.append((rows[r], det))
+                        used.add(c)
+                    unmatched_dets = np.array(
+                        [d for i, d in enumerate(unmatched_dets) if i not in used], dtype=np.int64
+                    )
+
+            matched = np.zeros(len(self.ids), dtype=bool)
+            if matched_rows:
+                rows = np.array([r for r, _ in matched_rows])
+                dets = np.array([d for _, d in matched_rows])
+                self._update(rows, xyxy_to_cxcywh(boxes[dets]))
+                matched[rows] = True
+                self.hits[rows] += 1
+                self.last_time[rows] = timestamp
+                track_ids[dets] = self.ids[rows]
+
+            # lifecycle
+            confirmed = matched & (self.hits >= self.min_hits)
+            self.state[confirmed] = CONFIRMED
+            self.state[~matched & (self.state == CONFIRMED)] = LOST
+            keep = matched | (
+                (self.state != TENTATIVE) & (timestamp - self.last_time <= self.max_age)
+            )
+            self._keep(keep)
+
+            track_ids[unmatched_dets] = self._spawn(xyxy_to_cxcywh(boxes[unmatched_dets]), timestamp)
+            return track_ids.tolist()
+
+    def predict(self, timestamp):
+        """
+        Predicted boxes for every live track at `timestamp` without changing
+        tracker state. Returns (ids, (N, 4) xyxy boxes, states).
+        """
+        with self.lock:
+            if len(self.ids) == 0:
+                return [], np.zeros((0, 4)), np.zeros(0, dtype=np.int8)
+            dt = np.clip(timestamp - self.pred_time, 0.0, None)
+            centre = self.mean[:, :4] + self.mean[:, 4:] * dt[:, None]
+            return self.ids.tolist(), cxcywh_to_xyxy(centre), self.state.copy()
+
+    def velocity(self, track_id):
+        """(vx, vy) of the track centre in pixels per second, or None if unknown."""
+        with self.lock:
+            rows = np.nonzero(self.ids == track_id)[0]
+            if len(rows) == 0 or self.hits[rows[0]] < 2:
+                return None
+            vx, vy = self.mean[rows[0], 4:6]
+            return float(vx), float(vy)
+
+    def speed_kph(self, track_id, pixels_per_meter):
+        v = self.velocity(track_id)
+        if v is None or pixels_per_meter <= 0:
+            return 0.0
+        return float(np.hypot(*v)) / pixels_per_meter * 3.6
+
+    def is_live(self, track_id):
+        with self.lock:
+            return bool(np.any(self.ids == track_id))
+
+    def pop_ended(self):
+        """Return and clear the ids of tracks removed since the last call."""
+        with self.lock:
+            ended, self.ended = self.ended, []
+            return ended
@@ -0,0 +1,223 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db import transaction, close_old_connections
+from django.db.utils import OperationalError, InterfaceError
+from django.utils import timezone
+
+from SRAS_App.models import Violation
+from .metrics import NULL_TIMER
+
+
+# One pending violation produced by the inference thread. captured_at is the
+# pipeline timestamp of the evidence frame and occurred_at its wall-clock time
+# (None = when written); source_* only for recorded video.
+ViolationRecord = namedtuple(
+    'ViolationRecord',
+    ['camera', 'image', 'plate_number', 'plate_image', 'rider_hash', 'rider_phash', 'detected_at',
+     'captured_at', 'occurred_at', 'source_file', 'source_frame'],
+    defaults=(None, None, None, None),
+)
+
+# Errors worth retrying (lost MySQL connection, lock wait timeout, deadlock, ...)
+TRANSIENT_DB_ERRORS = (OperationalError, InterfaceError)
+
+
+class ViolationWriter:
+    """
+    Persistence stage for violations.
+
+    The inference thread calls submit() and returns immediately; a background
+    thread drains the queue, drops records whose rider_hash was already stored
+    within `duplicate_window` seconds, and writes the rest with one bulk_create
+    per batch inside a single transaction. Transient DB errors are retried with
+    exponential backoff so a slow or restarting MySQL never stalls detection.
+    """
+
+    def __init__(self, batch_size=20, flush_interval=0.5, max_queue=500,
+                 max_retries=5, retry_backoff=0.5, duplicate_window=300, timer=NULL_TIMER):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.duplicate_window = duplicate_window
+        self.timer = timer  # gets the 'db_save' time of each successful batch
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.stats_lock = threading.Lock()
+
+        # counters
+        self.submitted = 0
+        self.written = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_write_latency = 0.0   # seconds spent in the last DB write
+        self.avg_write_latency = 0.0    # EWMA of DB write time
+        self.last_end_to_end = 0.0      # detection -> committed, last batch
+
+    def start(self):
+        """Start (or, after stop(), restart) the writer thread; records still queued are written."""
+        self.stop_event.clear()
+        if self.thread is not None and self.thread.is_alive():
+            return  # stop() timed out while flushing; the old thread carries on
+        self.thread = threading.Thread(target=self.run, name="violation-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop accepting work and flush whatever is still queued."""
+        self.stop_event.set()
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout=timeout)
+
+    def submit(self, record):
+        """Queue a ViolationRecord without blocking. Returns False if the queue is full."""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.stats_lock:
+                self.dropped += 1
+            print("❌ Violation writer queue full, dropping violation")
+            return False
+        with self.stats_lock:
+            self.submitted += 1
+        return True
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'submitted': self.submitted,
+                'written': self.written,
+                'duplicates': self.duplicates,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'batches': self.batches,
+                'last_write_latency_ms': round(self.last_write_latency * 1000, 2),
+                'avg_write_latency_ms': round(self.avg_write_latency * 1000, 2),
+                'last_end_to_end_ms': round(self.last_end_to_end * 1000, 2),
+            }
+
+    def next_batch(self):
+        """Block for the first record, then collect more until batch_size or flush_interval."""
+        try:
+            batch = [self.queue.get(timeout=0.2)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while not (self.stop_event.is_set() and self.queue.empty()):
+            batch = self.next_batch()
+            if batch:
+                self.write_batch(batch)
+        close_old_connections()
+
+    def filter_duplicates(self, batch):
+        """Drop records already stored (or repeated inside this batch) for the same rider_hash."""
+        hashes = {r.rider_hash for r in batch if r.rider_hash}
+        existing = set()
+        if hashes:
+            cutoff = timezone.now() - timedelta(seconds=self.duplicate_window)
+            existing = set(
+                Violation.objects.filter(rider_hash__in=hashes, timestamp__gte=cutoff)
+                .values_list('rider_hash', flat=True)
+            )
+        fresh, seen = [], set()
+        for record in batch:
+            if record.rider_hash:
+                if record.rider_hash in existing:
+                    print(f"⚠️ Duplicate (database): {record.rider_hash[:8]}...")
+                    continue
+                if record.rider_hash in seen:
+                    continue
+                seen.add(record.rider_hash)
+            fresh.append(record)
+        return fresh
+
+    def write_batch(self, batch):
+        for attempt in range(1, self.max_retries + 1):
+            started = time.monotonic()
+            try:
+                with transaction.atomic():
+                    fresh = self.filter_duplicates(batch)
+                    now = timezone.now()
+                    Violation.objects.bulk_create([
+                        Violation(
+                            camera=r.camera,
+                            timestamp=r.occurred_at or now,
+                            plate_number=r.plate_number,
+                            image=r.image,
+                            plate_image=r.plate_image,
+                            rider_hash=r.rider_hash,
+                            rider_phash=r.rider_phash,
+                            source_file=r.source_file,
+                            source_frame=r.source_frame,
+                        )
+                        for r in fresh
+                    ])
+                elapsed = time.monotonic() - started
+                self.timer.record('db_save', elapsed)
+                with self.stats_lock:
+                    self.written += len(fresh)
+                    self.duplicates += len(batch) - len(fresh)
+                    self.batches += 1
+                    self.last_write_latency = elapsed
+                    self.avg_write_latency = (
+                        elapsed if self.batches == 1 else 0.8 * self.avg_write_latency + 0.2 * elapsed
+                    )
+                    self.last_end_to_end = time.monotonic() - min(r.detected_at for r in batch)
+                if fresh:
+                    print(f"✅ Saved {len(fresh)} violation(s) in {elapsed * 1000:.0f} ms")
+                return True
+            except TRANSIENT_DB_ERRORS as e:
+                # drop the broken connection so the next attempt reconnects
+                close_old_connections()
+                delay = self.retry_backoff * (2 ** (attempt - 1))
+                print(f"⚠️ DB error writing violations (attempt {attempt}/{self.max_retries}): {e}; retrying in {delay:.1f}s")
+                time.sleep(delay)
+            except Exception as e:
+                print(f"❌ Error saving violations to database: {e}")
+                break
+
+        with self.stats_lock:
+            self.failed += len(batch)
+        print(f"❌ Gave up on {len(batch)} violation(s)")
+        return False
+
+
+class MemoryWriter:
+    """ViolationWriter stand-in that keeps records in a list (stub engines, tests)."""
+
+    def __init__(self):
+        self.records = []
+        self.lock = threading.Lock()
+
+    def start(self):
+        pass
+
+    def stop(self, timeout=None):
+        pass
+
+    def submit(self, record):
+        with self.lock:
+            self.records.append(record)
+        return True
+
+    def stats(self):
+        with self.lock:
+            return {'queue_depth': 0, 'submitted': len(self.records), 'written': len(self.records)}